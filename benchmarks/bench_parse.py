@@ -0,0 +1,61 @@
+"""
+详情页解析后端的性能对比
+
+    python -m benchmarks.bench_parse [--repeat 50] [页面.html ...]
+
+默认使用 tests/fixtures 下的合成详情页（按豆瓣详情页结构构造，填充内容是生成的，不是抓取的原始页面），
+输出每个后端每页的平均解析时间和峰值内存，并检查各后端的解析结果与 soup 后端一致。
+合成页面上的耗时只能作为参考，真实页面的结构和体积不同，需要时可以传入自己保存的页面再比较。
+注意 tracemalloc 只统计 Python 层的分配，lxml 在 C 层使用的内存不计入峰值。
+"""
+import os
+import glob
+import time
+import logging
+import argparse
+import tracemalloc
+from douban.html_parser import available_backends, parse_book_detail, parse_movie_detail
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+
+
+def parse_function(path):
+    return parse_book_detail if os.path.basename(path).startswith("book") else parse_movie_detail
+
+
+def measure(parse, html, backend, repeat):
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        parse(html, backend)
+    elapsed = (time.perf_counter() - begin) / repeat
+
+    tracemalloc.start()
+    result = parse(html, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main(args):
+    logging.disable(logging.WARNING)
+    pages = args.pages or sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html")))
+    backends = available_backends()
+    if not args.pages:
+        print(f"使用 {FIXTURE_DIR} 下的合成页面，耗时只能作为参考")
+    print(f"{'page':<24}{'size':>10}  {'backend':<10}{'ms/page':>10}{'peak KiB':>12}{'speedup':>10}  same")
+    for path in pages:
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        parse = parse_function(path)
+        baseline_time, _, baseline = measure(parse, html, "soup", args.repeat)
+        for backend in backends:
+            elapsed, peak, result = measure(parse, html, backend, args.repeat)
+            print(f"{os.path.basename(path):<24}{len(html.encode()):>10}  {backend:<10}"
+                  f"{elapsed * 1000:>10.2f}{peak / 1024:>12.0f}{baseline_time / elapsed:>9.1f}x  {result == baseline}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50, help="每个后端每页重复解析的次数")
+    parser.add_argument("pages", nargs="*", help="待解析的详情页 html，默认为 tests/fixtures/*.html")
+    main(parser.parse_args())
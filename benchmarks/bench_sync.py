@@ -0,0 +1,154 @@
+"""
+完整同步流程的离线基准测试
+
+    python -m benchmarks.bench_sync [--items 100 1000 10000] [--notion-latency 0.05] [--notion-429 0.01]
+
+每个规模启动一组本地的豆瓣和 Notion 模拟服务（见 benchmarks/fake_servers.py），
+在独立进程中对空数据库运行一次 DoubanNotionSync（cold），再用同一个状态目录运行一次（warm），
+输出耗时、每个接口的请求数和同步进程的峰值内存（RSS）。
+模拟服务运行在另一个进程中，不计入同步进程的内存和 CPU。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+from benchmarks.fake_servers import FakeDouban, FakeNotion, start_server
+
+
+def _max_rss_mib(who):
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux 上单位为 KiB，macOS 上为字节
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def serve(items, args, conn):
+    """
+    模拟服务进程：启动后把两个服务的地址发给主进程，收到 "stats" 时返回并清空请求计数，收到 "stop" 时退出
+    """
+    async def main():
+        douban = FakeDouban(items, latency=args.douban_latency, broken=args.douban_broken)
+        notion = FakeNotion(latency=args.notion_latency, rate_limited=args.notion_429, retry_after=args.retry_after)
+        runners = [await start_server(douban), await start_server(notion)]
+        conn.send((douban.base_url, notion.base_url))
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await loop.run_in_executor(None, conn.recv)
+            if command == "stop":
+                break
+            conn.send({"douban": dict(douban.stats), "notion": dict(notion.stats)})
+            douban.stats.clear()
+            notion.stats.clear()
+        for runner, _ in runners:
+            await runner.cleanup()
+    asyncio.run(main())
+
+
+def run_sync(douban_url, notion_url, state_dir, args, conn):
+    """
+    同步进程：运行一次完整同步，返回耗时和峰值内存
+    """
+    from douban.rate_limit import make_rate_limiter
+    from douban.sync import DoubanNotionSync
+
+    logging.basicConfig(level=logging.ERROR)
+    # 模拟数据的标记时间都在 2022 年，保证第一次运行时全部需要同步
+    os.environ["LAST_SYNC_TIME"] = "2000-01-01T00:00:00"
+    douban_sync = DoubanNotionSync(user_agent="bench",
+                                   cookie="",
+                                   ck="bench",
+                                   uid="bench",
+                                   token="bench",
+                                   movie_database_id="movie-database",
+                                   book_database_id="book-database",
+                                   state_dir=state_dir,
+                                   douban_concurrency=args.douban_concurrency,
+                                   notion_concurrency=args.notion_concurrency,
+                                   douban_rate_limiter=make_rate_limiter(args.douban_rate, args.douban_concurrency),
+                                   notion_rate_limiter=make_rate_limiter(args.notion_rate, args.notion_concurrency),
+                                   parser=args.parser,
+                                   parse_executor=args.parse_executor,
+                                   douban_base_url=douban_url,
+                                   notion_base_url=notion_url)
+    begin = time.perf_counter()
+    douban_sync.sync()
+    elapsed = time.perf_counter() - begin
+    conn.send({
+        "wall": elapsed,
+        "rss": _max_rss_mib(resource.RUSAGE_SELF),
+        "children_rss": _max_rss_mib(resource.RUSAGE_CHILDREN),
+    })
+
+
+def bench(items, args):
+    ctx = multiprocessing.get_context("spawn")
+    server_conn, child_conn = ctx.Pipe()
+    server = ctx.Process(target=serve, args=(items, args, child_conn), daemon=True)
+    server.start()
+    child_conn.close()
+    douban_url, notion_url = server_conn.recv()
+    results = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        for run in ["cold", "warm"]:
+            parent_conn, child_conn = ctx.Pipe()
+            worker = ctx.Process(target=run_sync, args=(douban_url, notion_url, state_dir, args, child_conn))
+            worker.start()
+            child_conn.close()
+            result = parent_conn.recv()
+            worker.join()
+            server_conn.send("stats")
+            result.update(server_conn.recv())
+            result.update({"items": items, "run": run})
+            results.append(result)
+    server_conn.send("stop")
+    server.join()
+    return results
+
+
+def report(results):
+    print(f"{'items':>7}  {'run':<5}{'wall s':>9}{'items/s':>10}{'RSS MiB':>10}{'child MiB':>10}"
+          f"{'douban':>8}{'notion':>8}")
+    for r in results:
+        print(f"{r['items']:>7}  {r['run']:<5}{r['wall']:>9.2f}{r['items'] / r['wall']:>10.1f}"
+              f"{r['rss']:>10.1f}{r['children_rss']:>10.1f}"
+              f"{sum(r['douban'].values()):>8}{sum(r['notion'].values()):>8}")
+    print()
+    for r in results:
+        print(f"{r['items']} items, {r['run']}:")
+        for service in ["douban", "notion"]:
+            for endpoint, count in sorted(r[service].items()):
+                print(f"    {service:<8}{endpoint:<48}{count:>8}")
+
+
+def main(args):
+    results = []
+    for items in args.items:
+        results.extend(bench(items, args))
+    report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000], help="条目总数，可以给出多个规模")
+    parser.add_argument("--douban-latency", type=float, default=0.0, help="模拟豆瓣每个请求的延迟（秒）")
+    parser.add_argument("--douban-broken", type=int, nargs="*", default=[], help="返回 500 的异常条目编号")
+    parser.add_argument("--notion-latency", type=float, default=0.0, help="模拟 Notion 每个请求的延迟（秒）")
+    parser.add_argument("--notion-429", type=float, default=0.0, help="模拟 Notion 返回 429 的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--douban-rate", type=float, default=0, help="豆瓣限流（次/秒），0 表示不限流")
+    parser.add_argument("--notion-rate", type=float, default=0, help="Notion 限流（次/秒），0 表示不限流")
+    parser.add_argument("--douban-concurrency", type=int, default=2)
+    parser.add_argument("--notion-concurrency", type=int, default=3)
+    parser.add_argument("--parser", default="auto")
+    parser.add_argument("--parse-executor", default="auto")
+    parser.add_argument("--json", help="同时把结果写入该 JSON 文件")
+    main(parser.parse_args())
@@ -0,0 +1,364 @@
+"""
+本地的豆瓣和 Notion 模拟服务，供基准测试和离线集成测试使用
+
+FakeDouban 模拟 Rexxar 的 interests、读书笔记、评论、广播接口和影音书详情页，
+FakeNotion 模拟 Notion 的数据库读取和查询（分页）、页面创建和更新以及追加子块，可以注入延迟和 429 限流。
+两个服务都会在 stats 中按接口统计请求数。
+"""
+import uuid
+import random
+import asyncio
+import collections
+from datetime import datetime, timedelta
+from aiohttp import web
+
+from benchmarks.bench_parse import FIXTURE_DIR
+from douban.notion_index import FINGERPRINT_PROPERTY, URL_PROPERTY
+
+INTEREST_TYPES = ["movie", "book"]
+INTEREST_STATUSES = ["doing", "done", "mark"]
+# 广播中标记动作的文字
+ACTIVITIES = {
+    ("movie", "mark"): "想看", ("movie", "doing"): "在看", ("movie", "done"): "看过",
+    ("book", "mark"): "想读", ("book", "doing"): "在读", ("book", "done"): "读过",
+}
+# 最早一条标记的时间，越靠前的条目越新
+EPOCH = datetime(2022, 12, 1, 12, 0, 0)
+
+
+def _read_fixture(name):
+    with open(f"{FIXTURE_DIR}/{name}", "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class _StatsMixin(object):
+    # 按该请求头统计每个账号的请求数
+    credential_header = None
+
+    def _init_stats(self, app):
+        self.base_url = None
+        self.stats = collections.Counter()
+        self.credentials = collections.Counter()
+        app.middlewares.append(self._count)
+
+    @web.middleware
+    async def _count(self, request, handler):
+        route = request.match_info.route.resource
+        name = route.canonical if route is not None else request.path
+        self.stats[f"{request.method} {name}"] += 1
+        self.credentials[request.headers.get(self.credential_header)] += 1
+        return await handler(request)
+
+
+class FakeDouban(_StatsMixin):
+    """
+    模拟的豆瓣服务
+
+    条目按 (类型, 状态) 平均分配，标记时间从 EPOCH 开始逐条提前一分钟，
+    详情页统一返回 tests/fixtures 中保存的电影和书籍页面；读书笔记、评论和广播通过 post() 在服务启动后发表。
+
+    :param items: 条目总数
+    :param latency: 每个请求的延迟（秒）
+    :param broken: 异常条目的编号，请求范围包含它们时 interests 接口返回 500，与豆瓣的行为一致
+    """
+    credential_header = "Cookie"
+
+    def __init__(self, items, latency=0.0, broken=()):
+        self.items = items
+        self.latency = latency
+        self.broken = set(broken)
+        self.edits = {}
+        # 内容类型 -> 从新到旧排列的原始条目
+        self.contents = {"annotations": [], "reviews": [], "timeline": []}
+        self._posted = 0
+        self.pages = {
+            "movie": _read_fixture("movie_1292052.html"),
+            "book": _read_fixture("book_2567698.html"),
+        }
+        self.lists = self._split(items)
+        self.app = web.Application()
+        self._init_stats(self.app)
+        self.app.router.add_get("/rexxar/api/v2/user/{uid}/interests", self.interests)
+        self.app.router.add_get("/rexxar/api/v2/user/{uid}/annotations", self.annotations)
+        self.app.router.add_get("/rexxar/api/v2/user/{uid}/reviews", self.reviews)
+        self.app.router.add_get("/rexxar/api/v2/status/user_timeline/{uid}", self.timeline)
+        self.app.router.add_get("/{interest_type}/subject/{subject_id}/", self.subject)
+
+    @staticmethod
+    def _split(items):
+        keys = [(t, s) for t in INTEREST_TYPES for s in INTEREST_STATUSES]
+        lists = {key: [] for key in keys}
+        for i in range(items):
+            lists[keys[i % len(keys)]].append(i)
+        return lists
+
+    def edit(self, i, **changes):
+        """
+        修改第 i 个条目的标记（rating、tags、comment 等），标记时间不变
+        """
+        self.edits.setdefault(i, {}).update(changes)
+
+    def item_list(self, i):
+        """
+        :return: 第 i 个条目所在的 (类型, 状态)
+        """
+        for key, ids in self.lists.items():
+            if i in ids:
+                return key
+        raise KeyError(i)
+
+    def post(self, kind, i, text=None):
+        """
+        为第 i 个条目发表一条内容，发表时间晚于所有标记和之前发表的内容
+
+        :param kind: annotations（只用于书籍）、reviews 或 timeline
+        """
+        self._posted += 1
+        n = self._posted
+        interest_type, status = self.item_list(i)
+        subject = self.make_subject(interest_type, i)
+        raw = {
+            "id": str(9000000 + n),
+            "create_time": (EPOCH + timedelta(minutes=n)).strftime("%Y-%m-%d %H:%M:%S"),
+            "sharing_url": f"https://www.douban.com/{kind}/{9000000 + n}/",
+        }
+        if kind == "annotations":
+            raw.update({"title": f"笔记 {n}", "abstract": text or f"annotation {n}", "page": n, "book": subject})
+        elif kind == "reviews":
+            raw.update({"title": f"评论 {n}", "abstract": text or f"review {n}", "rating": {"value": 4},
+                        "subject": subject})
+        else:
+            raw.update({"text": text or f"status {n}", "activity": ACTIVITIES[(interest_type, status)],
+                        "card": {"url": subject["url"], "title": subject["title"]}})
+            raw = {"status": raw}
+        self.contents[kind].insert(0, raw)
+        return raw
+
+    def post_status(self, text=None):
+        """
+        发表一条与书影条目无关的广播，发表时间晚于所有标记和之前发表的内容
+        """
+        self._posted += 1
+        n = self._posted
+        raw = {"status": {
+            "id": str(9000000 + n),
+            "create_time": (EPOCH + timedelta(minutes=n)).strftime("%Y-%m-%d %H:%M:%S"),
+            "sharing_url": f"https://www.douban.com/status/{9000000 + n}/",
+            "text": text or f"status {n}",
+            "activity": "说",
+        }}
+        self.contents["timeline"].insert(0, raw)
+        return raw
+
+    def make_subject(self, interest_type, i):
+        subject_id = 1000000 + i
+        subject = {
+            "id": str(subject_id),
+            "title": f"{interest_type}-{subject_id}",
+            "url": f"{self.base_url}/{interest_type}/subject/{subject_id}/",
+            "cover_url": f"https://img.example.com/view/photo/s_ratio_poster/public/p{subject_id}.jpg",
+            "rating": {"value": round(5 + i % 50 / 10, 1), "count": 1000 + i, "max": 10},
+            "pubdate": [f"{1990 + i % 30}-01-01"],
+        }
+        if interest_type == "movie":
+            subject.update({
+                "genres": ["剧情", "犯罪"],
+                "directors": [{"name": "弗兰克·德拉邦特"}],
+                "actors": [{"name": "蒂姆·罗宾斯"}, {"name": "摩根·弗里曼"}],
+            })
+        else:
+            subject.update({
+                "author": ["刘慈欣"],
+                "press": ["重庆出版社"],
+                "pages": ["302"],
+            })
+        return subject
+
+    def make_interest(self, interest_type, status, i):
+        subject = self.make_subject(interest_type, i)
+        interest = {
+            "id": i,
+            "status": status,
+            "create_time": (EPOCH - timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            "comment": f"comment {i}" if i % 3 == 0 else "",
+            "tags": ["tag"] if i % 2 == 0 else [],
+            "rating": {"star_count": i % 5 + 1, "value": i % 5 + 1, "max": 5} if i % 4 else None,
+            "subject": subject,
+        }
+        interest.update(self.edits.get(i, {}))
+        return interest
+
+    async def interests(self, request):
+        await asyncio.sleep(self.latency)
+        query = request.query
+        start = int(query.get("start", 0))
+        count = int(query.get("count", 20))
+        if "type" not in query:
+            return web.json_response({"total": self.items, "interests": []})
+        interest_type, status = query["type"], query["status"]
+        ids = self.lists.get((interest_type, status), [])
+        if self.broken.intersection(ids[start:start + count]):
+            return web.json_response({"msg": "internal error", "code": 500}, status=500)
+        return web.json_response({
+            "start": start,
+            "count": count,
+            "total": len(ids),
+            "interests": [self.make_interest(interest_type, status, i) for i in ids[start:start + count]],
+        })
+
+    def _content_page(self, kind, items, request):
+        start = int(request.query.get("start", 0))
+        count = int(request.query.get("count", 20))
+        return web.json_response({"start": start, "count": count, "total": len(items),
+                                  kind: items[start:start + count]})
+
+    async def annotations(self, request):
+        await asyncio.sleep(self.latency)
+        return self._content_page("annotations", self.contents["annotations"], request)
+
+    async def reviews(self, request):
+        await asyncio.sleep(self.latency)
+        interest_type = request.query.get("type")
+        items = [raw for raw in self.contents["reviews"]
+                 if interest_type is None or f"/{interest_type}/subject/" in raw["subject"]["url"]]
+        return self._content_page("reviews", items, request)
+
+    async def timeline(self, request):
+        await asyncio.sleep(self.latency)
+        items = self.contents["timeline"]
+        max_id = request.query.get("max_id")
+        start = 0
+        if max_id:
+            start = next(k + 1 for k, item in enumerate(items) if item["status"]["id"] == max_id)
+        return web.json_response({"items": items[start:start + 20]})
+
+    async def subject(self, request):
+        await asyncio.sleep(self.latency)
+        page = self.pages.get(request.match_info["interest_type"])
+        if page is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=page, content_type="text/html")
+
+
+class FakeNotion(_StatsMixin):
+    """
+    模拟的 Notion 服务，页面保存在内存中
+
+    :param latency: 每个请求的延迟（秒）
+    :param rate_limited: 以该概率返回 429
+    :param retry_after: 429 响应的 Retry-After（秒）
+    :param max_page_size: 数据库查询每页的最大条目数
+    :param seed: 注入 429 的随机种子
+    :param fingerprint_property: 读取数据库时是否返回同步指纹属性，False 模拟旧版本创建的数据库
+    """
+    credential_header = "Authorization"
+
+    def __init__(self, latency=0.0, rate_limited=0.0, retry_after=1, max_page_size=100, seed=0,
+                 fingerprint_property=True):
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.max_page_size = max_page_size
+        self.random = random.Random(seed)
+        self.fingerprint_property = fingerprint_property
+        self.databases = collections.defaultdict(dict)
+        self.page_database = {}
+        self.blocks = collections.defaultdict(list)
+        self.app = web.Application()
+        self._init_stats(self.app)
+        self.app.middlewares.append(self._rate_limit)
+        self.app.router.add_get("/v1/databases/{database_id}", self.retrieve_database)
+        self.app.router.add_post("/v1/databases/{database_id}/query", self.query_database)
+        self.app.router.add_post("/v1/pages", self.create_page)
+        self.app.router.add_patch("/v1/pages/{page_id}", self.update_page)
+        self.app.router.add_patch("/v1/blocks/{block_id}/children", self.append_children)
+
+    @staticmethod
+    def _error(status, code, message, headers=None):
+        return web.json_response({"object": "error", "status": status, "code": code, "message": message},
+                                 status=status, headers=headers)
+
+    @web.middleware
+    async def _rate_limit(self, request, handler):
+        await asyncio.sleep(self.latency)
+        if self.rate_limited and self.random.random() < self.rate_limited:
+            self.stats["429"] += 1
+            return self._error(429, "rate_limited", "Rate limited",
+                               headers={"Retry-After": str(self.retry_after)})
+        return await handler(request)
+
+    @staticmethod
+    def _page(page_id, database_id, properties):
+        return {
+            "object": "page",
+            "id": page_id,
+            "parent": {"type": "database_id", "database_id": database_id},
+            "archived": False,
+            "properties": properties,
+        }
+
+    async def retrieve_database(self, request):
+        # 只返回同步用到的属性，页面中的其他属性不做校验
+        properties = {URL_PROPERTY: {"type": "url", "url": {}}}
+        if self.fingerprint_property:
+            properties[FINGERPRINT_PROPERTY] = {"type": "rich_text", "rich_text": {}}
+        return web.json_response({"object": "database", "id": request.match_info["database_id"],
+                                  "properties": properties})
+
+    async def query_database(self, request):
+        database_id = request.match_info["database_id"]
+        body = await request.json()
+        page_size = min(int(body.get("page_size", 100)), self.max_page_size)
+        start = int(body.get("start_cursor") or 0)
+        pages = list(self.databases[database_id].items())
+        end = start + page_size
+        return web.json_response({
+            "object": "list",
+            "results": [self._page(page_id, database_id, properties) for page_id, properties in pages[start:end]],
+            "has_more": end < len(pages),
+            "next_cursor": str(end) if end < len(pages) else None,
+        })
+
+    async def create_page(self, request):
+        body = await request.json()
+        database_id = body["parent"]["database_id"]
+        page_id = str(uuid.uuid4())
+        self.databases[database_id][page_id] = body["properties"]
+        self.page_database[page_id] = database_id
+        return web.json_response(self._page(page_id, database_id, body["properties"]))
+
+    async def update_page(self, request):
+        page_id = request.match_info["page_id"]
+        database_id = self.page_database.get(page_id)
+        if database_id is None:
+            return self._error(404, "object_not_found", f"Could not find page with ID: {page_id}.")
+        body = await request.json()
+        properties = self.databases[database_id][page_id]
+        properties.update(body.get("properties", {}))
+        return web.json_response(self._page(page_id, database_id, properties))
+
+
+    async def append_children(self, request):
+        block_id = request.match_info["block_id"]
+        if block_id not in self.page_database:
+            return self._error(404, "object_not_found", f"Could not find block with ID: {block_id}.")
+        body = await request.json()
+        if len(body["children"]) > 100:
+            return self._error(400, "validation_error", "body.children.length should be ≤ 100")
+        self.blocks[block_id].extend(body["children"])
+        return web.json_response({"object": "list", "results": body["children"], "has_more": False})
+
+
+async def start_server(service, host="127.0.0.1", port=0):
+    """
+    在本机启动模拟服务
+
+    :return: (web.AppRunner, 服务地址)
+    """
+    runner = web.AppRunner(service.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    service.base_url = f"http://{host}:{port}"
+    return runner, service.base_url
@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import asyncio
+import logging
+import collections
+import httpx
+from douban.douban_query import make_session
+from douban.metrics import Metrics
+from douban.parse_pool import DetailParserPool
+from douban.rate_limit import FairShare, TokenBucket
+from douban.sync import DoubanNotionSync
+
+# 一个需要同步的豆瓣账号及其 Notion 数据库
+Account = collections.namedtuple("Account", [
+    "name", "uid", "cookie", "ck", "notion_token", "movie_database_id", "book_database_id",
+    "user_agent", "contents",
+])
+Account.__new__.__defaults__ = (None, None)
+
+_REQUIRED_FIELDS = ["name", "uid", "cookie", "ck", "notion_token", "movie_database_id", "book_database_id"]
+_ACCOUNT_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def load_accounts(path):
+    """
+    读取多账号配置文件
+
+    配置为 JSON：{"defaults": {...}, "accounts": [{...}, ...]}，也可以直接是账号列表。
+    每个账号需要 name、uid、cookie、ck、notion_token、movie_database_id、book_database_id，
+    可选 user_agent 和 contents；defaults 中的字段作为所有账号的默认值。
+    字符串中的 $VAR / ${VAR} 会替换为环境变量，Cookie 和令牌可以不写在配置文件里。
+
+    :return: Account 列表
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = {"accounts": config}
+    defaults = config.get("defaults", {})
+    accounts = []
+    for i, entry in enumerate(config.get("accounts", [])):
+        fields = {key: os.path.expandvars(value) if isinstance(value, str) else value
+                  for key, value in {**defaults, **entry}.items()}
+        unknown = set(fields) - set(Account._fields)
+        if unknown:
+            raise ValueError(f"第{i + 1}个账号含有未知字段: {', '.join(sorted(unknown))}")
+        missing = [key for key in _REQUIRED_FIELDS if not fields.get(key)]
+        if missing:
+            raise ValueError(f"第{i + 1}个账号缺少字段: {', '.join(missing)}")
+        # 账号名用作状态目录名和指标标签
+        if not _ACCOUNT_NAME.match(fields["name"]):
+            raise ValueError(f"账号名只能包含字母、数字、下划线、点和减号: {fields['name']}")
+        if isinstance(fields.get("contents"), str):
+            fields["contents"] = [kind for kind in fields["contents"].split(",") if kind]
+        accounts.append(Account(**fields))
+    if not accounts:
+        raise ValueError(f"{path} 中没有账号")
+    names = [account.name for account in accounts]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"账号名重复: {', '.join(duplicated)}")
+    return accounts
+
+
+class MultiAccountSync(object):
+    """
+    在一个事件循环中同步多个账号
+
+    所有账号共用豆瓣的 aiohttp 会话、Notion 的 httpx 连接池和详情页解析池，
+    Cookie 和 Notion 令牌随每个请求单独发送；每个上游只有一份限流预算，由 FairShare 在账号之间轮流分配，
+    藏书很多的账号不会让其他账号一直等待。每个账号的检查点、缓存和索引保存在 state_dir/<账号名> 下。
+
+    :param accounts: Account 列表，见 load_accounts
+    :param state_dir: 状态目录
+    :param douban_rate_limiter: 所有账号共用的豆瓣限流器
+    :param notion_rate_limiter: 所有账号共用的 Notion 限流器
+    :param user_agent: 账号没有配置 user_agent 时使用
+    :param parser: 详情页解析后端
+    :param parse_executor: 详情页解析的执行方式，见 DetailParserPool
+    :param parse_workers: 解析进程/线程数
+    :param douban_limit: 豆瓣连接池的最大连接数
+    :param notion_limit: Notion 连接池的最大连接数
+    :param options: 传给每个账号的 DoubanNotionSync 的其他参数
+    """
+    def __init__(self, accounts, state_dir="state",
+                 douban_rate_limiter=None, notion_rate_limiter=None,
+                 user_agent=None, parser="auto", parse_executor="auto", parse_workers=None,
+                 douban_limit=10, notion_limit=10, **options):
+        self.accounts = list(accounts)
+        self.state_dir = state_dir
+        self.douban_share = FairShare(douban_rate_limiter or TokenBucket(rate=0.5, capacity=2))
+        # Notion 的限制按令牌计算，一个账号被限流时不影响其他账号
+        self.notion_share = FairShare(notion_rate_limiter or TokenBucket(rate=3, capacity=3), shared_pause=False)
+        self.user_agent = user_agent
+        self.parser = parser
+        self.parse_pool = DetailParserPool(executor=parse_executor, workers=parse_workers, backend=parser)
+        self.douban_limit = douban_limit
+        self.notion_limit = notion_limit
+        self.options = options
+        self.metrics = Metrics()
+        self.results = {}
+        self.syncs = {}
+        self._douban_session = None
+        self._notion_client = None
+
+    def _open(self):
+        """
+        创建共用的连接池和每个账号的同步流程，aiohttp 会话需要在事件循环中创建
+        """
+        if self.syncs:
+            return
+        self._douban_session = make_session(limit=self.douban_limit, limit_per_host=self.douban_limit)
+        self._notion_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.notion_limit))
+        for account in self.accounts:
+            state_dir = os.path.join(self.state_dir, account.name)
+            os.makedirs(state_dir, exist_ok=True)
+            options = dict(self.options)
+            if account.contents is not None:
+                options["contents"] = account.contents
+            self.syncs[account.name] = DoubanNotionSync(
+                user_agent=account.user_agent or self.user_agent,
+                cookie=account.cookie,
+                ck=account.ck,
+                uid=account.uid,
+                token=account.notion_token,
+                movie_database_id=account.movie_database_id,
+                book_database_id=account.book_database_id,
+                state_dir=state_dir,
+                douban_rate_limiter=self.douban_share.tenant(account.name),
+                notion_rate_limiter=self.notion_share.tenant(account.name),
+                parser=self.parser,
+                metrics=Metrics(labels={"account": account.name}),
+                douban_session=self._douban_session,
+                notion_client=self._notion_client,
+                parse_pool=self.parse_pool,
+                **options)
+
+    async def close(self):
+        for sync in self.syncs.values():
+            await sync.close()
+        self.syncs = {}
+        if self._douban_session is not None:
+            await self._douban_session.close()
+            self._douban_session = None
+        if self._notion_client is not None:
+            await self._notion_client.aclose()
+            self._notion_client = None
+        await self.parse_pool.close()
+
+    def sync(self):
+        """
+        同步入口，阻塞直到所有账号同步完成并关闭所有连接
+
+        :return: 是否所有账号都同步成功
+        """
+        async def _run():
+            try:
+                return await self.async_sync()
+            finally:
+                await self.close()
+        return asyncio.run(_run())
+
+    async def _sync_account(self, name, sync):
+        logging.info(f"开始同步账号 {name}")
+        try:
+            success = await sync.async_sync()
+        except Exception as err:
+            logging.exception(f"账号 {name} 同步失败: {err}")
+            success = False
+        logging.info(f"账号 {name} 同步{'完成' if success else '未全部成功'}")
+        return success
+
+    async def async_sync(self):
+        """
+        并发同步所有账号，一个账号出错不影响其他账号
+
+        :return: 是否所有账号都同步成功，各账号的结果见 results
+        """
+        self._open()
+        names = list(self.syncs)
+        results = await asyncio.gather(*[self._sync_account(name, self.syncs[name]) for name in names])
+        self.results = dict(zip(names, results))
+        self.collect_metrics()
+        failed = [name for name, success in self.results.items() if not success]
+        if failed:
+            logging.error(f"{len(failed)} 个账号没有全部同步成功，下次运行时重试: {', '.join(failed)}")
+        return not failed
+
+    def collect_metrics(self):
+        """
+        汇总各账号的指标，账号的指标带有 account 标签
+        """
+        metrics = Metrics(prefix=self.metrics.prefix)
+        metrics.started_at = self.metrics.started_at
+        for sync in self.syncs.values():
+            metrics.merge(sync.metrics)
+        self.metrics = metrics
+        return metrics
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import sqlite3
+
+DETAIL_TABLE = "detail_cache"
+LISTING_TABLE = "listing_cache"
+LISTING_PREFIX = "rexxar:"
+
+
+class DetailCache(object):
+    """
+    豆瓣页面解析结果的本地缓存
+
+    以链接为键，保存解析后的字典，存放在 SQLite 文件中。
+    条目超过 ttl 秒后过期，总数超过上限时按最近访问时间淘汰（LRU）。
+    列表接口的响应（listing=True）保存在单独的表中，有自己的上限，不会挤掉详情页。
+
+    命中时的访问时间先记在内存中，淘汰前、待写入的条数达到 flush_every 时或 close() 时才批量写入；
+    条目数在内存中计数，写入时不再 COUNT(*)。
+
+    :param path: SQLite 文件路径，None 表示只在内存中缓存
+    :param ttl: 过期时间（秒），None 表示永不过期
+    :param max_entries: 详情页的最大条目数
+    :param listing_max_entries: 列表响应的最大条目数
+    :param flush_every: 访问时间攒够多少条后写入
+    """
+    def __init__(self, path=None, ttl=30 * 24 * 3600, max_entries=20000, listing_max_entries=2000,
+                 flush_every=500):
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.limits = {DETAIL_TABLE: max_entries, LISTING_TABLE: listing_max_entries}
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path or ":memory:")
+        if path is not None:
+            # 每次提交不再等待 fsync，断电时最多丢失最近的缓存写入
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        for table in self.limits:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    url TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+        self._migrate_listings()
+        self._conn.commit()
+        self._counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        for table in self.limits}
+        self._accessed = {table: {} for table in self.limits}
+
+    def _migrate_listings(self):
+        """
+        旧版本把列表响应和详情页存在同一张表中，移到列表表
+        """
+        # 按主键范围查找，不扫描整张表
+        where = "url >= ? AND url < ?"
+        bounds = (LISTING_PREFIX, LISTING_PREFIX[:-1] + chr(ord(LISTING_PREFIX[-1]) + 1))
+        self._conn.execute(f"INSERT OR REPLACE INTO {LISTING_TABLE} SELECT * FROM {DETAIL_TABLE} WHERE {where}",
+                           bounds)
+        self._conn.execute(f"DELETE FROM {DETAIL_TABLE} WHERE {where}", bounds)
+
+    @staticmethod
+    def _table(listing):
+        return LISTING_TABLE if listing else DETAIL_TABLE
+
+    def get(self, url, listing=False):
+        table = self._table(listing)
+        row = self._conn.execute(
+            f"SELECT data, created_at FROM {table} WHERE url = ?", (url,)).fetchone()
+        now = time.time()
+        if row is None:
+            self.misses += 1
+            return None
+        data, created_at = row
+        if self.ttl is not None and now - created_at > self.ttl:
+            self._delete(table, url)
+            self._conn.commit()
+            self.misses += 1
+            return None
+        self._accessed[table][url] = now
+        if len(self._accessed[table]) >= self.flush_every:
+            self.flush()
+        self.hits += 1
+        return json.loads(data)
+
+    def set(self, url, data, listing=False):
+        table = self._table(listing)
+        now = time.time()
+        data = json.dumps(data, ensure_ascii=False)
+        self._accessed[table].pop(url, None)
+        updated = self._conn.execute(
+            f"UPDATE {table} SET data = ?, created_at = ?, accessed_at = ? WHERE url = ?",
+            (data, now, now, url)).rowcount
+        if not updated:
+            self._conn.execute(
+                f"INSERT INTO {table} (url, data, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (url, data, now, now))
+            self._counts[table] += 1
+            self._evict(table)
+        self._conn.commit()
+
+    def _delete(self, table, url):
+        self._accessed[table].pop(url, None)
+        self._counts[table] -= self._conn.execute(f"DELETE FROM {table} WHERE url = ?", (url,)).rowcount
+
+    def _evict(self, table):
+        excess = self._counts[table] - self.limits[table]
+        if excess <= 0:
+            return
+        # 淘汰前写入内存中的访问时间，最近命中的条目不会被淘汰
+        self._write_accessed(table)
+        self._counts[table] -= self._conn.execute(f"""
+            DELETE FROM {table} WHERE url IN (
+                SELECT url FROM {table} ORDER BY accessed_at ASC LIMIT ?
+            )
+        """, (excess,)).rowcount
+
+    def _write_accessed(self, table):
+        accessed = self._accessed[table]
+        if accessed:
+            self._conn.executemany(f"UPDATE {table} SET accessed_at = ? WHERE url = ?",
+                                   [(now, url) for url, now in accessed.items()])
+            accessed.clear()
+
+    def flush(self):
+        """
+        写入内存中的访问时间
+        """
+        for table in self.limits:
+            self._write_accessed(table)
+        self._conn.commit()
+
+    def __contains__(self, url):
+        return self._conn.execute(
+            f"SELECT 1 FROM {DETAIL_TABLE} WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        """
+        :return: 详情页的条目数，不包括列表响应
+        """
+        return self._counts[DETAIL_TABLE]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
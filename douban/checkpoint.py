@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from datetime import datetime
+
+
+def interest_fingerprint(interest):
+    """
+    豆瓣标记中用户可以修改的部分（状态、个人评分、标签、短评）的指纹，用于发现旧条目的修改
+
+    :param interest: interests 接口返回的单个条目
+    """
+    rating = interest.get("rating") or {}
+    payload = [
+        interest.get("status"),
+        rating.get("star_count"),
+        sorted(interest.get("tags") or []),
+        interest.get("comment") or "",
+    ]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def content_fingerprint(content):
+    """
+    已追加到 Notion 的读书笔记、评论或广播的指纹，以 "类型:id" 为键保存，避免中断后重复追加
+
+    :param content: douban.douban_query.normalize_content 的结果
+    """
+    payload = [content["title"], content["text"], content["note"]]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def content_key(content):
+    return f"{content['kind']}:{content['id']}"
+
+
+class CheckpointStore(object):
+    """
+    同步进度的持久化存储
+
+    每个 (interest_type, status) 记录三项：
+        watermark: 已完整同步的最新标记时间，早于等于它的条目只需比较指纹
+        scan_newest: 当前这一轮扫描见到的最新标记时间，扫描完成后成为新的 watermark
+        offset: 当前这一轮扫描最后完成的分页起始位置，进程中断后从这里继续
+
+    另外以条目链接为键保存每个已同步条目的指纹，见 interest_fingerprint；
+    读书笔记、评论和广播以 (类型, 范围) 记录各自的进度，并以 "类型:id" 为键保存指纹，见 content_fingerprint。
+    其他零散的状态（例如广播游标、上次完整扫描的时间）以名称为键保存在 cursors 表中。
+
+    :param path: SQLite 文件路径，None 表示只保存在内存中
+    """
+    def __init__(self, path=None):
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path or ":memory:")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                interest_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                watermark TEXT,
+                scan_newest TEXT,
+                offset INTEGER,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (interest_type, status)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                url TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cursors (
+                name TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _to_datetime(value):
+        return datetime.fromisoformat(value) if value else None
+
+    @staticmethod
+    def _to_str(value):
+        return value.isoformat() if value else None
+
+    def get(self, interest_type, status):
+        row = self._conn.execute(
+            "SELECT watermark, scan_newest, offset FROM sync_state WHERE interest_type = ? AND status = ?",
+            (interest_type, status)).fetchone()
+        if row is None:
+            return {"watermark": None, "scan_newest": None, "offset": None}
+        watermark, scan_newest, offset = row
+        return {
+            "watermark": self._to_datetime(watermark),
+            "scan_newest": self._to_datetime(scan_newest),
+            "offset": offset,
+        }
+
+    def _upsert(self, interest_type, status, watermark, scan_newest, offset):
+        self._conn.execute("""
+            INSERT OR REPLACE INTO sync_state (interest_type, status, watermark, scan_newest, offset, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (interest_type, status, self._to_str(watermark), self._to_str(scan_newest), offset, time.time()))
+        self._conn.commit()
+
+    def save_progress(self, interest_type, status, offset, scan_newest):
+        """
+        记录一页已经同步完成
+        """
+        state = self.get(interest_type, status)
+        self._upsert(interest_type, status, state["watermark"], scan_newest, offset)
+
+    def complete(self, interest_type, status, success=True):
+        """
+        一轮扫描结束。成功时推进 watermark；有条目失败时保留原 watermark，下一轮从头重新扫描
+        """
+        state = self.get(interest_type, status)
+        watermark = state["watermark"]
+        if success and state["scan_newest"] is not None:
+            if watermark is None or state["scan_newest"] > watermark:
+                watermark = state["scan_newest"]
+        self._upsert(interest_type, status, watermark, None, None)
+
+    def get_fingerprints(self, urls):
+        """
+        :return: {链接: 指纹}，没有记录的链接不包含在内
+        """
+        urls = list(urls)
+        fingerprints = {}
+        # SQLite 默认最多999个参数
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT url, fingerprint FROM fingerprints WHERE url IN ({', '.join('?' * len(chunk))})", chunk)
+            fingerprints.update(rows)
+        return fingerprints
+
+    def set_fingerprints(self, fingerprints):
+        """
+        :param fingerprints: {链接: 指纹}
+        """
+        if not fingerprints:
+            return
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO fingerprints (url, fingerprint, updated_at) VALUES (?, ?, ?)",
+            [(url, fingerprint, now) for url, fingerprint in fingerprints.items()])
+        self._conn.commit()
+
+    def get_cursor(self, name):
+        """
+        :return: 以 JSON 保存的游标，没有记录时为 None
+        """
+        row = self._conn.execute("SELECT value FROM cursors WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set_cursor(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO cursors (name, value, updated_at) VALUES (?, ?, ?)",
+                           (name, json.dumps(value, ensure_ascii=False), time.time()))
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
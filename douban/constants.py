@@ -64,6 +64,9 @@ class MediaInfo(Enum):
     IMDB = "IMDb"
 
 
+DOUBAN_REXXAR_BASE = "https://m.douban.com"
+
+
 class DoubanRexxarURL(Enum):
     TIMELINE = "https://m.douban.com/rexxar/api/v2/status/user_timeline/{uid}?max_id={maxId}&ck={ck}&for_mobile=1"
     STATUS = "https://m.douban.com/rexxar/api/v2/status/{id}?ck={ck}&for_mobile=1"
@@ -72,8 +75,14 @@ class DoubanRexxarURL(Enum):
     ANNOTATIONS = "https://m.douban.com/rexxar/api/v2/user/{uid}/annotations?start={start}&count={count}&ck={ck}&for_mobile=1"
     REVIEWS = "https://m.douban.com/rexxar/api/v2/user/{uid}/reviews?type={type}&start={start}&count={count}&ck={ck}&for_mobile=1"
 
-    def format(self, **kwargs):
-        return self.value.format(**kwargs)
+    def format(self, base=None, **kwargs):
+        """
+        :param base: 替换默认的 https://m.douban.com，用于连接本地的模拟服务
+        """
+        url = self.value.format(**kwargs)
+        if base is not None:
+            url = base.rstrip("/") + url[len(DOUBAN_REXXAR_BASE):]
+        return url
 
 
 class MediaXpathParam(Enum):
@@ -87,6 +96,11 @@ class MediaXpathParam(Enum):
     B_PUB = '//div[@class="subject clearfix"]/div[@id="info"]/text()'
     B_SHORT = '//span[@class="short"]/div[@class="intro"]//following-sibling::*'
 
+    # 详情页信息栏和简介，与 '#info' 和 '#content > div > div.article > div > div.indent > span' 等价
+    INFO = '//*[@id="info"]'
+    RELATED_INTRO = ('//*[@id="content"]/div/div[contains(concat(" ", normalize-space(@class), " "), " article ")]'
+                     '/div/div[contains(concat(" ", normalize-space(@class), " "), " indent ")]/span')
+
     # 个人状态页面[wish/do/collect]获取信息
     LIST_BOOK_URL = '//div[@class="pic"]/a[@class="nbg"]/@href'
     LIST_BOOK_NAME = '//div[@class="info"]/h2/a/@title'
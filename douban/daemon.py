@@ -0,0 +1,227 @@
+import time
+import random
+import signal
+import asyncio
+import logging
+from datetime import datetime, timezone
+from douban.lazy_import import lazy_import
+
+# 只在启动 HTTP 接口时加载
+web = lazy_import("aiohttp.web")
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class SyncDaemon(object):
+    """
+    常驻进程，按固定间隔反复运行增量同步
+
+    同步对象在两次运行之间保持打开，详情缓存、Notion 索引、解析池和连接池都不需要重新建立。
+    间隔从上一次运行结束时开始计算，两次运行不会重叠；收到 SIGTERM / SIGINT 时等当前运行结束后退出，
+    避免索引没有保存而在下次运行时重复创建页面。
+
+    可选的 HTTP 接口（默认只监听本机）：
+    GET /healthz 健康检查，连续失败达到 max_failures 次或太久没有成功时返回 503；
+    GET /status 运行状态和指标汇总（JSON）；GET /metrics Prometheus 文本格式；
+    POST /sync 立即开始下一次同步。
+
+    :param sync: DoubanNotionSync 或 douban.accounts.MultiAccountSync
+    :param interval: 上一次运行结束到下一次运行开始的间隔（秒）
+    :param jitter: 间隔的随机浮动比例，0.1 表示在 ±10% 内浮动
+    :param host: HTTP 接口监听的地址
+    :param port: HTTP 接口监听的端口，None 时不启动；0 表示随机端口，见 self.port
+    :param max_failures: 连续失败多少次后健康检查返回 503
+    :param stale_after: 距离上次成功超过多少秒后健康检查返回 503，默认为三个间隔
+    :param after_run: 每次运行结束后调用的无参数函数，例如写入指标文件
+    """
+    def __init__(self, sync, interval=3600, jitter=0.1, host="127.0.0.1", port=None,
+                 max_failures=3, stale_after=None, after_run=None):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.sync = sync
+        self.interval = interval
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.host = host
+        self.port = port
+        self.max_failures = max_failures
+        self.stale_after = stale_after or 3 * interval
+        self.after_run = after_run
+        self.started_at = None
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.running = False
+        self.last_run = None
+        self.last_success_at = None
+        self.next_run_at = None
+        self._stopping = False
+        self._wake = None
+
+    def next_delay(self):
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def healthy(self):
+        if self.consecutive_failures >= self.max_failures:
+            return False
+        if self.running:
+            return True
+        last_ok = self.last_success_at or self.started_at
+        return last_ok is not None and time.time() - last_ok <= self.stale_after
+
+    def status(self):
+        return {
+            "healthy": self.healthy(),
+            "running": self.running,
+            "started_at": _isoformat(self.started_at),
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_run": self.last_run,
+            "last_success_at": _isoformat(self.last_success_at),
+            "next_run_at": _isoformat(None if self.running else self.next_run_at),
+        }
+
+    def stop(self):
+        """
+        请求退出，正在进行的运行会继续完成
+        """
+        if not self._stopping:
+            logging.info("收到退出请求，当前同步结束后退出" if self.running else "收到退出请求")
+        self._stopping = True
+        if self._wake is not None:
+            self._wake.set()
+
+    def trigger(self):
+        """
+        立即开始下一次同步
+
+        :return: 当前正在同步时返回 False
+        """
+        if self.running or self._wake is None:
+            return False
+        self._wake.set()
+        return True
+
+    async def run_once(self):
+        """
+        运行一次同步并记录结果，异常不会中断守护进程
+        """
+        self.running = True
+        started_at = time.time()
+        started = time.monotonic()
+        error = None
+        try:
+            success = await self.sync.async_sync()
+        except Exception as err:
+            logging.exception(f"同步出错: {err}")
+            success, error = False, str(err)
+        finally:
+            self.running = False
+        duration = time.monotonic() - started
+        self.runs += 1
+        if success:
+            self.consecutive_failures = 0
+            self.last_success_at = time.time()
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+        self.last_run = {
+            "started_at": _isoformat(started_at),
+            "duration_seconds": round(duration, 3),
+            "success": success,
+            "error": error,
+        }
+        logging.info(f"第{self.runs}次同步{'成功' if success else '失败'}，耗时{duration:.1f}秒")
+        if self.after_run is not None:
+            try:
+                self.after_run()
+            except Exception as err:
+                logging.exception(f"同步后的回调出错: {err}")
+        return success
+
+    async def _wait(self, delay):
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def async_run(self):
+        """
+        反复运行同步直到调用 stop()；结束时不关闭同步对象
+        """
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.started_at = time.time()
+        signals = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+                signals.append(signum)
+            except (NotImplementedError, RuntimeError):
+                # Windows 或非主线程中不支持，只能通过 stop() 退出
+                pass
+        runner = await self._start_http()
+        try:
+            while not self._stopping:
+                await self.run_once()
+                if self._stopping:
+                    break
+                delay = self.next_delay()
+                self.next_run_at = time.time() + delay
+                logging.info(f"下一次同步在{delay / 60:.1f}分钟后")
+                await self._wait(delay)
+        finally:
+            if runner is not None:
+                await runner.cleanup()
+            for signum in signals:
+                loop.remove_signal_handler(signum)
+            self._wake = None
+
+    def run(self):
+        """
+        守护进程入口，阻塞直到收到退出信号，退出时关闭同步对象
+        """
+        async def _run():
+            try:
+                await self.async_run()
+            finally:
+                await self.sync.close()
+        asyncio.run(_run())
+
+    async def _start_http(self):
+        if self.port is None:
+            return None
+        app = web.Application()
+        app.router.add_get("/healthz", self._healthz)
+        app.router.add_get("/status", self._status)
+        app.router.add_get("/metrics", self._metrics)
+        app.router.add_post("/sync", self._trigger)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, self.port)
+        await site.start()
+        self.port = runner.addresses[0][1]
+        logging.info(f"健康检查接口: http://{self.host}:{self.port}/healthz")
+        return runner
+
+    async def _healthz(self, request):
+        healthy = self.healthy()
+        return web.json_response({"status": "ok" if healthy else "unhealthy"}, status=200 if healthy else 503)
+
+    async def _status(self, request):
+        status = self.status()
+        status["metrics"] = self.sync.metrics.summary()
+        return web.json_response(status)
+
+    async def _metrics(self, request):
+        return web.Response(text=self.sync.metrics.prometheus_text(), content_type="text/plain")
+
+    async def _trigger(self, request):
+        if self.trigger():
+            return web.json_response({"status": "scheduled"}, status=202)
+        return web.json_response({"status": "running"}, status=409)
@@ -1,228 +1,506 @@
+import re
 import asyncio
 import aiohttp
 import logging
 import json
-import re
-from bs4 import BeautifulSoup
+import collections
+import contextlib
+from datetime import datetime, timedelta, timezone
 from douban.constants import DoubanRexxarURL
+from douban.metrics import Metrics
+from douban.rate_limit import UnlimitedRateLimiter
+from douban.retry import RETRY, FAILURE, Retrier, parse_retry_after
+from douban.html_parser import parse_movie_detail, parse_book_detail
+
+# 一段连续的标记条目，complete 为 False 时表示其中有条目获取失败
+InterestPage = collections.namedtuple("InterestPage", ["start", "items", "total", "complete"])
 
 
-def get_single_info_str(str_list, str_key):
-    return str_list[str_list.index(str_key) + 1] if str_key in str_list else ""
+def interest_time(interest):
+    """
+    标记时间，豆瓣记录的时间是 UTC+8
+    """
+    return datetime.fromisoformat(interest['create_time']).replace(tzinfo=timezone(timedelta(hours=8)))
+
 
+# 一页评论、读书笔记或广播，条目为 normalize_content 的结果；广播没有总数，total 为 None。
+# newest / oldest 为本页原始条目中最晚和最早的时间（包括没有关联到书影条目而被丢弃的广播），空页为 None，
+# 用来推进检查点和判断是否已经翻到上次同步的位置
+ContentPage = collections.namedtuple("ContentPage", ["start", "items", "total", "complete", "newest", "oldest"])
 
-def get_multiple_infos_list(infos_list, str_key, next_number):
+# 内容类型 -> 列表接口返回的字段
+CONTENT_KINDS = {
+    "annotations": "annotations",
+    "reviews": "reviews",
+    "timeline": "items",
+}
+
+
+def _subject_url(subject):
+    url = (subject or {}).get("url") or ""
+    if url and not url.endswith("/"):
+        url += "/"
+    return url or None
+
+
+def normalize_content(kind, raw):
     """
-    解析媒体info, 必须豆瓣中是':'和名称不一起的数据
+    把读书笔记、评论和广播整理为统一的格式
 
-    :param infos_list: 字符串列表
-    :param str_key: 字符串字典关键字
-    :param next_number: 豆瓣中/的位置
-    :return: 对应key值信息的列表
+    :param kind: annotations、reviews 或 timeline
+    :param raw: 列表接口返回的单个条目
+    :return: {"kind", "id", "title", "text", "url", "subject_url", "create_time", "note"}，
+             没有关联到书影条目的广播返回 None
     """
-    str_list = []
-    try:
-        if str_key in infos_list:
-            first_index = infos_list.index(str_key) + next_number
-            str_list.append(infos_list[first_index])
-            next_index = first_index
-            while True:
-                if infos_list[next_index + 1] == '/':
-                    next_index += 2
-                    str_list.append(infos_list[next_index])
-                else:
-                    break
-        else:
-            logging.warn(f"未解析到{str_key}数据，返回空值")
-        return str_list
-    except Exception as err:
-        logging.error(f"未解析到{str_key}数据：{err}")
-        return  str_list
-
-
-def get_single_info_list(infos_list, str_key):
+    if kind == "annotations":
+        subject = raw.get("book") or raw.get("subject")
+        text = raw.get("abstract") or raw.get("content") or ""
+        note = f"第{raw['page']}页" if raw.get("page") else raw.get("chapter")
+    elif kind == "reviews":
+        subject = raw.get("subject")
+        text = raw.get("abstract") or raw.get("content") or ""
+        rating = (raw.get("rating") or {}).get("value")
+        note = "⭐" * int(rating) if rating else None
+    elif kind == "timeline":
+        raw = raw.get("status") or raw
+        subject = raw.get("card")
+        text = raw.get("text") or ""
+        note = raw.get("activity")
+    else:
+        raise ValueError(f"不支持的内容类型: {kind}")
+    subject_url = _subject_url(subject)
+    if subject_url is None:
+        return None
+    return {
+        "kind": kind,
+        "id": str(raw["id"]),
+        "title": raw.get("title") or (subject or {}).get("title") or "",
+        "text": text,
+        "url": raw.get("sharing_url") or raw.get("url"),
+        "subject_url": subject_url,
+        "create_time": raw["create_time"],
+        "note": note,
+    }
+
+
+# 广播的动作 -> 标记状态
+FEED_ACTIVITIES = {
+    "想看": "mark", "在看": "doing", "看过": "done",
+    "想读": "mark", "在读": "doing", "读过": "done",
+}
+
+
+def feed_subject(content):
+    """
+    从广播中提取受影响的条目
+
+    :param content: normalize_content("timeline", ...) 的结果
+    :return: (类型 movie / book, 状态，无法从动作判断时为 None)；与影视、书籍无关时返回 None
     """
-    获取豆瓣信息， 针对豆瓣:和关键字在一起的
+    match = re.search(r"\b(movie|book)\b", content["subject_url"])
+    if match is None:
+        return None
+    return match.group(1), FEED_ACTIVITIES.get((content["note"] or "").strip())
 
-    :param infos_list: 字符串列表
-    :param str_key: 字符串字典关键字
-    :return: 对应key值信息的列表
+
+# 豆瓣的列表接口在某一页含有异常条目时会稳定返回 500，重试没有意义，由调用方拆分分页处理
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+class DoubanStatusError(Exception):
     """
-    str_list = []
-    try:
-        if str_key in infos_list:
-            data_list_tmp = infos_list[infos_list.index(str_key) + 1]
-            data_list_tmp = data_list_tmp.split('/')
-
-            for i in data_list_tmp:
-                str_list.append(i.strip(' '))
-        else:
-            logging.warn(f"未解析到<{str_key}>信息")
-        return str_list
-    except Exception as err:
-        logging.error(f"未解析到<{str_key}>信息:{err}")
-        return str_list
-
-
-def get_media_related_infos(info):
+    豆瓣返回了可以重试的状态码
     """
-    获取媒体简介
+    def __init__(self, status, body, retry_after=None):
+        super(DoubanStatusError, self).__init__(f"豆瓣返回 {status}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
 
-    :param info:
-    :return: 媒体简介 str类型
+
+def classify_douban_error(err):
+    """
+    豆瓣请求错误的分类，见 douban.retry.Retrier
     """
-    try:
-        if info:
-            related_infos = list(info[0].strings)
-            related_infos = [i.strip() for i in related_infos if i.strip() != '']
-            related_infos = "\n".join(related_infos)
-            return related_infos
-        else:
-            return "暂无。"
-    except Exception as err:
-        logging.error(f"未解析到简介{err}")
-        return "暂无。。。"
+    if isinstance(err, DoubanStatusError):
+        return (RETRY if err.status == 429 else FAILURE), err.retry_after
+    if isinstance(err, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return FAILURE, None
+    return None, None
+
+
+def make_session(timeout=None, limit=10, limit_per_host=4, keepalive_timeout=60):
+    """
+    创建豆瓣请求使用的 aiohttp 会话，不保存服务端下发的 Cookie，需要在事件循环中调用
+
+    :param timeout: aiohttp.ClientTimeout，默认总超时30秒、连接超时10秒
+    :param limit: 连接池最大连接数
+    :param limit_per_host: 每个域名的最大连接数
+    :param keepalive_timeout: 空闲连接保持时间（秒）
+    """
+    connector = aiohttp.TCPConnector(limit=limit,
+                                     limit_per_host=limit_per_host,
+                                     keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(connector=connector,
+                                 timeout=timeout or aiohttp.ClientTimeout(total=30, connect=10),
+                                 cookie_jar=aiohttp.DummyCookieJar())
 
 
 class DoubanAPI(object):
-    def __init__(self, user_agent, cookie, ck):
+    """
+    豆瓣接口，所有请求共用一个带连接池的 aiohttp 会话
+
+    会话在第一次请求时创建，需要通过 close() 或 ``async with`` 显式关闭。
+    多个账号可以通过 session 参数共用一个连接池，Cookie 和 User-Agent 随每个请求单独发送。
+
+    :param timeout: 单个请求的总超时时间（秒）
+    :param connect_timeout: 建立连接的超时时间（秒）
+    :param limit: 连接池最大连接数
+    :param limit_per_host: 每个域名的最大连接数
+    :param keepalive_timeout: 空闲连接保持时间（秒）
+    :param rate_limiter: 限流器，只在真正发出请求时消耗令牌
+    :param cache: DetailCache，缓存解析后的详情页和列表页
+    :param replay: 回放模式，只从缓存读取，不访问豆瓣
+    :param parser: 详情页解析后端，见 douban.html_parser.PARSER_BACKENDS
+    :param parse_pool: DetailParserPool，在进程池或线程池中解析详情页；None 时在事件循环中直接解析
+    :param rexxar_base: 豆瓣移动端接口的地址，默认为 https://m.douban.com
+    :param retrier: douban.retry.Retrier，默认按 interests / subject 等接口分别熔断
+    :param concurrency: 同时进行的请求数上限，None 表示只受连接池限制
+    :param metrics: douban.metrics.Metrics，记录每个接口的请求数、状态码和耗时
+    :param session: 共用的 aiohttp 会话，见 make_session；由创建者负责关闭，close() 不会关闭它
+
+    拆分到单个条目后仍然返回 500 的异常条目会被跳过，记录在 skipped_items 中，由调用方汇总和清空。
+    """
+    def __init__(self, user_agent, cookie, ck,
+                 timeout=30, connect_timeout=10,
+                 limit=10, limit_per_host=4, keepalive_timeout=60,
+                 rate_limiter=None, cache=None, replay=False, parser="auto", parse_pool=None,
+                 rexxar_base=None, retrier=None, concurrency=None, metrics=None, session=None):
         self.user_agent = user_agent
         self.cookie = cookie
         self.ck = ck
-    
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.rate_limiter = rate_limiter or UnlimitedRateLimiter()
+        self.cache = cache
+        self.replay = replay
+        self.parser = parser
+        self.parse_pool = parse_pool
+        self.rexxar_base = rexxar_base
+        self.metrics = metrics or Metrics()
+        self.skipped_items = []
+        self.retrier = retrier or Retrier(classify_douban_error, rate_limiter=self.rate_limiter,
+                                          metrics=self.metrics, upstream="douban")
+        self._semaphore = asyncio.BoundedSemaphore(concurrency) if concurrency else contextlib.nullcontext()
+        if self.replay and self.cache is None:
+            raise ValueError("replay mode requires a cache")
+        self._shared_session = session
+        self._session = None
+
+    @property
+    def session(self):
+        if self._shared_session is not None:
+            return self._shared_session
+        if self._session is None or self._session.closed:
+            self._session = make_session(timeout=self.timeout,
+                                         limit=self.limit,
+                                         limit_per_host=self.limit_per_host,
+                                         keepalive_timeout=self.keepalive_timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _get(self, url, headers=None, endpoint="subject"):
+        """
+        发出 GET 请求，429、网关错误和网络错误经过 Retrier 重试
+
+        :param endpoint: 接口名称，用于按接口熔断
+        :return: (状态码, 响应内容)，重试用尽后返回最后一次的状态码
+        """
+        # 每次请求都显式携带 Cookie，会话不保存服务端下发的 Cookie，多个账号可以共用一个会话
+        headers = {'User-Agent': self.user_agent, 'Cookie': self.cookie, **(headers or {})}
+
+        async def request():
+            async with self._semaphore:
+                await self.rate_limiter.acquire()
+                try:
+                    with self.metrics.timer("request_seconds", upstream="douban", endpoint=endpoint):
+                        async with self.session.get(url, headers=headers) as resp:
+                            text = await resp.text()
+                except Exception:
+                    self.metrics.inc("requests_total", upstream="douban", endpoint=endpoint, status="error")
+                    raise
+            self.metrics.inc("requests_total", upstream="douban", endpoint=endpoint, status=resp.status)
+            if resp.status in RETRYABLE_STATUS:
+                raise DoubanStatusError(resp.status, text, parse_retry_after(resp.headers.get("Retry-After")))
+            return resp.status, text
+        try:
+            return await self.retrier.call(endpoint, request, f"请求 {url}")
+        except DoubanStatusError as err:
+            return err.status, err.body
+
+    async def _get_json(self, url, headers=None, endpoint="interests"):
+        status, data = await self._get(url, headers=headers, endpoint=endpoint)
+        try:
+            data_u = json.loads(data)
+        except:
+            data_u = {'msg': 'Cookie Expired'}
+        return status, data_u
+
+    async def _get_listing(self, url, cache_key, headers=None, endpoint="interests"):
+        """
+        获取列表接口；正常模式下总是请求豆瓣并写入缓存，回放模式下只读缓存
+        """
+        if self.replay:
+            data_u = self.cache.get(cache_key, listing=True)
+            if data_u is None:
+                return 404, {'msg': f'{cache_key} not cached'}
+            return 200, data_u
+        status, data_u = await self._get_json(url, headers=headers, endpoint=endpoint)
+        if status == 200 and self.cache is not None:
+            self.cache.set(cache_key, data_u, listing=True)
+        return status, data_u
+
+    async def _parse(self, parse_func, html):
+        with self.metrics.timer("stage_seconds", stage="parse"):
+            if self.parse_pool is not None:
+                return await self.parse_pool.parse(parse_func, html)
+            return parse_func(html, self.parser)
+
+    async def _get_detail(self, url, parse_func, strict=True):
+        """
+        获取并解析详情页，命中缓存时不访问豆瓣
+
+        :param parse_func: 模块级解析函数，签名为 parse_func(html, backend)
+        :param strict: 为 False 时解析失败返回 None 而不是抛出异常
+        """
+        if self.cache is not None:
+            data = self.cache.get(url)
+            if data is not None:
+                return data
+        if self.replay:
+            logging.warning(f"回放模式下缓存中没有 {url}")
+            return None
+        resp_code, html = await self._get(url)
+        try:
+            data = await self._parse(parse_func, html)
+        except Exception:
+            if strict:
+                raise
+            data = None
+        if data is not None and self.cache is not None:
+            self.cache.set(url, data)
+        return data
+
     async def fetch_interests_total(self, uid):
         header = {
-            'User-Agent': self.user_agent,
-            'Cookie': self.cookie,
             'Referer': 'https://m.douban.com/mine/'
         }
-        total_interests_url = DoubanRexxarURL.INTERESTS_TOTAL.format(uid=uid, ck=self.ck)
-        async with aiohttp.ClientSession(headers=header) as session:
-            async with session.get(total_interests_url) as resp:
-                data = await resp.text()
-                try:
-                    data_u = json.loads(data)
-                except:
-                    data_u = {'msg': 'Cookie Expired'}
-                return resp.status, data_u
+        total_interests_url = DoubanRexxarURL.INTERESTS_TOTAL.format(base=self.rexxar_base, uid=uid, ck=self.ck)
+        return await self._get_listing(total_interests_url,
+                                       cache_key=f"rexxar:interests_total:{uid}",
+                                       headers=header,
+                                       endpoint="interests_total")
 
     async def fetch_interests(self, uid, interest_type, status, start, count):
         headers = {
-            'User-Agent': self.user_agent,
-            'Cookie': self.cookie,
             'Referer': 'https://m.douban.com/mine/' + interest_type
         }
         interest_url = DoubanRexxarURL.INTERESTS.format(
+            base=self.rexxar_base,
             uid=uid, 
             type=interest_type, 
             status=status, 
             start=start,
             count=count,
             ck=self.ck)
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(interest_url) as resp:
-                data = await resp.text()
-                try:
-                    data_u = json.loads(data)
-                except:
-                    data_u = {'msg': 'Cookie Expired'}
-                return resp.status, data_u
+        return await self._get_listing(interest_url,
+                                       cache_key=f"rexxar:interests:{uid}:{interest_type}:{status}:{start}:{count}",
+                                       headers=headers)
 
-    async def fetch_movie_detail(self, url):
+    async def fetch_interest_range(self, uid, interest_type, status, start, count):
+        """
+        获取 [start, start + count) 范围内的条目
+
+        豆瓣在范围内含有异常条目时会返回 500，此时把范围对半拆分分别获取，
+        只有异常条目本身会被跳过，请求数约为 2 * log2(count) 而不是逐条获取的 count 次。
+        异常条目会一直返回 500，跳过它的分页仍视为完整，检查点可以继续推进；
+        其他失败（网络错误、限流等）返回 complete 为 False 的分页，下次运行重试。
+
+        :return: InterestPage
+        """
+        try:
+            resp_code, interests = await self.fetch_interests(uid, interest_type, status, start, count)
+        except Exception as err:
+            logging.error(f"获取 {interest_type}/{status} [{start}, {start + count}) 失败: {err}")
+            return InterestPage(start, [], None, False)
+        if resp_code == 200:
+            return InterestPage(start, interests['interests'], int(interests['total']), True)
+        if resp_code == 500 and count == 1:
+            logging.error(f"{interest_type}/{status} 第{start + 1}个条目一直返回 500，已跳过")
+            self.metrics.inc("skipped_items_total", upstream="douban", interest_type=interest_type, status=status)
+            self.skipped_items.append(f"{interest_type}/{status}#{start}")
+            return InterestPage(start, [], None, True)
+        if resp_code != 500:
+            logging.error(f"获取 {interest_type}/{status} [{start}, {start + count}) 失败: {resp_code} {interests}")
+            return InterestPage(start, [], None, False)
+
+        half = count // 2
+        left, right = await asyncio.gather(
+            self.fetch_interest_range(uid, interest_type, status, start, half),
+            self.fetch_interest_range(uid, interest_type, status, start + half, count - half))
+        total = left.total if left.total is not None else right.total
+        return InterestPage(start, left.items + right.items, total, left.complete and right.complete)
+
+    async def iter_interest_pages(self, uid, interest_type, status, start=0, page_size=20, since=None, prefetch=1):
+        """
+        按标记时间从新到旧逐页返回 InterestPage，消费者处理当前页时在后台预取之后的 prefetch 页
+
+        第一页返回条目总数后才知道一共有几页；某一页出现不晚于 since 的条目后不再预取，
+        之后的分页只在消费者继续迭代时才获取。内存中最多同时保留 prefetch + 1 页。
+        提前结束迭代时请用 contextlib.aclosing 包装，以便及时取消预取。
+
+        :param start: 起始位置，用于从检查点继续
+        :param since: 带时区的 datetime，只影响预取
+        :param prefetch: 预取的页数
+        """
+        total = None
+        offset = start
+        prefetching = True
+        pending = {}
+
+        def schedule(page_start):
+            if page_start not in pending and (page_start == start or total is not None and page_start < total):
+                pending[page_start] = asyncio.ensure_future(
+                    self.fetch_interest_range(uid, interest_type, status, page_start, page_size))
+
+        schedule(start)
+        try:
+            while offset in pending:
+                page = await pending.pop(offset)
+                if page.total is not None:
+                    total = page.total
+                if since is not None and page.items and interest_time(page.items[-1]) <= since:
+                    prefetching = False
+                offset += page_size
+                for k in range(prefetch if prefetching else 0):
+                    schedule(offset + k * page_size)
+                yield page
+                schedule(offset)
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    async def iter_interests(self, uid, interest_type, status, since=None, prefetch=1):
+        """
+        逐条返回某个状态下的标记，自动翻页并预取下一页；给出 since 时遇到不晚于它的条目即停止
+
+        :param since: 带时区的 datetime
+        """
+        async with contextlib.aclosing(
+                self.iter_interest_pages(uid, interest_type, status, since=since, prefetch=prefetch)) as pages:
+            async for page in pages:
+                for interest in page.items:
+                    if since is not None and interest_time(interest) <= since:
+                        return
+                    yield interest
+
+    async def fetch_annotations(self, uid, start, count):
         headers = {
-            'User-Agent': self.user_agent,
-            'Cookie': self.cookie
+            'Referer': 'https://m.douban.com/mine/'
         }
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url) as resp:
-                html = await resp.text()
-                try:
-                    return self.parse_movie_detail(html)
-                except:
-                    return None
+        url = DoubanRexxarURL.ANNOTATIONS.format(base=self.rexxar_base, uid=uid, start=start, count=count, ck=self.ck)
+        return await self._get_listing(url,
+                                       cache_key=f"rexxar:annotations:{uid}:{start}:{count}",
+                                       headers=headers,
+                                       endpoint="annotations")
 
-    def parse_movie_detail(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
-        info = soup.select('#info')
-        info_list = info[0].get_text(strip=True, separator='\n').splitlines()
-
-        if '导演' in info_list:
-            movie_director = get_multiple_infos_list(info_list, '导演', 2)
-        else:
-            movie_director = ""
-        screenwriter = get_multiple_infos_list(info_list, "编剧", 2)
-        starring = get_multiple_infos_list(info_list, "主演", 2)
-        movie_type = get_multiple_infos_list(info_list, "类型:", 1)
-        # 国家或地区 语言
-        c_or_r = get_single_info_list(info_list, "制片国家/地区:")
-        language_list = get_single_info_list(info_list, "语言:")
-
-        # 分类 电影和电视剧 以及 动画片（电影）和动漫（剧集）
-        if '上映时间:' in info_list or '上映日期:' in info_list:
-            if '动画' in movie_type:
-                movie_categories = "动画片"
-            else:
-                movie_categories = '电影'
-        elif "首播:" in info_list or "首播时间:" in info_list:
-            if '动画' in movie_type:
-                movie_categories = "动漫"
-            else:
-                movie_categories = "电视剧"
-        else:
-            movie_categories = "未知"
-
-        imdb = info_list[info_list.index('IMDb:') + 1] if 'IMDb:' in info_list else ""
-        length = info_list[info_list.index('片长:') + 1] if '片长:' in info_list else ""
-        # movie_duration = length.split("分钟")[0] if length else ""
-        movie_duration = re.match(r'(\d+).*分钟', length).group(1) if length else ""
-
-        related_info = soup.select("#content > div > div.article > div > div.indent > span")
-        related_infos = get_media_related_infos(related_info)
-        data = {
-            'subject': {}
+    async def fetch_reviews(self, uid, interest_type, start, count):
+        headers = {
+            'Referer': 'https://m.douban.com/mine/' + interest_type
         }
-        data['subject'].update({
-            "movie_director": movie_director,
-            "screenwriter": screenwriter,
-            "starring": starring,
-            "movie_type": movie_type,
-            "c_or_r": c_or_r,
-            "language_list": language_list,
-            "movie_categories": movie_categories,
-            "imdb": imdb,
-            "movie_duration": movie_duration,
-            "related_intro": related_infos
-        })
-        return data
+        url = DoubanRexxarURL.REVIEWS.format(base=self.rexxar_base, uid=uid, type=interest_type,
+                                             start=start, count=count, ck=self.ck)
+        return await self._get_listing(url,
+                                       cache_key=f"rexxar:reviews:{uid}:{interest_type}:{start}:{count}",
+                                       headers=headers,
+                                       endpoint="reviews")
 
-    async def fetch_book_detail(self, url):
+    async def fetch_timeline(self, uid, max_id=""):
+        """
+        :param max_id: 只返回早于该广播的条目，空字符串表示从最新的开始
+        """
         headers = {
-            'User-Agent': self.user_agent,
-            'Cookie': self.cookie
+            'Referer': f'https://m.douban.com/people/{uid}/statuses'
         }
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url) as resp:
-                html = await resp.text()
-                return self.parse_book_detail(html)
+        url = DoubanRexxarURL.TIMELINE.format(base=self.rexxar_base, uid=uid, maxId=max_id, ck=self.ck)
+        return await self._get_listing(url,
+                                       cache_key=f"rexxar:timeline:{uid}:{max_id}",
+                                       headers=headers,
+                                       endpoint="timeline")
+
+    async def iter_content_pages(self, uid, kind, interest_type=None, start=0, page_size=20):
+        """
+        按时间从新到旧逐页返回读书笔记、评论或广播（ContentPage），由消费者决定何时停止
+
+        读书笔记和评论按 start / count 翻页；广播按 max_id 翻页，不支持从中间位置继续。
+        获取失败时返回一个 complete 为 False 的空页并结束迭代。
+
+        :param kind: annotations、reviews 或 timeline
+        :param interest_type: 评论的类型 movie / book，其他类型忽略
+        :param start: 起始位置，用于从检查点继续
+        """
+        offset = start if kind != "timeline" else 0
+        max_id = ""
+        while True:
+            if kind == "annotations":
+                request = self.fetch_annotations(uid, offset, page_size)
+            elif kind == "reviews":
+                request = self.fetch_reviews(uid, interest_type, offset, page_size)
+            elif kind == "timeline":
+                request = self.fetch_timeline(uid, max_id)
+            else:
+                raise ValueError(f"不支持的内容类型: {kind}")
+            try:
+                resp_code, data = await request
+            except Exception as err:
+                resp_code, data = None, err
+            if resp_code != 200:
+                logging.error(f"获取 {kind} 第{offset}条之后的内容失败: {resp_code} {data}")
+                yield ContentPage(offset, [], None, False, None, None)
+                return
+            raw_items = data.get(CONTENT_KINDS[kind]) or []
+            total = data.get("total") if kind != "timeline" else None
+            items = [item for item in (normalize_content(kind, raw) for raw in raw_items) if item is not None]
+            times = [interest_time(raw) for raw in (raw.get("status") or raw for raw in raw_items)
+                     if raw.get("create_time")]
+            yield ContentPage(offset, items, total, True, max(times, default=None), min(times, default=None))
+            offset += len(raw_items)
+            if not raw_items or total is not None and offset >= total:
+                return
+            if kind == "timeline":
+                last = raw_items[-1]
+                max_id = (last.get("status") or last)["id"]
+
+    async def fetch_movie_detail(self, url):
+        return await self._get_detail(url, parse_movie_detail, strict=False)
+
+    def parse_movie_detail(self, html):
+        return parse_movie_detail(html, self.parser)
+
+    async def fetch_book_detail(self, url):
+        return await self._get_detail(url, parse_book_detail)
     
     def parse_book_detail(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
-        info = soup.select('#info')
-        info_list = info[0].get_text(strip=True, separator='\n').splitlines()
-        book_isbn = get_single_info_str(str_list=info_list, str_key="ISBN:")
-        book_price = get_single_info_str(str_list=info_list, str_key="定价:")
-        # 价格
-        book_price_list = [float(s) for s in re.findall(r'-?\d+\.?\d*', book_price)]
-        if len(book_price_list):
-            book_price = book_price_list[0]
-        else:
-            book_price = 0
-
-        data = {
-            'subject': {}
-        }
-        data['subject'].update({
-            'isbn': book_isbn,
-            'book_price': book_price,
-        })
-        return data
+        return parse_book_detail(html, self.parser)
@@ -0,0 +1,139 @@
+import os
+import asyncio
+import logging
+import contextlib
+from douban.douban_query import DoubanAPI
+from douban.cache import DetailCache
+from douban.checkpoint import interest_fingerprint
+from douban.metrics import Metrics
+from douban.parse_pool import DetailParserPool
+from douban.rate_limit import TokenBucket
+from douban.snapshot import make_record, open_snapshot
+
+
+class DoubanExport(object):
+    """
+    把豆瓣的全部标记连同详情页解析结果导出到本地快照，不访问 Notion
+
+    快照边获取边写入；重新运行时读取已有快照中的指纹，只追加新增或修改过的条目，
+    中断后重跑即可继续。详情页经过与同步相同的本地缓存。
+
+    :param path: 快照路径，见 douban.snapshot.open_snapshot
+    """
+    def __init__(self,
+                 user_agent: str,
+                 cookie: str,
+                 ck: str,
+                 uid: str,
+                 path: str,
+                 state_dir: str = None,
+                 douban_concurrency: int = 2,
+                 douban_rate_limiter=None,
+                 cache_ttl: float = 30 * 24 * 3600,
+                 cache_size: int = 20000,
+                 replay: bool = False,
+                 prefetch_pages: int = 4,
+                 parser: str = "auto",
+                 parse_executor: str = "auto",
+                 parse_workers: int = None,
+                 douban_base_url: str = None,
+                 metrics: Metrics = None) -> None:
+        if douban_rate_limiter is None:
+            douban_rate_limiter = TokenBucket(rate=0.5, capacity=2)
+        self.metrics = metrics or Metrics()
+        self.cache = DetailCache(path=os.path.join(state_dir, "douban_cache.sqlite3") if state_dir else None,
+                                 ttl=cache_ttl,
+                                 max_entries=cache_size)
+        self.parse_pool = DetailParserPool(executor=parse_executor,
+                                           workers=parse_workers,
+                                           backend=parser)
+        self.api = DoubanAPI(user_agent=str(user_agent),
+                             cookie=str(cookie),
+                             ck=str(ck),
+                             rate_limiter=douban_rate_limiter,
+                             cache=self.cache,
+                             replay=replay,
+                             parser=parser,
+                             parse_pool=self.parse_pool,
+                             rexxar_base=douban_base_url,
+                             concurrency=douban_concurrency,
+                             metrics=self.metrics)
+        self.uid = uid
+        self.snapshot = open_snapshot(path)
+        self.PAGE_SIZE = 20
+        self.prefetch_pages = prefetch_pages
+        self.exported = {}
+        self.written = 0
+
+    async def close(self):
+        self.snapshot.close()
+        await self.api.close()
+        await self.parse_pool.close()
+        self.cache.close()
+
+    def export(self):
+        """
+        导出入口，阻塞直到导出完成
+
+        :return: 是否全部导出成功
+        """
+        async def _run():
+            try:
+                return await self.async_export()
+            finally:
+                await self.close()
+        return asyncio.run(_run())
+
+    async def async_export(self):
+        self.exported = self.snapshot.fingerprints()
+        self.written = 0
+        if self.exported:
+            logging.info(f"快照 {self.snapshot.path} 中已有 {len(self.exported)} 个条目，只追加新增或修改的条目")
+        results = await asyncio.gather(*[
+            self.export_status(interest_type, status)
+            for interest_type in ["movie", "book"]
+            for status in ["doing", "done", "mark"]
+        ])
+        logging.info(f"导出 {self.written} 个条目到 {self.snapshot.path}")
+        self.metrics.record_cache(self.cache)
+        self.metrics.record_rate_limiter("douban", self.api.rate_limiter)
+        return all(results)
+
+    async def export_status(self, interest_type, status):
+        success = True
+        pages = self.api.iter_interest_pages(self.uid, interest_type, status,
+                                             page_size=self.PAGE_SIZE,
+                                             prefetch=self.prefetch_pages)
+        async with contextlib.aclosing(pages):
+            async for page in pages:
+                todo = [interest for interest in page.items
+                        if self.exported.get(interest['subject']['url']) != interest_fingerprint(interest)]
+                self.metrics.inc("unchanged_items_total", len(page.items) - len(todo), interest_type=interest_type)
+                results = await asyncio.gather(*[self.fetch_details(interest, interest_type) for interest in todo])
+                for interest, ok in zip(todo, results):
+                    self.metrics.inc("items_total", interest_type=interest_type, result="exported" if ok else "failed")
+                    if ok:
+                        record = make_record(interest, interest_type)
+                        self.snapshot.write(record)
+                        self.exported[interest['subject']['url']] = record["fingerprint"]
+                        self.written += 1
+                self.snapshot.flush()
+                success = success and page.complete and all(results)
+        return success
+
+    async def fetch_details(self, interest, interest_type):
+        """
+        获取详情页并合并到 interest['subject']
+        """
+        if interest_type == "movie":
+            fetch_detail = self.api.fetch_movie_detail
+        else:
+            fetch_detail = self.api.fetch_book_detail
+        try:
+            with self.metrics.timer("stage_seconds", stage="detail"):
+                details = await fetch_detail(interest['subject']['url'])
+            interest['subject'].update(details['subject'])
+            return True
+        except Exception as err:
+            logging.error(f"获取 {interest['subject']['url']} 详情失败: {err}")
+            return False
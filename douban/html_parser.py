@@ -0,0 +1,276 @@
+import re
+import logging
+from douban.constants import MediaXpathParam
+from douban.lazy_import import lazy_import
+
+# 只在真正解析详情页时导入，详情全部命中缓存的运行不需要加载它们
+bs4 = lazy_import("bs4")
+lxml = lazy_import("lxml", "lxml.html", optional=True)
+
+
+def get_single_info_str(str_list, str_key):
+    return str_list[str_list.index(str_key) + 1] if str_key in str_list else ""
+
+
+def get_multiple_infos_list(infos_list, str_key, next_number):
+    """
+    解析媒体info, 必须豆瓣中是':'和名称不一起的数据
+
+    :param infos_list: 字符串列表
+    :param str_key: 字符串字典关键字
+    :param next_number: 豆瓣中/的位置
+    :return: 对应key值信息的列表
+    """
+    str_list = []
+    try:
+        if str_key in infos_list:
+            first_index = infos_list.index(str_key) + next_number
+            str_list.append(infos_list[first_index])
+            next_index = first_index
+            while True:
+                if infos_list[next_index + 1] == '/':
+                    next_index += 2
+                    str_list.append(infos_list[next_index])
+                else:
+                    break
+        else:
+            logging.warn(f"未解析到{str_key}数据，返回空值")
+        return str_list
+    except Exception as err:
+        logging.error(f"未解析到{str_key}数据：{err}")
+        return  str_list
+
+
+def get_single_info_list(infos_list, str_key):
+    """
+    获取豆瓣信息， 针对豆瓣:和关键字在一起的
+
+    :param infos_list: 字符串列表
+    :param str_key: 字符串字典关键字
+    :return: 对应key值信息的列表
+    """
+    str_list = []
+    try:
+        if str_key in infos_list:
+            data_list_tmp = infos_list[infos_list.index(str_key) + 1]
+            data_list_tmp = data_list_tmp.split('/')
+
+            for i in data_list_tmp:
+                str_list.append(i.strip(' '))
+        else:
+            logging.warn(f"未解析到<{str_key}>信息")
+        return str_list
+    except Exception as err:
+        logging.error(f"未解析到<{str_key}>信息:{err}")
+        return str_list
+
+
+def join_related_strings(strings):
+    related_infos = [i.strip() for i in strings if i.strip() != '']
+    return "\n".join(related_infos)
+
+
+def get_media_related_infos(info):
+    """
+    获取媒体简介
+
+    :param info:
+    :return: 媒体简介 str类型
+    """
+    try:
+        if info:
+            return join_related_strings(info[0].strings)
+        else:
+            return "暂无。"
+    except Exception as err:
+        logging.error(f"未解析到简介{err}")
+        return "暂无。。。"
+
+
+def split_info_strings(strings):
+    """
+    模拟 BeautifulSoup get_text(strip=True, separator='\\n').splitlines()，
+    在 tests/fixtures 下的合成页面上结果相同
+    """
+    return "\n".join(s.strip() for s in strings if s.strip()).splitlines()
+
+
+class SoupBackend(object):
+    """
+    用 BeautifulSoup 解析整页，最慢但与最初的实现完全相同
+    """
+    name = "soup"
+
+    def extract(self, html, with_intro=True):
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        info = soup.select('#info')
+        info_list = info[0].get_text(strip=True, separator='\n').splitlines()
+        related_infos = None
+        if with_intro:
+            related_info = soup.select("#content > div > div.article > div > div.indent > span")
+            related_infos = get_media_related_infos(related_info)
+        return info_list, related_infos
+
+
+def _is_detail_fragment(name, attrs):
+    if name != 'div':
+        return False
+    if attrs.get('id') == 'info':
+        return True
+    classes = attrs.get('class') or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    return 'related-info' in classes
+
+
+class FragmentSoupBackend(object):
+    """
+    BeautifulSoup 只为 #info 和简介所在的 div.related-info 建树，其余部分只做词法扫描
+
+    简介用 div.related-info 定位，而不是 soup 后端按层级的选择器，
+    只在简介位于 div.related-info 中的页面上（包括 tests/fixtures 下的合成页面）两者结果相同
+    """
+    name = "fragment"
+
+    def extract(self, html, with_intro=True):
+        soup = bs4.BeautifulSoup(html, 'html.parser', parse_only=bs4.SoupStrainer(_is_detail_fragment))
+        info = soup.select('#info')
+        info_list = info[0].get_text(strip=True, separator='\n').splitlines()
+        related_infos = None
+        if with_intro:
+            related_info = soup.select("div.related-info > div.indent > span")
+            related_infos = get_media_related_infos(related_info)
+        return info_list, related_infos
+
+
+class LxmlBackend(object):
+    """
+    lxml 解析，用 XPath 取出需要的片段，需要安装 lxml
+
+    XPath 按 soup 后端的选择器改写，和 lxml 的 HTML 解析器一起只在 tests/fixtures 下的合成页面上
+    验证过与 soup 后端结果相同，遇到格式不规范的真实页面时可能不同
+    """
+    name = "lxml"
+
+    def extract(self, html, with_intro=True):
+        tree = lxml.html.fromstring(html)
+        info = tree.xpath(MediaXpathParam.INFO.value)
+        info_list = split_info_strings(info[0].xpath('.//text()'))
+        related_infos = None
+        if with_intro:
+            related_info = tree.xpath(MediaXpathParam.RELATED_INTRO.value)
+            if related_info:
+                related_infos = join_related_strings(related_info[0].xpath('.//text()'))
+            else:
+                related_infos = "暂无。"
+        return info_list, related_infos
+
+
+PARSER_BACKENDS = {
+    SoupBackend.name: SoupBackend,
+    FragmentSoupBackend.name: FragmentSoupBackend,
+    LxmlBackend.name: LxmlBackend,
+}
+
+
+def available_backends():
+    return [name for name in PARSER_BACKENDS if name != LxmlBackend.name or lxml is not None]
+
+
+def get_parser_backend(name="auto"):
+    """
+    获取解析后端，auto 表示已安装 lxml 时使用 lxml，否则使用 fragment
+    """
+    if name == "auto":
+        name = LxmlBackend.name if lxml is not None else FragmentSoupBackend.name
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"未知的解析后端 {name}，可选 {', '.join(PARSER_BACKENDS)}")
+    if name == LxmlBackend.name and lxml is None:
+        raise ValueError("lxml 解析后端需要先安装 lxml")
+    return PARSER_BACKENDS[name]()
+
+
+def parse_movie_detail(html, backend="auto"):
+    """
+    解析电影详情页
+
+    :param html: 详情页 html
+    :param backend: 解析后端名称，见 PARSER_BACKENDS
+    :return: {'subject': {...}}
+    """
+    info_list, related_infos = get_parser_backend(backend).extract(html, with_intro=True)
+
+    if '导演' in info_list:
+        movie_director = get_multiple_infos_list(info_list, '导演', 2)
+    else:
+        movie_director = ""
+    screenwriter = get_multiple_infos_list(info_list, "编剧", 2)
+    starring = get_multiple_infos_list(info_list, "主演", 2)
+    movie_type = get_multiple_infos_list(info_list, "类型:", 1)
+    # 国家或地区 语言
+    c_or_r = get_single_info_list(info_list, "制片国家/地区:")
+    language_list = get_single_info_list(info_list, "语言:")
+
+    # 分类 电影和电视剧 以及 动画片（电影）和动漫（剧集）
+    if '上映时间:' in info_list or '上映日期:' in info_list:
+        if '动画' in movie_type:
+            movie_categories = "动画片"
+        else:
+            movie_categories = '电影'
+    elif "首播:" in info_list or "首播时间:" in info_list:
+        if '动画' in movie_type:
+            movie_categories = "动漫"
+        else:
+            movie_categories = "电视剧"
+    else:
+        movie_categories = "未知"
+
+    imdb = info_list[info_list.index('IMDb:') + 1] if 'IMDb:' in info_list else ""
+    length = info_list[info_list.index('片长:') + 1] if '片长:' in info_list else ""
+    # movie_duration = length.split("分钟")[0] if length else ""
+    movie_duration = re.match(r'(\d+).*分钟', length).group(1) if length else ""
+
+    data = {
+        'subject': {}
+    }
+    data['subject'].update({
+        "movie_director": movie_director,
+        "screenwriter": screenwriter,
+        "starring": starring,
+        "movie_type": movie_type,
+        "c_or_r": c_or_r,
+        "language_list": language_list,
+        "movie_categories": movie_categories,
+        "imdb": imdb,
+        "movie_duration": movie_duration,
+        "related_intro": related_infos
+    })
+    return data
+
+
+def parse_book_detail(html, backend="auto"):
+    """
+    解析书籍详情页
+
+    :param html: 详情页 html
+    :param backend: 解析后端名称，见 PARSER_BACKENDS
+    :return: {'subject': {...}}
+    """
+    info_list, _ = get_parser_backend(backend).extract(html, with_intro=False)
+    book_isbn = get_single_info_str(str_list=info_list, str_key="ISBN:")
+    book_price = get_single_info_str(str_list=info_list, str_key="定价:")
+    # 价格
+    book_price_list = [float(s) for s in re.findall(r'-?\d+\.?\d*', book_price)]
+    if len(book_price_list):
+        book_price = book_price_list[0]
+    else:
+        book_price = 0
+
+    data = {
+        'subject': {}
+    }
+    data['subject'].update({
+        'isbn': book_isbn,
+        'book_price': book_price,
+    })
+    return data
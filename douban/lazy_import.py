@@ -0,0 +1,45 @@
+import importlib
+import importlib.util
+
+
+class LazyModule(object):
+    """
+    第一次访问属性时才真正导入的模块
+
+    bs4、lxml、pyarrow 等导入较慢的依赖只在解析详情页、写入 Parquet 时才需要，
+    大多数增量运行中详情命中缓存或条目已在 Notion 中，不需要为它们付出启动时间。
+
+    :param name: 模块名，例如 aiohttp.web
+    :param submodules: 需要同时导入的子模块，例如 pyarrow.parquet，之后可以通过属性访问
+    """
+    def __init__(self, name, *submodules):
+        self._name = name
+        self._submodules = submodules
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            for submodule in self._submodules:
+                importlib.import_module(submodule)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name, *submodules, optional=False):
+    """
+    延迟导入模块
+
+    :param optional: 为 True 时模块没有安装则返回 None，与 ``try: import x except ImportError: x = None`` 的用法一致；
+                     只检查是否安装，不会导入
+    """
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name, *submodules)
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import contextlib
+
+# 请求和处理阶段耗时的直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_name(name, key):
+    if not key:
+        return name
+    return name + "{" + ",".join(f"{label}={value}" for label, value in key) + "}"
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(label, str(value).replace("\\", "\\\\").replace('"', '\\"')) for label, value in pairs]
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+
+class Histogram(object):
+    """
+    固定分桶的直方图，分位数在桶内线性插值估计
+
+    :param buckets: 各个桶的上界，升序
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if other.buckets != self.buckets:
+            raise ValueError("只能合并分桶相同的直方图")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - cumulative) / count)
+            cumulative += count
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": round(self.quantile(0.5), 6) if self.count else None,
+            "p95": round(self.quantile(0.95), 6) if self.count else None,
+            "max": round(self.max, 6),
+        }
+
+
+class Metrics(object):
+    """
+    一次运行的计数器、瞬时值和耗时直方图
+
+    由 DoubanAPI、NotionDatabase、Retrier 和同步流程共同写入，运行结束时通过 summary()
+    汇总为 JSON，或通过 write_prometheus() 写成 node_exporter textfile collector 可以读取的文本文件。
+
+    :param prefix: Prometheus 指标名前缀
+    :param labels: 附加到所有指标上的标签，例如多账号同步时的 account
+    """
+    def __init__(self, prefix="douban_sync", labels=None):
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self.started_at = time.monotonic()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def _key(self, name, labels):
+        return name, _labels_key({**self.labels, **labels})
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        记录代码块的耗时（秒），可以包含 await
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def record_cache(self, cache):
+        """
+        记录 douban.cache.DetailCache 的命中次数和命中率
+        """
+        lookups = cache.hits + cache.misses
+        self.set("cache_hits", cache.hits)
+        self.set("cache_misses", cache.misses)
+        self.set("cache_hit_ratio", round(cache.hits / lookups, 4) if lookups else 0.0)
+
+    def record_rate_limiter(self, upstream, limiter):
+        """
+        记录限流器的累计等待时间，与 retry_sleep_seconds_total 一起构成等待时间
+        """
+        self.set("rate_limit_wait_seconds", round(limiter.waited, 6), upstream=upstream)
+
+    def merge(self, other):
+        """
+        把另一个 Metrics 的计数器、瞬时值和直方图合并进来，用于汇总多个账号的指标
+        """
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.gauges.update(other.gauges)
+        for key, histogram in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(histogram.buckets)
+            self.histograms[key].merge(histogram)
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def summary(self):
+        """
+        :return: 可以直接序列化为 JSON 的汇总，包含运行时长和每秒处理的条目数（items_total 之和）
+        """
+        elapsed = self.elapsed()
+        items = sum(value for (name, _), value in self.counters.items() if name == "items_total")
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "items": items,
+            "items_per_second": round(items / elapsed, 3) if elapsed > 0 else None,
+            "counters": {_format_name(name, key): value for (name, key), value in sorted(self.counters.items())},
+            "gauges": {_format_name(name, key): value for (name, key), value in sorted(self.gauges.items())},
+            "histograms": {_format_name(name, key): histogram.to_dict()
+                           for (name, key), histogram in sorted(self.histograms.items())},
+        }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), ensure_ascii=False, indent=2) + "\n")
+
+    def prometheus_text(self):
+        lines = []
+        emitted = set()
+
+        def emit_type(name, kind):
+            if name not in emitted:
+                emitted.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in sorted(self.counters.items()):
+            metric = f"{self.prefix}_{name}"
+            emit_type(metric, "counter")
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+        gauges = dict(self.gauges)
+        gauges[("elapsed_seconds", ())] = self.elapsed()
+        for (name, key), value in sorted(gauges.items()):
+            metric = f"{self.prefix}_{name}"
+            emit_type(metric, "gauge")
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+        for (name, key), histogram in sorted(self.histograms.items()):
+            metric = f"{self.prefix}_{name}"
+            emit_type(metric, "histogram")
+            cumulative = 0
+            for upper, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(key, [('le', upper)])} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        写入 Prometheus 文本格式，先写临时文件再替换，避免采集到写了一半的文件
+        """
+        _write_atomic(path, self.prometheus_text())
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -1,22 +1,57 @@
-import re
+import asyncio
 import logging
-import abc
-import collections
-from datetime import datetime, timezone, timedelta
-from notion_client import Client
+from notion_client import Client, AsyncClient
 from notion_client import APIErrorCode, APIResponseError
 from douban.constants import MediaType
-
-
-def make_iso_datetime_str(douban_datetime):
+from douban.notion_index import FINGERPRINT_PROPERTY, NotionURLIndex
+from douban.metrics import Metrics
+from douban.notion_writer import classify_notion_error
+from douban.rate_limit import UnlimitedRateLimiter
+from douban.retry import Retrier
+from douban.schema import BOOK_SCHEMA, MOVIE_SCHEMA, SCHEMAS, make_page_body
+
+
+CONTENT_LABELS = {
+    "annotations": "读书笔记",
+    "reviews": "评论",
+    "timeline": "广播",
+}
+# Notion 单个文本对象最多2000个字符，单次追加最多100个子块
+TEXT_LIMIT = 2000
+APPEND_LIMIT = 100
+
+
+def _rich_text(content, link=None, color=None):
+    text = {"content": content}
+    if link:
+        text["link"] = {"url": link}
+    item = {"type": "text", "text": text}
+    if color:
+        item["annotations"] = {"color": color}
+    return item
+
+
+def make_content_blocks(content):
     """
-    将豆瓣时间转换为ISO时间
-    :param douban_datetime: 豆瓣时间
-    :return: ISO时间
+    把读书笔记、评论或广播转换为追加到条目页面中的块：标题、时间说明、正文和分隔线
+
+    :param content: douban.douban_query.normalize_content 的结果
     """
-    raw_datetime = datetime.fromisoformat(douban_datetime)
-    clean_datetime = raw_datetime.replace(tzinfo=timezone(timedelta(hours=8)))
-    return clean_datetime.isoformat()
+    label = CONTENT_LABELS[content["kind"]]
+    heading = f"{label}：{content['title']}" if content["title"] else label
+    meta = " · ".join(filter(None, [content["create_time"], content["note"]]))
+    blocks = [
+        {"object": "block", "type": "heading_3",
+         "heading_3": {"rich_text": [_rich_text(heading, link=content["url"])]}},
+        {"object": "block", "type": "paragraph",
+         "paragraph": {"rich_text": [_rich_text(meta, color="gray")]}},
+    ]
+    text = content["text"]
+    for i in range(0, len(text), TEXT_LIMIT):
+        blocks.append({"object": "block", "type": "paragraph",
+                       "paragraph": {"rich_text": [_rich_text(text[i:i + TEXT_LIMIT])]}})
+    blocks.append({"object": "block", "type": "divider", "divider": {}})
+    return blocks
 
 
 def create_database(token, page_id, media_type):
@@ -27,100 +62,9 @@ def create_database(token, page_id, media_type):
     :param page_id: 浏览器打开notion，链接的尾部获取
     :return: databases_id，可以通过该id定位到数据库
     """
-    create_db_data = {}
-    if media_type == MediaType.BOOK.value:
-        create_db_data = {
-            "parent": {"type": "page_id", "page_id": f"{page_id}"},
-            "title": [{"type": "text", "text": {"content": "豆瓣书单库"}}],
-            "icon": {"type": "emoji", "emoji": "📚"},
-            "properties": {
-                "封面": {"files": {}},
-                "书名": {"title": {}},
-                "标记状态": {"select": {}},
-                "个人评分": {"select": {"options": [
-                    {"name": "⭐", "color": "yellow"},
-                    {"name": "⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐⭐⭐", "color": "yellow"}]}},
-                "评分": {"number": {}},
-                "评分人数": {"number": {}},
-                "作者": {"multi_select": {}},
-                "类型": {"multi_select": {}},
-                "出版社": {"multi_select": {}},
-                "出版年份": {"select": {}},
-                "短评": {"rich_text": {}},
-                "标记时间": {"date": {}},
-                "豆瓣链接": {"url": {}},
-                "ISBN": {"number": {}},
-                "价格": {"number": {}},
-                "页数": {"number": {}},
-            }}
-    elif media_type == MediaType.MUSIC.value:
-        create_db_data = {
-            "parent": {"type": "page_id", "page_id": f"{page_id}"},
-            "title": [{"type": "text", "text": {"content": "豆瓣音乐库"}}],
-            "icon": {"type": "emoji", "emoji": "🎵"},
-            "properties": {
-                "音乐": {"title": {}},
-                "表演者": {"rich_text": {}},
-                "封面": {"files": {}},
-                "评分": {"number": {}},
-                "出版者": {"select": {}},
-                "发行时间": {"select": {}},
-                "ISRC": {"url": {}},
-                "豆瓣链接": {"url": {}},
-                "评分人数": {"number": {}},
-                "短评": {"rich_text": {}},
-                "类型": {"multi_select": {}},
-                "标记状态": {"select": {}},
-                "标记时间": {"date": {}},
-                "个人评分": {"select": {"options": [
-                    {"name": "⭐", "color": "yellow"},
-                    {"name": "⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐⭐⭐", "color": "yellow"}]}},
-            }}
-    elif media_type == MediaType.MOVIE.value:
-        """
-        类型是获取豆瓣中的信息
-            剧情 / 动作 / 科幻 / 犯罪
-        分类是个人主观分的
-            电视剧、电影、动画片（指的是电影）、动漫（剧集）、纪录片（电影和电视剧）
-        """
-        create_db_data = {
-            "parent": {"type": "page_id", "page_id": f"{page_id}"},
-            "title": [{"type": "text", "text": {"content": "豆瓣影视库"}}],
-            "icon": {"type": "emoji", "emoji": "🎬"},
-            "properties": {
-                "封面": {"files": {}},
-                "名字": {"title": {}},
-                "标记状态": {"select": {}},
-                "个人评分": {"select": {"options": [
-                    {"name": "⭐", "color": "yellow"},
-                    {"name": "⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐⭐", "color": "yellow"},
-                    {"name": "⭐⭐⭐⭐⭐", "color": "yellow"}]}},
-                "评分": {"number": {}},
-                "评分人数": {"number": {}},
-                "分类": {"select": {}},
-                "类型": {"multi_select": {}},
-                "主演": {"multi_select": {}},
-                "导演": {"multi_select": {}},
-                "编剧": {"multi_select": {}},
-                "短评": {"rich_text": {}},
-                "时间": {"select": {}},
-                "国家地区": {"multi_select": {}},
-                "简介": {"rich_text": {}},
-                "片长": {"number": {}},
-                "标记时间": {"date": {}},
-                "豆瓣链接": {"url": {}},
-                "IMDb": {"url": {}},
-            }}
-    else:
+    if media_type not in SCHEMAS:
         exit("暂不支持其他数据库的创建")
+    create_db_data = SCHEMAS[media_type].database_body(page_id)
 
     _db_map = {
         MediaType.MOVIE.value: 'MOVIE_DATABASE_ID',
@@ -132,534 +76,244 @@ def create_database(token, page_id, media_type):
             logging.info(f"创建{media_type}数据库--初始化参数")
             notion = Client(auth=token)
             resp = notion.databases.create(**create_db_data)
-            logging.info(f"更新 .env 中 {_db_map[media_type]}={resp['id']}")
+            logging.info(f"更新 .env 中 {_db_map.get(media_type, media_type.upper() + '_DATABASE_ID')}={resp['id']}")
         else:
             logging.warn(f"跳过创建{media_type}数据库")
     except Exception as err:
         exit(f"网络请求错误:{err}")
 
 
-class NotionDatabase(metaclass=abc.ABCMeta):
-    def __init__(self, notion_token, notion_database_id):
-        self.notion = Client(auth=notion_token)
-        self.notion_database_id = notion_database_id
-        self.rating_value_name = [
-            '',
-            '⭐',
-            '⭐⭐',
-            '⭐⭐⭐',
-            '⭐⭐⭐⭐',
-            '⭐⭐⭐⭐⭐',
-        ]
-    
-    @abc.abstractclassmethod
-    def construct_data(self, data):
-        pass
+class NotionDatabase(object):
+    """
+    Notion 数据库，所有请求经过 _request；属性的生成和比较由子类的 schema 决定，见 douban.schema
 
-    @abc.abstractclassmethod
-    def check_exist(self, data):
-        pass
-    
-    @abc.abstractclassmethod
-    def create_item(self, item):
-        pass
+    每个条目的同步指纹保存在本地索引中，数据库中有「同步指纹」属性时也一并写入页面，
+    重建索引后仍然可以跳过没有变化的条目；旧版本创建的数据库没有该属性时只保存在本地。
 
-    @abc.abstractclassmethod
-    def update_item(self, item):
-        pass
+    :param http_client: 多个账号共用的 httpx.AsyncClient，由创建者负责关闭；
+                        共用时令牌随每个请求单独发送，不写入客户端的默认请求头
+    """
+    media_name = ""
+    schema = None
+
+    def __init__(self, notion_token, notion_database_id, index_path=None, rate_limiter=None, writer=None,
+                 base_url=None, retrier=None, metrics=None, http_client=None):
+        options = {}
+        if base_url is not None:
+            options["base_url"] = base_url
+        self.notion_token = notion_token
+        self.shared_client = http_client is not None
+        if self.shared_client:
+            self.notion = AsyncClient(client=http_client, **options)
+        else:
+            self.notion = AsyncClient(auth=notion_token, **options)
+        self.notion_database_id = notion_database_id
+        self.index = NotionURLIndex(index_path)
+        self.rate_limiter = rate_limiter or UnlimitedRateLimiter()
+        self.writer = writer
+        self.metrics = metrics or Metrics()
+        self.retrier = retrier or Retrier(classify_notion_error, rate_limiter=self.rate_limiter,
+                                          metrics=self.metrics, upstream="notion")
+        self._has_fingerprint_property = None
+        self._fingerprint_lock = asyncio.Lock()
+
+    def construct_data(self, data):
+        """
+        生成创建页面的请求体
+        """
+        return self.schema.page_body(self.notion_database_id, data)
 
-    @abc.abstractclassmethod
     def compare(self, l, r):
-        pass
+        return self.schema.compare(l, r)
 
+    async def close(self):
+        if not self.shared_client:
+            await self.notion.aclose()
 
-class NotionBookDatabase(NotionDatabase):
-    def __init__(self, notion_token, notion_database_id):
-        super(NotionBookDatabase, self).__init__(notion_token, notion_database_id)
-        self.book_status_name_dict = {
-            "done": "读过",
-            "doing": "在读",
-            "mark": "想读",
-        }
-    
-    def construct_data(self, data):
-        body = {
-            "parent": {
-                "type": "database_id",
-                "database_id": self.notion_database_id
-            },
-            "properties": {
-                "书名": {
-                    "title": [{
-                        "type": "text",
-                        "text": {
-                            "content": data["subject"]["title"]
-                        }
-                    }]
-                },
-                "封面": {
-                    "files": [{
-                        "type": "external",
-                        "name": data["subject"]["cover_url"][-13:],
-                        "external": {
-                            "url": data["subject"]["cover_url"]
-                        }
-                    }]
-                },
-                "作者": {
-                    "multi_select": [
-                        # NOTE: Notion select property can not accept comas
-                        {"name": author.replace(',', '')} for author in data["subject"]["author"]
-                    ]
-                },
-                "出版年份": {
-                    "select": {
-                        "name": data["subject"]["pubdate"][0][:4] if data["subject"]["pubdate"] else '未知'
-                    }
-                },
-                "标记状态": {
-                    "select": {
-                        "name": self.book_status_name_dict[data["status"]]
-                    },
-                },
-                "标记时间": {
-                    "date": {
-                        "end": None,
-                        "start": make_iso_datetime_str(data["create_time"]),
-                        # "time_zone": "Asia/Shanghai"
-                    },
-                },
-                "豆瓣链接": {
-                    "url": data["subject"]["url"]
-                }
-            }
-        }
-
-        if data['rating'] is not None:
-            body["properties"].update({
-                "个人评分": {
-                    "select": {
-                        "name": self.rating_value_name[int(data["rating"]["star_count"])],
-                    },
-                }
-            })
-
-        if len(data["comment"]):
-            body["properties"].update({
-                "短评": {
-                    "rich_text": [
-                        {
-                            "type": "text",
-                            "text": {
-                                "content": data["comment"]
-                            }
-                        }
-                    ]
-                }
-            })
-
-        if len(data["tags"]):
-            body["properties"].update({
-                "类型": {
-                    "multi_select": [
-                        {"name": tag} for tag in data["tags"]
-                    ]
-                }
-            })
-
-        if data["subject"]["rating"]:
-            body["properties"].update({
-                "评分": {
-                    "number": data["subject"]["rating"]["value"],
-                }
-            })
-            body["properties"].update({
-                "评分人数": {
-                    "number": data["subject"]["rating"]["count"],
-                }
-            })
-
-        if data["subject"]["pages"]:
-            body["properties"].update({
-                "页数": {
-                    # 有些书包括基本小书合订,所以要把页数都加总在一起
-                    "number": sum([int(it) for it in re.sub(r'[^0-9]', ',', data["subject"]["pages"][0]).split(',') if it]),
-                }
-            })
-
-        if data["subject"]["press"]:
-            body["properties"].update({
-                "出版社": {
-                    "multi_select": [
-                        # NOTE: Notion select property can not accept comas
-                        {"name": press.replace(',', '')} for press in data["subject"]["press"]
-                    ]
-                }
-            })
-        
-        if 'isbn' in data["subject"] and data['subject']["isbn"]:
-            body["properties"].update({
-                "ISBN": {
-                    "number": int(data["subject"]["isbn"]),
-                }
-            })
-        if 'book_price' in data["subject"] and data['subject']["book_price"]:
-            body["properties"].update({
-                "价格": {
-                    "number": data["subject"]["book_price"],
-                }
-            })
-        return body
-    
-    def check_exist(self, data):
-        query = {
-            "filter": {
-                "and": [
-                    {
-                        "property": "豆瓣链接",
-                        "url": {
-                            "equals": data["subject"]["url"]
-                        }
-                    }
-                ]
-            }
-        }
-        result = self.notion.databases.query(
-            database_id=self.notion_database_id,
-            filter=query["filter"],
-        )
-        return len(result["results"]) > 0, result["results"][0]["id"] if len(result["results"]) > 0 else None
-    
-    def create_item(self, item):
-        try:
-            body = self.construct_data(item)
-            self.notion.pages.create(**body)
-        except Exception as err:
-            logging.error(f"创建书籍 {item['subject']['title']}失败:{err}")
+    async def _request(self, method, endpoint, **kwargs):
+        """
+        所有 Notion 请求的统一出口，先消耗限流令牌再发出请求
 
-    def update_item(self, page_id, item):
+        :param endpoint: 接口名称，用于记录指标
+        """
+        await self.rate_limiter.acquire()
+        if self.shared_client:
+            kwargs["auth"] = self.notion_token
         try:
-            body = self.construct_data(item)
-            self.notion.pages.update(page_id=page_id, **body)
+            with self.metrics.timer("request_seconds", upstream="notion", endpoint=endpoint):
+                resp = await method(**kwargs)
         except Exception as err:
-            logging.error(f"更新书籍 {item['subject']['title']}失败:{err}")
-    
-    def _parse_datetime(self, date_dict):
-        raw_datetime = datetime.fromisoformat(date_dict['start'])
-        clean_datetime = raw_datetime.replace(tzinfo=timezone(timedelta(hours=8)))
-        return clean_datetime
+            self.metrics.inc("requests_total", upstream="notion", endpoint=endpoint,
+                             status=getattr(err, "status", "error"))
+            raise
+        self.metrics.inc("requests_total", upstream="notion", endpoint=endpoint, status=200)
+        return resp
+
+    async def _query_database(self, **kwargs):
+        return await self.retrier.call("databases.query",
+                                       lambda: self._request(self.notion.databases.query, "databases.query", **kwargs),
+                                       f"查询{self.media_name}数据库")
+
+    async def has_fingerprint_property(self):
+        """
+        数据库中是否有保存同步指纹的属性，只在第一次需要写入时查询一次
+        """
+        if self._has_fingerprint_property is not None:
+            return self._has_fingerprint_property
+        async with self._fingerprint_lock:
+            if self._has_fingerprint_property is None:
+                try:
+                    database = await self.retrier.call(
+                        "databases.retrieve",
+                        lambda: self._request(self.notion.databases.retrieve, "databases.retrieve",
+                                              database_id=self.notion_database_id),
+                        f"读取{self.media_name}数据库")
+                    found = FINGERPRINT_PROPERTY in database.get("properties", {})
+                except Exception as err:
+                    logging.warning(f"读取{self.media_name}数据库属性失败，同步指纹只保存在本地: {err}")
+                    found = False
+                else:
+                    if not found:
+                        logging.info(f"{self.media_name}数据库中没有「{FINGERPRINT_PROPERTY}」属性，同步指纹只保存在本地索引中；"
+                                     f"添加同名的文本属性后会一并写入页面")
+                self._has_fingerprint_property = found
+        return self._has_fingerprint_property
+
+    async def _with_fingerprint(self, properties, fingerprint):
+        if await self.has_fingerprint_property():
+            return {**properties, **self.schema.fingerprint_property(fingerprint)}
+        return properties
+
+    async def ensure_index(self):
+        """
+        加载本地索引，索引不存在时分页扫描一次数据库
+        """
+        await self.index.ensure(self._query_database, self.notion_database_id)
 
-    def compare(self, l, r):
-        if (l["properties"]["标记状态"]["select"]["name"] != r["properties"]["标记状态"]["select"]["name"]):
-            return False
+    async def check_exist(self, data):
+        """
+        通过本地索引判断条目是否已存在，索引未建立时先分页扫描一次数据库
+        :return: (是否存在, page_id)
+        """
+        await self.ensure_index()
+        entry = self.index.get(data["subject"]["url"])
+        return entry is not None, entry["page_id"] if entry is not None else None
 
-        l_datetime = self._parse_datetime(l["properties"]["标记时间"]["date"])
-        r_datetime = self._parse_datetime(r["properties"]["标记时间"]["date"])
-        if (l_datetime != r_datetime):
-            return False
-        l_rating = l["properties"].get("个人评分", None)
-        r_rating = r["properties"].get("个人评分", None)
-        if l_rating is not None and r_rating is not None:
-            return l_rating["select"]["name"] == r_rating["select"]["name"]
-        elif l_rating is not None:
-            l_rating = l_rating["select"]
-            return l_rating == r_rating
-        elif r_rating is not None:
-            r_rating = r_rating["select"]
-            return l_rating == r_rating
-        l_tags = sorted([tag["name"] for tag in l['properties']['类型']['multi_select']])
-        r_tags = sorted([tag["name"] for tag in r['properties']['类型']['multi_select']])
-        if collections.Counter(l_tags) != collections.Counter(r_tags):
+    async def _write(self, request, description, endpoint):
+        if self.writer is None:
+            return await self.retrier.call(endpoint, request, description)
+        return await self.writer.submit(request, description, endpoint)
+
+    async def create_item(self, item, body=None, fingerprint=None):
+        """
+        :param fingerprint: 给出 body 时由调用者给出对应的同步指纹
+        """
+        if body is None:
+            values = self.schema.values(item)
+            body = make_page_body(self.notion_database_id, self.schema.build(values))
+            fingerprint = self.schema.fingerprint(values)
+        if fingerprint is not None:
+            body = {**body, "properties": await self._with_fingerprint(body["properties"], fingerprint)}
+        try:
+            resp = await self._write(lambda: self._request(self.notion.pages.create, "pages.create", **body),
+                                     f"创建{self.media_name} {item['subject']['title']}",
+                                     "pages.create")
+        except Exception as err:
+            logging.error(f"创建{self.media_name} {item['subject']['title']} 失败:{err}")
             return False
+        self.index.set(item["subject"]["url"], resp["id"], body["properties"], fingerprint)
         return True
 
-    def sync(self, data):
-        exist, page_id = self.check_exist(data)
-        body = self.construct_data(data)
-        if exist:
-            try:
-                notion_record = self.notion.pages.retrieve(page_id=page_id)
-            except APIResponseError as err:
-                logging.error(f"查询书籍{data['subject']['title']}失败:{err}")
-                return
-            if not self.compare(notion_record, body):
-                self.update_item(page_id, data)
-                logging.info(f"更新书籍 {data['subject']['title']}")
-            else:
-                logging.info(f"书籍 {data['subject']['title']} 已存在")
-        else:
-            self.create_item(data)
-            logging.info(f"创建书籍 {data['subject']['title']}")
+    async def update_item(self, page_id, item, properties=None, fingerprint=None):
+        """
+        更新页面，properties 为 None 时写入全部属性，否则只发送给定的属性
 
+        页面已被删除时用 item 重新创建，item 需要已合并详情页，否则重建的页面缺少详情页中的属性。
 
-class NotionMovieDatabase(NotionDatabase):
-    def __init__(self, notion_token, notion_database_id):
-        super(NotionMovieDatabase, self).__init__(notion_token, notion_database_id)
-        self.movie_status_name_dict = {
-            "done": "看完",
-            "doing": "在看",
-            "mark": "想看",
-        }
-    
-    def construct_data(self, data):
-        body = {
-            "parent": {
-                "type": "database_id",
-                "database_id": self.notion_database_id
-            },
-            "properties": {
-                "名字": {
-                    "title": [{
-                        "type": "text",
-                        "text": {
-                            "content": data["subject"]["title"]
-                        }
-                    }]
-                },
-                "导演": {
-                    # NOTE: Notion select property can not accept comas
-                    "multi_select": [d for d in data["subject"]["directors"] if d["name"]]
-                }, 
-                # "主演": {
-                #     # notion 最多支持100个选项
-                #     "multi_select": [a for a in data["subject"]["actors"] if a["name"]][:50]
-                # },
-                "类型": {
-                    "multi_select": [
-                        {"name": genre} for genre in data["subject"]["genres"]
-                    ]
-                },
-                # "时间": {
-                #     "select": {
-                #         "name": data["subject"]["pubdate"][0][:4] if data["subject"]["pubdate"] else ""
-                #     },
-                # },
-                "标记状态": {
-                    "select": {
-                        "name": self.movie_status_name_dict[data["status"]],
-                    }
-                }, 
-                "标记时间": {
-                    "date": {
-                        "end": None,
-                        "start": make_iso_datetime_str(data["create_time"]),
-                        # "time_zone": "Asia/Shanghai"
-                    },
-                },
-                "封面": {
-                    "files": [{
-                        "type": "external",
-                        "name": data["subject"]["cover_url"][-15:],
-                        "external": {
-                            "url": data["subject"]["cover_url"]
-                        }
-                    }]
-                },
-                "豆瓣链接": {
-                    "url": data["subject"]["url"]
-                }
-            }
-        }
-
-        if 'actors' in data['subject'] and data['subject']['actors']:
-            body["properties"].update({
-                "主演": {
-                    "multi_select": [
-                        # NOTE: Notion select property can not accept comas
-                        {"name": actor["name"].replace(',', '')} for actor in data["subject"]["actors"]
-                    ]
-                },
-            })
-
-        if 'pubdate' in data['subject'] and data['subject']['pubdate']:
-            body["properties"].update({
-                "时间": {
-                    "select": {
-                        "name": data['subject']['pubdate'][0][:4],
-                    }
-                },
-            })
-
-        if 'screenwriter' in data['subject'] and data['subject']['screenwriter']:
-            body["properties"].update({
-                "编剧": {
-                    "multi_select": [
-                        # NOTE: Notion select property can not accept comas
-                        {"name": writer.replace(',', '')} for writer in data["subject"]["screenwriter"]
-                    ]
-                }
-            })
-        
-        if 'c_or_r' in data['subject'] and data['subject']['c_or_r']:
-            body["properties"].update({
-                "国家地区": {
-                    "multi_select": [
-                        # NOTE: Notion select property can not accept comas
-                        {"name": c_or_r.replace(',', '')} for c_or_r in data["subject"]["c_or_r"]
-                    ]
-                },
-            })
-        
-        if 'imdb' in data['subject'] and data['subject']['imdb']:
-            imdb = data['subject']['imdb']
-            body["properties"].update({
-                "IMDb": {
-                    "url": f"https://www.imdb.com/title/{imdb}"
-                },
-            })
-
-        if 'movie_type' in data['subject'] and data['subject']['movie_type']:
-            body["properties"].update({
-                "分类": {
-                    "select": {
-                        "name": data['subject']['movie_categories'],
-                    }
-                },
-            })
-        
-        if 'related_intro' in data['subject'] and data['subject']['related_intro']:
-            body["properties"].update({
-                "简介": {
-                    "rich_text": [{
-                        "type": "text",
-                        "text": {
-                            "content": data['subject']['related_intro'],
-                        }
-                    }]
-                },
-            })
-
-        if data['rating'] is not None:
-            body["properties"].update({
-                "个人评分": {
-                    "select": {
-                        "name": self.rating_value_name[int(data["rating"]["star_count"])],
-                    },
-                }
-            })
-
-        if len(data["comment"]):
-            body["properties"].update({
-                "短评": {
-                    "rich_text": [
-                        {
-                            "type": "text",
-                            "text": {
-                                "content": data["comment"]
-                            }
-                        }
-                    ]
-                }
-            })
-
-        if len(data["tags"]):
-            body["properties"].update({
-                "类型": {
-                    "multi_select": [
-                        {"name": tag} for tag in data["tags"]
-                    ]
-                }
-            })
-
-        if data["subject"]["rating"]:
-            body["properties"].update({
-                "评分": {
-                    "number": data["subject"]["rating"]["value"],
-                }
-            })
-            body["properties"].update({
-                "评分人数": {
-                    "number": data["subject"]["rating"]["count"],
-                }
-            })
-
-        if 'movie_duration' in data['subject'] and data['subject']['movie_duration']:
-            body["properties"].update({
-                "片长": {
-                    "number": int(data['subject']['movie_duration']),
-                }
-            })
-        
-        return body
-
-    def check_exist(self, data):
-        query = {
-            "filter": {
-                "and": [
-                    {
-                        "property": "豆瓣链接",
-                        "url": {
-                            "equals": data["subject"]["url"]
-                        }
-                    }
-                ]
-            }
-        }
-        result = self.notion.databases.query(
-            database_id=self.notion_database_id,
-            filter=query["filter"],
-        )
-        return len(result["results"]) > 0, result["results"][0]["id"] if len(result["results"]) > 0 else None
-        
-    def create_item(self, item):
+        :param fingerprint: 条目的同步指纹，只发送部分属性时由调用者给出
+        """
+        if properties is None:
+            values = self.schema.values(item)
+            properties = self.schema.build(values)
+            fingerprint = self.schema.fingerprint(values)
+        if fingerprint is not None:
+            properties = await self._with_fingerprint(properties, fingerprint)
         try:
-            body = self.construct_data(item)
-            self.notion.pages.create(**body)
+            await self._write(lambda: self._request(self.notion.pages.update, "pages.update",
+                                                  page_id=page_id, properties=properties),
+                              f"更新{self.media_name} {item['subject']['title']}",
+                              "pages.update")
+        except APIResponseError as err:
+            if err.code == APIErrorCode.ObjectNotFound:
+                logging.warning(f"{self.media_name} {item['subject']['title']} 的页面已不存在，重新创建")
+                self.index.remove(item["subject"]["url"])
+                return await self.create_item(item)
+            logging.error(f"更新{self.media_name} {item['subject']['title']} 失败:{err}")
+            return False
         except Exception as err:
-            logging.error(f"创建电影 {item['subject']['title']} 失败:{err}")
+            logging.error(f"更新{self.media_name} {item['subject']['title']} 失败:{err}")
+            return False
+        self.index.merge(item["subject"]["url"], page_id, properties, fingerprint)
+        return True
 
-    def update_item(self, page_id, item):
+    async def append_blocks(self, page_id, blocks, description):
+        """
+        向页面末尾追加块，超过单次上限时分批追加
+
+        :return: 是否全部追加成功
+        """
         try:
-            body = self.construct_data(item)
-            self.notion.pages.update(page_id=page_id, **body)
+            for i in range(0, len(blocks), APPEND_LIMIT):
+                chunk = blocks[i:i + APPEND_LIMIT]
+                await self._write(lambda chunk=chunk: self._request(self.notion.blocks.children.append,
+                                                                    "blocks.children.append",
+                                                                    block_id=page_id, children=chunk),
+                                  description,
+                                  "blocks.children.append")
         except Exception as err:
-            logging.error(f"更新电影 {item['subject']['title']} 失败:{err}")
-
-    def _parse_datetime(self, date_dict):
-        raw_datetime = datetime.fromisoformat(date_dict['start'])
-        clean_datetime = raw_datetime.replace(tzinfo=timezone(timedelta(hours=8)))
-        return clean_datetime
-
-    def compare(self, l, r):
-        if (l["properties"]["标记状态"]["select"]["name"] != r["properties"]["标记状态"]["select"]["name"]):
-            return False
-        
-        # Douban: 2022-11-23 10:22:58
-        # Notion: 2022-03-18T12:40:00.000+08:00
-        l_datetime = self._parse_datetime(l["properties"]["标记时间"]["date"])
-        r_datetime = self._parse_datetime(r["properties"]["标记时间"]["date"])
-        if (l_datetime != r_datetime):
-            return False
-        l_rating = l["properties"].get("个人评分", None)
-        r_rating = r["properties"].get("个人评分", None)
-        if l_rating is not None and r_rating is not None:
-            return l_rating["select"]["name"] == r_rating["select"]["name"]
-        elif l_rating is not None:
-            l_rating = l_rating["select"]
-            return l_rating == r_rating
-        elif r_rating is not None:
-            r_rating = r_rating["select"]
-            return l_rating == r_rating
-        l_tags = sorted([tag["name"] for tag in l['properties']['类型']['multi_select']])
-        r_tags = sorted([tag["name"] for tag in r['properties']['类型']['multi_select']])
-        if collections.Counter(l_tags) != collections.Counter(r_tags):
+            logging.error(f"{description} 失败:{err}")
             return False
         return True
-    
-    def sync(self, data):
-        exist, page_id = self.check_exist(data)
-        body = self.construct_data(data)
-        if exist:
-            try:
-                notion_record = self.notion.pages.retrieve(page_id=page_id)
-            except APIResponseError as err:
-                logging.error(f"查询电影 {data['subject']['title']} 失败:{err}")
-                return
-            if not self.compare(notion_record, body):
-                self.update_item(page_id, data)
-                logging.info(f"更新电影 {data['subject']['title']}")
-            else:
-                logging.info(f"电影 {data['subject']['title']} 已存在")
-        else:
-            self.create_item(data)
-            logging.info(f"创建电影 {data['subject']['title']}")
+
+    async def sync(self, data):
+        """
+        同步单个条目：同步指纹与上次相同时直接跳过，否则与索引中的属性快照比较，只写入发生变化的属性
+
+        :param data: 已合并详情页的条目；只有列表数据时指纹与创建时不同，详情页中的属性会被当作已删除
+        :return: 是否同步成功
+        """
+        exist, page_id = await self.check_exist(data)
+        values = self.schema.values(data)
+        fingerprint = self.schema.fingerprint(values)
+        title = data['subject']['title']
+        if not exist:
+            body = make_page_body(self.notion_database_id, self.schema.build(values))
+            success = await self.create_item(data, body, fingerprint)
+            if success:
+                logging.info(f"创建{self.media_name} {title}")
+            return success
+
+        entry = self.index.get(data["subject"]["url"])
+        if entry.get("fingerprint") == fingerprint:
+            logging.info(f"{self.media_name} {title} 已存在")
+            return True
+        changed = self.schema.diff(self.schema.build(values), entry["properties"])
+        if not changed:
+            # 没有指纹的旧索引，或只是标签顺序等不影响内容的变化：只在本地记录指纹，不访问 Notion
+            self.index.merge(data["subject"]["url"], page_id, {}, fingerprint)
+            logging.info(f"{self.media_name} {title} 已存在")
+            return True
+        success = await self.update_item(page_id, data, changed, fingerprint)
+        if success:
+            logging.info(f"更新{self.media_name} {title}: {', '.join(changed)}")
+        return success
+
+
+class NotionBookDatabase(NotionDatabase):
+    media_name = "书籍"
+    schema = BOOK_SCHEMA
+
+
+class NotionMovieDatabase(NotionDatabase):
+    media_name = "电影"
+    schema = MOVIE_SCHEMA
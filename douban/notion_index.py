@@ -0,0 +1,227 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+
+URL_PROPERTY = "豆瓣链接"
+# 保存同步指纹的文本属性，见 douban.schema.Schema.fingerprint；可以在 Notion 的视图中隐藏
+FINGERPRINT_PROPERTY = "同步指纹"
+
+
+def _plain_text(items):
+    return "".join(
+        item.get("text", {}).get("content", item.get("plain_text", "")) for item in items or [])
+
+
+def _normalize_date(date_dict):
+    if not date_dict or not date_dict.get("start"):
+        return None
+    # Douban: 2022-11-23T10:22:58+08:00
+    # Notion: 2022-11-23T10:22:58.000+08:00
+    raw_datetime = datetime.fromisoformat(date_dict["start"])
+    if raw_datetime.tzinfo is None:
+        raw_datetime = raw_datetime.replace(tzinfo=timezone(timedelta(hours=8)))
+    clean_datetime = raw_datetime.astimezone(timezone(timedelta(hours=8)))
+    return clean_datetime.replace(microsecond=0).isoformat()
+
+
+def _files_urls(files):
+    return [f.get("external", f.get("file", {})).get("url") for f in files or []]
+
+
+# Notion 属性类型 -> 把该类型的属性值转换为可比较的简单值
+PROPERTY_NORMALIZERS = {
+    "title": lambda prop: _plain_text(prop["title"]),
+    "rich_text": lambda prop: _plain_text(prop["rich_text"]),
+    "select": lambda prop: prop["select"]["name"] if prop["select"] else None,
+    "multi_select": lambda prop: sorted(option["name"] for option in prop["multi_select"] or []),
+    "number": lambda prop: float(prop["number"]) if prop["number"] is not None else None,
+    "date": lambda prop: _normalize_date(prop["date"]),
+    "url": lambda prop: prop["url"],
+    "files": lambda prop: _files_urls(prop["files"]),
+}
+
+
+def property_type(prop):
+    """
+    属性的类型；Notion 返回的属性带有 type 字段，请求体中的属性只有值所在的键
+    """
+    if prop.get("type") in PROPERTY_NORMALIZERS:
+        return prop["type"]
+    return next((key for key in PROPERTY_NORMALIZERS if key in prop), None)
+
+
+def normalize_property(prop, prop_type=None):
+    """
+    将请求体或Notion返回的属性值统一为可比较的简单值
+
+    :param prop: 属性字典, 例如 {"select": {"name": "读过"}}
+    :param prop_type: 属性类型，已知时（例如来自 douban.schema）不需要再判断
+    :return: 简单值, 空值统一为 None
+    """
+    if prop_type is None or prop_type not in prop:
+        prop_type = property_type(prop)
+    value = PROPERTY_NORMALIZERS[prop_type](prop) if prop_type is not None else None
+    if value in ("", []):
+        value = None
+    return value
+
+
+def normalize_properties(properties):
+    """
+    规范化整页属性，去掉空值
+    """
+    normalized = {}
+    for name, prop in properties.items():
+        value = normalize_property(prop)
+        if value is not None:
+            normalized[name] = value
+    return normalized
+
+
+class NotionURLIndex(object):
+    """
+    豆瓣链接 -> Notion page_id 的本地索引
+
+    首次使用时分页扫描整个数据库建立索引，之后在创建、更新页面时增量维护。
+    每个链接同时保存规范化后的属性快照，用来在本地计算需要更新的属性，
+    以及上次写入时的同步指纹，指纹相同的条目不需要比较属性。
+    索引以 JSON lines 的形式持久化，每次变更只追加一行，进程中途退出也不会丢失，
+    save() 时再压缩为每个链接一行。
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.ready = False
+        self._lock = asyncio.Lock()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.get("removed"):
+                        entries.pop(record["url"], None)
+                    else:
+                        entries[record["url"]] = {
+                            "page_id": record["page_id"],
+                            "properties": record.get("properties", {}),
+                            "fingerprint": record.get("fingerprint"),
+                        }
+        except (OSError, ValueError, KeyError) as err:
+            logging.warning(f"读取索引 {self.path} 失败，将重新建立: {err}")
+            return False
+        self.entries = entries
+        self.ready = True
+        return True
+
+    def save(self):
+        # 本次运行没有加载过索引时不能覆盖已有的文件
+        if self.path is None or not self.ready:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for url, entry in self.entries.items():
+                f.write(json.dumps({"url": url, **entry}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, record):
+        if self.path is None or not self.ready:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def build(self, query_database, database_id, page_size=100):
+        """
+        分页扫描数据库，建立完整索引
+
+        :param query_database: 查询数据库的协程函数，参数同 AsyncClient.databases.query
+        :param database_id: 数据库ID
+        :param page_size: 每次查询的条目数，Notion 最大为100
+        """
+        entries = {}
+        query = {"database_id": database_id, "page_size": page_size}
+        while True:
+            result = await query_database(**query)
+            for page in result["results"]:
+                self._add_page(entries, page)
+            if not result.get("has_more"):
+                break
+            query["start_cursor"] = result["next_cursor"]
+        self.entries = entries
+        self.ready = True
+        logging.info(f"数据库 {database_id} 索引建立完成，共 {len(entries)} 条")
+        self.save()
+
+    async def ensure(self, query_database, database_id):
+        if self.ready:
+            return
+        async with self._lock:
+            if self.ready or self.load():
+                return
+            await self.build(query_database, database_id)
+
+    @staticmethod
+    def _make_entry(page_id, snapshot, fingerprint=None):
+        # 写入 Notion 的指纹不属于快照，扫描数据库时从页面中取出
+        stored = snapshot.pop(FINGERPRINT_PROPERTY, None)
+        return {
+            "page_id": page_id,
+            "properties": snapshot,
+            "fingerprint": fingerprint or stored,
+        }
+
+    def _add_page(self, entries, page):
+        url_prop = page["properties"].get(URL_PROPERTY)
+        if not url_prop or not url_prop.get("url"):
+            return
+        entries[url_prop["url"]] = self._make_entry(page["id"], normalize_properties(page["properties"]))
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def _put(self, url, entry):
+        if self.entries.get(url) == entry:
+            return
+        self.entries[url] = entry
+        self._append({"url": url, **entry})
+
+    def set(self, url, page_id, properties, fingerprint=None):
+        """
+        记录整页属性，用于新建页面之后
+
+        :param fingerprint: 写入的属性的同步指纹
+        """
+        self._put(url, self._make_entry(page_id, normalize_properties(properties), fingerprint))
+
+    def merge(self, url, page_id, properties, fingerprint=None):
+        """
+        将部分更新的属性合并进已有快照
+        """
+        entry = self.entries.get(url)
+        snapshot = dict(entry["properties"]) if entry is not None else {}
+        for name, prop in properties.items():
+            value = normalize_property(prop)
+            if value is None:
+                snapshot.pop(name, None)
+            else:
+                snapshot[name] = value
+        self._put(url, self._make_entry(page_id, snapshot, fingerprint))
+
+    def remove(self, url):
+        if self.entries.pop(url, None) is not None:
+            self._append({"url": url, "removed": True})
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
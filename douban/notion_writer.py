@@ -0,0 +1,84 @@
+import asyncio
+import httpx
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from douban.retry import RETRY, FAILURE, Retrier, RetryPolicy, parse_retry_after
+
+# 409 为并发写入冲突，429 为限流，都不代表接口故障
+THROTTLED_STATUS = {409, 429}
+FAILED_STATUS = {500, 502, 503, 504}
+
+
+def classify_notion_error(err):
+    """
+    Notion 请求错误的分类，见 douban.retry.Retrier
+    """
+    if isinstance(err, HTTPResponseError):
+        if err.status in THROTTLED_STATUS:
+            return RETRY, parse_retry_after(err.headers.get("retry-after"))
+        if err.status in FAILED_STATUS:
+            return FAILURE, None
+        return None, None
+    if isinstance(err, (RequestTimeoutError, httpx.TransportError)):
+        return FAILURE, None
+    return None, None
+
+
+class NotionWriter(object):
+    """
+    Notion 写入队列
+
+    所有创建、更新请求放入同一个队列，由固定数量的 worker 发出，
+    遇到限流、服务端错误或网络错误时经过 Retrier 退避重试。
+
+    :param workers: 并发写入的 worker 数
+    :param max_retries: 每个请求的最大重试次数，给出 retrier 时不使用
+    :param retry_backoff: 第一次重试前等待的秒数，之后每次翻倍，给出 retrier 时不使用
+    :param queue_size: 队列长度上限，0 表示不限制
+    :param retrier: 与读请求共用的 douban.retry.Retrier
+    """
+    def __init__(self, workers=3, max_retries=3, retry_backoff=1.0, queue_size=0, retrier=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        if retrier is None:
+            retrier = Retrier(classify_notion_error, RetryPolicy(max_retries=max_retries, base_delay=retry_backoff))
+        self.retrier = retrier
+        self._queue = None
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, request, description, endpoint="pages"):
+        """
+        提交一个写入请求并等待结果
+
+        :param request: 无参数的协程函数，每次重试都会重新调用
+        :param description: 用于日志的描述
+        :param endpoint: 接口名称，用于按接口熔断
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, description, endpoint, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            request, description, endpoint, future = await self._queue.get()
+            try:
+                result = await self.retrier.call(endpoint, request, description)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as err:
+                if not future.done():
+                    future.set_exception(err)
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
@@ -0,0 +1,79 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from douban.html_parser import get_parser_backend, LxmlBackend
+
+
+class DetailParserPool(object):
+    """
+    详情页解析池
+
+    获取阶段把 html 放入有界队列，由 worker 交给进程池或线程池解析，避免解析阻塞事件循环；
+    队列满时获取阶段会等待，网络和 CPU 可以同时保持忙碌。
+
+    :param executor: process 进程池；thread 线程池（适合会释放 GIL 的 lxml）；
+                     inline 在事件循环中直接解析；auto 根据解析后端选择
+    :param workers: 进程/线程数，默认为 CPU 核数
+    :param queue_size: 等待解析的页面数上限，默认为 workers 的两倍
+    :param backend: 解析后端名称，见 douban.html_parser.PARSER_BACKENDS
+    """
+    def __init__(self, executor="auto", workers=None, queue_size=None, backend="auto"):
+        if executor == "auto":
+            executor = "thread" if get_parser_backend(backend).name == LxmlBackend.name else "process"
+        if executor not in ("process", "thread", "inline"):
+            raise ValueError(f"未知的解析执行器 {executor}")
+        self.executor_type = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size or self.workers * 2
+        self.backend = backend
+        self._executor = None
+        self._queue = None
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self._queue is not None:
+            return
+        if self.executor_type == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self.executor_type == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="douban-parser")
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def parse(self, parse_func, html):
+        """
+        解析一个页面
+
+        :param parse_func: 模块级的解析函数，签名为 parse_func(html, backend)
+        :param html: 页面 html
+        """
+        if self.executor_type == "inline":
+            return parse_func(html, self.backend)
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((parse_func, html, future))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            parse_func, html, future = await self._queue.get()
+            try:
+                result = await loop.run_in_executor(self._executor, parse_func, html, self.backend)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as err:
+                if not future.done():
+                    future.set_exception(err)
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,107 @@
+import os
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+import contextlib
+from douban.lazy_import import lazy_import
+
+pyinstrument = lazy_import("pyinstrument", optional=True)
+
+PROFILE_MODES = ["cprofile", "pyinstrument", "tracemalloc"]
+
+
+def _artifact_path(output_dir, name, suffix):
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, f"{name}-profile-{time.strftime('%Y%m%d-%H%M%S')}{suffix}")
+
+
+@contextlib.contextmanager
+def _cprofile(output_dir, name, top):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = _artifact_path(output_dir, name, ".prof")
+        profiler.dump_stats(path)
+        with open(path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+        logging.info(f"cProfile 结果已保存到 {path}，可用 snakeviz 或 python -m pstats 查看")
+
+
+@contextlib.contextmanager
+def _pyinstrument(output_dir, name, top):
+    if pyinstrument is None:
+        raise ValueError("pyinstrument 模式需要先安装 pyinstrument")
+    profiler = pyinstrument.Profiler(async_mode="enabled")
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        path = _artifact_path(output_dir, name, ".html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+        with open(path[:-len(".html")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(profiler.output_text(unicode=True))
+        logging.info(f"pyinstrument 结果已保存到 {path}")
+
+
+@contextlib.contextmanager
+def _tracemalloc(output_dir, name, top):
+    tracemalloc.start(25)
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        path = _artifact_path(output_dir, name, ".tracemalloc")
+        snapshot.dump(path)
+        lines = [f"当前 {current / 2 ** 20:.1f} MiB，峰值 {peak / 2 ** 20:.1f} MiB", "", "按代码行:"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:top]]
+        lines += ["", "按调用栈:"]
+        for stat in snapshot.statistics("traceback")[:min(top, 10)]:
+            lines.append(str(stat))
+            lines += ["    " + line for line in stat.traceback.format(limit=10)]
+        with open(path[:-len(".tracemalloc")] + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        logging.info(f"tracemalloc: 当前 {current / 2 ** 20:.1f} MiB，峰值 {peak / 2 ** 20:.1f} MiB，"
+                     f"分配最多的位置:\n" + "\n".join(lines[3:3 + 10]))
+        logging.info(f"tracemalloc 快照已保存到 {path}，可用 tracemalloc.Snapshot.load 比较不同运行")
+
+
+_PROFILERS = {
+    "cprofile": _cprofile,
+    "pyinstrument": _pyinstrument,
+    "tracemalloc": _tracemalloc,
+}
+
+
+def profile(mode, output_dir=".", name="sync", top=30):
+    """
+    在 with 块内运行分析器，结束时把结果写到 output_dir
+
+    详情页默认在进程池中解析，cprofile 和 pyinstrument 只能看到主进程，
+    需要分析解析耗时时配合 --parse-executor inline 使用。
+
+    :param mode: cprofile（.prof 和按累计/自身耗时排序的 .txt）、pyinstrument（.html 和 .txt，需要安装 pyinstrument）
+                 或 tracemalloc（快照文件和分配最多的位置）；None 时不做分析
+    :param output_dir: 结果文件所在的目录
+    :param name: 结果文件名前缀
+    :param top: 报告中列出的条目数
+    """
+    if mode is None:
+        return contextlib.nullcontext()
+    if mode not in _PROFILERS:
+        raise ValueError(f"不支持的分析模式: {mode}，可选 {', '.join(PROFILE_MODES)}")
+    return _PROFILERS[mode](output_dir, name, top)
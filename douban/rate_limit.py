@@ -0,0 +1,155 @@
+import time
+import asyncio
+import collections
+
+
+class RateLimiter(object):
+    """
+    限流器接口，每次真正发出请求前调用 acquire()
+    """
+    def __init__(self):
+        self._paused_until = 0.0
+        # 累计等待时间（秒），并发请求的等待时间分别计入
+        self.waited = 0.0
+
+    async def acquire(self, tokens=1):
+        started = time.monotonic()
+        try:
+            await self._acquire(tokens)
+        finally:
+            self.waited += time.monotonic() - started
+
+    async def _acquire(self, tokens):
+        raise NotImplementedError
+
+    def pause(self, seconds):
+        """
+        上游要求退避（429 + Retry-After）时暂停放行，seconds 秒后恢复
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _wait_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class UnlimitedRateLimiter(RateLimiter):
+    """
+    不限流，只在上游要求退避时暂停
+    """
+    async def _acquire(self, tokens):
+        await self._wait_pause()
+
+
+class TokenBucket(RateLimiter):
+    """
+    令牌桶限流器
+
+    :param rate: 每秒补充的令牌数，即长期平均请求速率
+    :param capacity: 桶容量，即允许的突发请求数
+    """
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        super(TokenBucket, self).__init__()
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def _acquire(self, tokens):
+        # 持锁等待，保证按到达顺序放行
+        async with self._lock:
+            await self._wait_pause()
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class FairShare(object):
+    """
+    多个账号共用一个上游的限流器，有多个账号在等待时按账号轮流放行
+
+    每个账号通过 tenant() 得到自己的限流器，某个账号一次排入大量请求时，
+    其他账号的请求不需要排在它们后面，而是交替获得令牌。
+
+    :param limiter: 共用的限流器，决定该上游的总请求速率
+    :param shared_pause: 为 True 时任一账号收到 Retry-After 会暂停所有账号（豆瓣按 IP 限流）；
+                         为 False 时只暂停该账号（Notion 按集成的令牌限流）
+    """
+    def __init__(self, limiter, shared_pause=True):
+        self.limiter = limiter
+        self.shared_pause = shared_pause
+        self._queues = collections.OrderedDict()
+        self._dispatcher = None
+
+    def tenant(self, name):
+        return FairShareLimiter(self, name)
+
+    def _submit(self, name, tokens):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queues.setdefault(name, collections.deque()).append((future, tokens))
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._dispatcher = loop.create_task(self._dispatch())
+        return future
+
+    async def _dispatch(self):
+        try:
+            while self._queues:
+                # 轮到的账号移到队尾，没有等待的请求时移出队列
+                name, queue = next(iter(self._queues.items()))
+                self._queues.move_to_end(name)
+                future, tokens = queue.popleft()
+                if not queue:
+                    del self._queues[name]
+                if future.done():
+                    continue
+                await self.limiter.acquire(tokens)
+                if not future.done():
+                    future.set_result(None)
+        except BaseException:
+            for queue in self._queues.values():
+                for future, _ in queue:
+                    future.cancel()
+            self._queues.clear()
+            raise
+
+
+class FairShareLimiter(RateLimiter):
+    """
+    FairShare 中单个账号的限流器，waited 只统计该账号的等待时间
+    """
+    def __init__(self, share, name):
+        super(FairShareLimiter, self).__init__()
+        self.share = share
+        self.name = name
+
+    def pause(self, seconds):
+        if self.share.shared_pause:
+            self.share.limiter.pause(seconds)
+        else:
+            super(FairShareLimiter, self).pause(seconds)
+
+    async def _acquire(self, tokens):
+        await self._wait_pause()
+        await self.share._submit(self.name, tokens)
+
+
+def make_rate_limiter(rate, burst=1):
+    """
+    根据配置创建限流器，rate 不大于0 时不限流
+    """
+    if rate is None or rate <= 0:
+        return UnlimitedRateLimiter()
+    return TokenBucket(rate, burst)
@@ -0,0 +1,147 @@
+import os
+import asyncio
+import logging
+from douban.checkpoint import CheckpointStore
+from douban.metrics import Metrics
+from douban.notion_writer import NotionWriter, classify_notion_error
+from douban.rate_limit import TokenBucket
+from douban.retry import Retrier
+from douban.snapshot import load_latest, open_snapshot
+from douban.notion_database import NotionBookDatabase, NotionMovieDatabase
+
+
+class NotionRestore(object):
+    """
+    从 --export 导出的本地快照重建 Notion 数据库，不访问豆瓣
+
+    快照中的记录已经包含详情页解析结果，直接经写入队列并发创建页面，速率只受 Notion 限流器限制。
+    本地索引中已有的链接直接跳过；每创建一个页面都会追加到索引，中断后重新运行即可继续。
+    恢复的条目同时写入检查点指纹，之后的 --sync 可以据此发现修改。
+
+    :param path: 快照路径，见 douban.snapshot.open_snapshot
+    :param notion_concurrency: 并发写入的 worker 数
+    :param notion_rate_limiter: Notion 限流器，默认 3 次/秒
+    """
+    def __init__(self,
+                 token: str,
+                 movie_database_id: str,
+                 book_database_id: str,
+                 path: str,
+                 state_dir: str = None,
+                 notion_concurrency: int = 3,
+                 notion_rate_limiter=None,
+                 notion_base_url: str = None,
+                 metrics: Metrics = None) -> None:
+        if notion_rate_limiter is None:
+            notion_rate_limiter = TokenBucket(rate=3, capacity=3)
+        self.metrics = metrics or Metrics()
+        self.notion_rate_limiter = notion_rate_limiter
+        self.state_dir = state_dir
+        self.path = path
+        notion_retrier = Retrier(classify_notion_error, rate_limiter=notion_rate_limiter,
+                                 metrics=self.metrics, upstream="notion")
+        self.writer = NotionWriter(workers=notion_concurrency, retrier=notion_retrier)
+        self.movie_db = NotionMovieDatabase(
+            notion_token=token,
+            notion_database_id=movie_database_id,
+            index_path=self._state_path(f"notion_index_{movie_database_id}.jsonl"),
+            rate_limiter=notion_rate_limiter,
+            writer=self.writer,
+            base_url=notion_base_url,
+            retrier=notion_retrier,
+            metrics=self.metrics)
+        self.book_db = NotionBookDatabase(
+            notion_token=token,
+            notion_database_id=book_database_id,
+            index_path=self._state_path(f"notion_index_{book_database_id}.jsonl"),
+            rate_limiter=notion_rate_limiter,
+            writer=self.writer,
+            base_url=notion_base_url,
+            retrier=notion_retrier,
+            metrics=self.metrics)
+        self.checkpoint = CheckpointStore(path=self._state_path("checkpoint.sqlite3"))
+        self.created = 0
+        self.failed_items = []
+
+    def _state_path(self, filename):
+        if self.state_dir is None:
+            return None
+        return os.path.join(self.state_dir, filename)
+
+    async def close(self):
+        await self.writer.close()
+        await self.movie_db.close()
+        await self.book_db.close()
+        self.checkpoint.close()
+
+    def restore(self):
+        """
+        恢复入口，阻塞直到恢复完成
+
+        :return: 是否全部恢复成功
+        """
+        async def _run():
+            try:
+                return await self.async_restore()
+            finally:
+                await self.close()
+        return asyncio.run(_run())
+
+    async def async_restore(self):
+        snapshot = open_snapshot(self.path)
+        if not os.path.exists(snapshot.path):
+            logging.error(f"快照 {snapshot.path} 不存在")
+            return False
+        records = load_latest(snapshot)
+        await asyncio.gather(self.movie_db.ensure_index(), self.book_db.ensure_index())
+
+        todo = []
+        for url, record in records.items():
+            db = self._database(record)
+            if db is None:
+                logging.warning(f"跳过未知类型的条目 {url}")
+            elif url not in db.index:
+                todo.append((db, record))
+            else:
+                self.metrics.inc("unchanged_items_total", interest_type=record["interest_type"])
+        logging.info(f"快照中共 {len(records)} 个条目，{len(records) - len(todo)} 个已在 Notion 中，需要创建 {len(todo)} 个")
+
+        self.created = 0
+        self.failed_items = []
+        try:
+            await asyncio.gather(*[self.restore_item(db, record, len(todo)) for db, record in todo])
+        finally:
+            self.movie_db.index.save()
+            self.book_db.index.save()
+
+        logging.info(f"从 {snapshot.path} 恢复 {self.created} 个条目")
+        self.metrics.record_rate_limiter("notion", self.notion_rate_limiter)
+        if self.failed_items:
+            logging.error(f"{len(self.failed_items)} 个条目恢复失败，重新运行会继续恢复: {', '.join(self.failed_items)}")
+        return not self.failed_items
+
+    def _database(self, record):
+        if record.get("interest_type") == "movie":
+            return self.movie_db
+        if record.get("interest_type") == "book":
+            return self.book_db
+        return None
+
+    async def restore_item(self, db, record, total):
+        url = record["subject"]["url"]
+        try:
+            with self.metrics.timer("stage_seconds", stage="notion"):
+                success = await db.create_item(record)
+        except Exception as err:
+            logging.error(f"恢复 {url} 遇到错误: {err}")
+            success = False
+        self.metrics.inc("items_total", interest_type=record["interest_type"],
+                         result="restored" if success else "failed")
+        if not success:
+            self.failed_items.append(url)
+            return False
+        self.checkpoint.set_fingerprints({url: record["fingerprint"]})
+        self.created += 1
+        if self.created % 100 == 0:
+            logging.info(f"已恢复 {self.created}/{total} 个条目")
+        return True
@@ -0,0 +1,196 @@
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from douban.metrics import Metrics
+
+# 错误分类：RETRY 表示可以重试且上游本身正常（限流、冲突），FAILURE 表示上游出错（5xx、网络错误）
+RETRY = "retry"
+FAILURE = "failure"
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头，支持秒数和 HTTP 日期两种格式
+
+    :return: 需要等待的秒数，无法解析时为 None
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitOpenError(Exception):
+    """
+    熔断器打开时快速失败
+    """
+    def __init__(self, endpoint, retry_in):
+        super(CircuitOpenError, self).__init__(f"{endpoint} 连续失败已熔断，{retry_in:.0f}秒后再尝试")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class RetryPolicy(object):
+    """
+    带随机抖动的指数退避
+
+    :param max_retries: 最大重试次数
+    :param base_delay: 第一次重试前的基准等待时间（秒），之后每次翻倍
+    :param max_delay: 单次等待的上限（秒），也用于限制 Retry-After
+    :param jitter: 抖动比例，实际等待时间在 [delay * (1 - jitter), delay] 之间随机，避免并发请求同时重试
+    """
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=60.0, jitter=0.5):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt, retry_after=None):
+        """
+        :param attempt: 已经重试的次数，从0开始
+        :param retry_after: 上游通过 Retry-After 要求的等待时间，给出时优先使用，只在其后增加抖动
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.jitter * self.base_delay)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * (1 - random.uniform(0, self.jitter))
+
+
+class CircuitBreaker(object):
+    """
+    单个接口的熔断器
+
+    连续 failure_threshold 次失败后打开，reset_timeout 秒内的请求直接抛出 CircuitOpenError；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+
+    :param failure_threshold: 打开熔断器的连续失败次数
+    :param reset_timeout: 打开后等待多少秒进入半开状态
+    """
+    def __init__(self, endpoint, failure_threshold=5, reset_timeout=30.0):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def check(self):
+        """
+        请求前调用，熔断器打开时抛出 CircuitOpenError
+        """
+        state = self.state
+        if state == "closed":
+            return
+        now = time.monotonic()
+        if state == "open":
+            raise CircuitOpenError(self.endpoint, self.opened_at + self.reset_timeout - now)
+        # 半开状态只放行一个探测请求；探测请求迟迟没有结果（例如被取消）时允许再次探测
+        if self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout:
+            raise CircuitOpenError(self.endpoint, self._probe_started_at + self.reset_timeout - now)
+        self._probe_started_at = now
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logging.info(f"{self.endpoint} 已恢复")
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        # 探测请求失败，或者关闭状态下连续失败达到阈值
+        if self._probe_started_at is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+            logging.warning(f"{self.endpoint} 连续失败{self.failures}次，熔断{self.reset_timeout:.0f}秒")
+            self.opened_at = time.monotonic()
+            self._probe_started_at = None
+
+
+class Retrier(object):
+    """
+    豆瓣和 Notion 共用的重试层：按接口熔断，失败时按 RetryPolicy 退避后重试
+
+    上游返回 Retry-After 时按其要求等待，并暂停限流器，让同一上游的其他请求也一起退避，
+    而不是各自继续撞上限流。
+
+    :param classify: 错误分类函数，返回 (RETRY | FAILURE | None, retry_after)，None 表示不可重试
+    :param policy: RetryPolicy
+    :param rate_limiter: 该上游的限流器，收到 Retry-After 时暂停
+    :param failure_threshold: 见 CircuitBreaker
+    :param reset_timeout: 见 CircuitBreaker
+    :param metrics: douban.metrics.Metrics，记录重试次数、退避时间和熔断次数
+    :param upstream: 指标中的上游名称，例如 douban、notion
+    """
+    def __init__(self, classify, policy=None, rate_limiter=None, failure_threshold=5, reset_timeout=30.0,
+                 metrics=None, upstream=None):
+        self.classify = classify
+        self.policy = policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics or Metrics()
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+
+    def breaker(self, endpoint):
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+        return self.breakers[endpoint]
+
+    async def call(self, endpoint, request, description=None):
+        """
+        发出请求，必要时重试
+
+        :param endpoint: 接口名称，每个接口单独熔断
+        :param request: 无参数的协程函数，每次重试都会重新调用
+        :param description: 用于日志的描述，默认为接口名称
+        """
+        breaker = self.breaker(endpoint)
+        attempt = 0
+        while True:
+            try:
+                breaker.check()
+            except CircuitOpenError:
+                self.metrics.inc("circuit_open_total", upstream=self.upstream, endpoint=endpoint)
+                raise
+            try:
+                result = await request()
+            except Exception as err:
+                kind, retry_after = self.classify(err)
+                if kind == FAILURE:
+                    breaker.record_failure()
+                else:
+                    # 限流和请求本身的错误都说明接口是可用的
+                    breaker.record_success()
+                if kind is None or attempt >= self.policy.max_retries:
+                    raise
+                delay = self.policy.delay(attempt, retry_after)
+                if retry_after is not None and self.rate_limiter is not None:
+                    self.rate_limiter.pause(retry_after)
+                attempt += 1
+                self.metrics.inc("retries_total", upstream=self.upstream, endpoint=endpoint)
+                self.metrics.inc("retry_sleep_seconds_total", delay, upstream=self.upstream)
+                logging.warning(f"{description or endpoint} 失败，{delay:.1f}秒后第{attempt}次重试: {err}")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
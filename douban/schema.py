@@ -0,0 +1,314 @@
+import re
+import json
+import hashlib
+import collections
+from datetime import datetime, timezone, timedelta
+from douban.constants import MediaType
+from douban.notion_index import FINGERPRINT_PROPERTY, normalize_property
+
+# 一个 Notion 属性：名称、类型、取值函数和建库时的配置
+# value(item) 从 interests 接口返回的条目（subject 已合并详情页解析结果）中取出原始值，
+# 返回 None、"" 或 [] 时不写入该属性；value 为 None 的属性只在建库时创建，同步时不写入
+Field = collections.namedtuple("Field", ["name", "type", "value", "config"])
+Field.__new__.__defaults__ = (None, None)
+
+RATING_NAMES = ['', '⭐', '⭐⭐', '⭐⭐⭐', '⭐⭐⭐⭐', '⭐⭐⭐⭐⭐']
+
+
+def make_iso_datetime_str(douban_datetime):
+    """
+    将豆瓣时间转换为ISO时间
+    :param douban_datetime: 豆瓣时间
+    :return: ISO时间
+    """
+    raw_datetime = datetime.fromisoformat(douban_datetime)
+    clean_datetime = raw_datetime.replace(tzinfo=timezone(timedelta(hours=8)))
+    return clean_datetime.isoformat()
+
+
+# 生成函数的格式发生变化时加一，使已同步条目的指纹全部失效
+FINGERPRINT_VERSION = 1
+_FINGERPRINT_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False,
+                                        default=str)
+
+
+def make_page_body(database_id, properties):
+    return {
+        "parent": {"type": "database_id", "database_id": database_id},
+        "properties": properties,
+    }
+
+
+def _text(value):
+    return [{"type": "text", "text": {"content": value}}]
+
+
+# 属性类型 -> 由原始值生成请求体中的属性
+PROPERTY_BUILDERS = {
+    "title": lambda value: {"title": _text(value)},
+    "rich_text": lambda value: {"rich_text": _text(value)},
+    "select": lambda value: {"select": {"name": value}},
+    # NOTE: Notion select property can not accept comas
+    "multi_select": lambda value: {"multi_select": [{"name": name.replace(',', '')} for name in value]},
+    "number": lambda value: {"number": value},
+    "date": lambda value: {"date": {"end": None, "start": value}},
+    "url": lambda value: {"url": value},
+    # (文件名, 链接)
+    "files": lambda value: {"files": [{"type": "external", "name": value[0], "external": {"url": value[1]}}]},
+}
+
+# 属性类型 -> 清空该属性的请求体
+EMPTY_PROPERTIES = {
+    "title": {"title": []},
+    "rich_text": {"rich_text": []},
+    "select": {"select": None},
+    "multi_select": {"multi_select": []},
+    "number": {"number": None},
+    "date": {"date": None},
+    "url": {"url": None},
+    "files": {"files": []},
+}
+
+
+def _subject(key):
+    return lambda item: item["subject"].get(key)
+
+
+def _names(key):
+    return lambda item: [entry["name"] for entry in item["subject"].get(key) or [] if entry["name"]]
+
+
+def _year(item):
+    pubdate = item["subject"].get("pubdate")
+    return pubdate[0][:4] if pubdate else None
+
+
+def _subject_rating(key):
+    return lambda item: item["subject"]["rating"][key] if item["subject"].get("rating") else None
+
+
+def _cover(name_length):
+    def value(item):
+        url = item["subject"]["cover_url"]
+        return url[-name_length:], url
+    return value
+
+
+def _personal_rating(item):
+    return RATING_NAMES[int(item["rating"]["star_count"])] if item["rating"] is not None else None
+
+
+def _pages(item):
+    pages = item["subject"].get("pages")
+    if not pages:
+        return None
+    # 有些书包括基本小书合订,所以要把页数都加总在一起
+    return sum(int(it) for it in re.sub(r'[^0-9]', ',', pages[0]).split(',') if it)
+
+
+def _int(key):
+    return lambda item: int(item["subject"][key]) if item["subject"].get(key) else None
+
+
+def _imdb(item):
+    imdb = item["subject"].get("imdb")
+    return f"https://www.imdb.com/title/{imdb}" if imdb else None
+
+
+def _movie_categories(item):
+    return item["subject"]["movie_categories"] if item["subject"].get("movie_type") else None
+
+
+def _movie_genres(item):
+    # 有个人标签时用标签代替豆瓣的类型
+    return item["tags"] or item["subject"].get("genres")
+
+
+def _rating_field():
+    return Field("个人评分", "select", _personal_rating,
+                 {"options": [{"name": name, "color": "yellow"} for name in RATING_NAMES[1:]]})
+
+
+def _common_fields(title_name, status_names, cover_name_length):
+    """
+    三种条目共有的属性
+
+    :param status_names: 标记状态 mark / doing / done -> 显示名称
+    :param cover_name_length: 封面文件名取链接末尾的字符数
+    """
+    return [
+        Field(title_name, "title", lambda item: item["subject"]["title"]),
+        Field("封面", "files", _cover(cover_name_length)),
+        Field("标记状态", "select", lambda item: status_names[item["status"]]),
+        _rating_field(),
+        Field("评分", "number", _subject_rating("value")),
+        Field("评分人数", "number", _subject_rating("count")),
+        Field("短评", "rich_text", lambda item: item["comment"]),
+        Field("标记时间", "date", lambda item: make_iso_datetime_str(item["create_time"])),
+        Field("豆瓣链接", "url", _subject("url")),
+    ]
+
+
+class Schema(object):
+    """
+    豆瓣条目到 Notion 属性的映射，建库、生成请求体、比较和计算最小更新共用同一份定义
+
+    字段在创建时编译为 (名称, 取值函数) 的列表和 名称 -> 生成函数 的字典，每个条目只需遍历一次。
+    每个数据库还会额外创建保存同步指纹的文本属性，见 fingerprint()。
+
+    :param media_type: douban.constants.MediaType 的值
+    :param title: 建库时的数据库标题
+    :param icon: 建库时的图标
+    :param fields: Field 列表
+    """
+    def __init__(self, media_type, title, icon, fields):
+        self.media_type = media_type
+        self.title = title
+        self.icon = icon
+        self.fields = {field.name: field for field in fields}
+        self.fields[FINGERPRINT_PROPERTY] = Field(FINGERPRINT_PROPERTY, "rich_text")
+        self._compiled = [(field.name, field.value) for field in fields if field.value is not None]
+        self._builders = {field.name: PROPERTY_BUILDERS[field.type] for field in fields}
+
+    def database_properties(self):
+        """
+        建库时的属性定义
+        """
+        return {field.name: {field.type: field.config or {}} for field in self.fields.values()}
+
+    def database_body(self, page_id):
+        return {
+            "parent": {"type": "page_id", "page_id": f"{page_id}"},
+            "title": _text(self.title),
+            "icon": {"type": "emoji", "emoji": self.icon},
+            "properties": self.database_properties(),
+        }
+
+    def values(self, item):
+        """
+        取出条目中所有同步字段的原始值，值为空的字段不包括在内
+
+        :return: [(名称, 原始值)]
+        """
+        values = []
+        for name, value in self._compiled:
+            raw = value(item)
+            # None、"" 和 [] 不写入，数值0仍然写入
+            if raw or raw == 0:
+                values.append((name, raw))
+        return values
+
+    def build(self, values):
+        """
+        由 values() 的结果生成属性
+        """
+        builders = self._builders
+        return {name: builders[name](raw) for name, raw in values}
+
+    def properties(self, item):
+        """
+        生成条目的属性，值为空的属性不写入
+        """
+        return self.build(self.values(item))
+
+    def page_body(self, database_id, item):
+        return make_page_body(database_id, self.properties(item))
+
+    def fingerprint(self, values):
+        """
+        条目的同步指纹：所有同步字段的原始值的哈希，生成函数是确定的，原始值相同则生成的属性相同
+
+        上次写入的指纹与本次相同时不需要生成和比较属性，也不需要访问 Notion；
+        修改了生成函数的格式时增加 FINGERPRINT_VERSION，所有条目会重新比较一次。
+
+        :param values: values() 的结果
+        """
+        raw = _FINGERPRINT_ENCODER.encode([FINGERPRINT_VERSION, self.media_type, values])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint_property(fingerprint):
+        return {FINGERPRINT_PROPERTY: PROPERTY_BUILDERS["rich_text"](fingerprint)}
+
+    def normalize(self, name, prop):
+        field = self.fields.get(name)
+        if prop is None:
+            return None
+        return normalize_property(prop, field.type if field is not None else None)
+
+    def diff(self, properties, snapshot):
+        """
+        比较待写入的属性与索引中的快照，计算最小更新
+
+        豆瓣上被删除的值（例如清空短评、取消评分）在 properties 中不存在，
+        快照中仍有值时生成清空该属性的请求体。
+
+        :param properties: properties() 生成的属性
+        :param snapshot: 规范化后的属性快照，见 douban.notion_index.NotionURLIndex
+        :return: 需要更新的属性，格式与 properties 相同
+        """
+        changed = {}
+        for name, field in self.fields.items():
+            prop = properties.get(name)
+            if prop is None:
+                if field.value is not None and snapshot.get(name) is not None:
+                    changed[name] = EMPTY_PROPERTIES[field.type]
+            elif self.normalize(name, prop) != snapshot.get(name):
+                changed[name] = prop
+        return changed
+
+    def compare(self, l, r):
+        """
+        比较两个页面（请求体或 Notion 返回的页面）的所有同步属性是否相同
+        """
+        return all(self.normalize(name, l["properties"].get(name)) == self.normalize(name, r["properties"].get(name))
+                   for name, _ in self._compiled)
+
+
+BOOK_SCHEMA = Schema(
+    media_type=MediaType.BOOK.value,
+    title="豆瓣书单库",
+    icon="📚",
+    fields=_common_fields("书名", {"done": "读过", "doing": "在读", "mark": "想读"}, 13) + [
+        Field("作者", "multi_select", _subject("author")),
+        Field("类型", "multi_select", lambda item: item["tags"]),
+        Field("出版社", "multi_select", _subject("press")),
+        Field("出版年份", "select", lambda item: _year(item) or '未知'),
+        Field("ISBN", "number", _int("isbn")),
+        Field("价格", "number", lambda item: item["subject"].get("book_price") or None),
+        Field("页数", "number", _pages),
+    ])
+
+# 类型是豆瓣中的信息，例如 剧情 / 动作 / 科幻 / 犯罪；
+# 分类是个人主观分的：电视剧、电影、动画片（指的是电影）、动漫（剧集）、纪录片（电影和电视剧）
+MOVIE_SCHEMA = Schema(
+    media_type=MediaType.MOVIE.value,
+    title="豆瓣影视库",
+    icon="🎬",
+    fields=_common_fields("名字", {"done": "看完", "doing": "在看", "mark": "想看"}, 15) + [
+        Field("分类", "select", _movie_categories),
+        Field("类型", "multi_select", _movie_genres),
+        Field("主演", "multi_select", _names("actors")),
+        Field("导演", "multi_select", _names("directors")),
+        Field("编剧", "multi_select", _subject("screenwriter")),
+        Field("时间", "select", _year),
+        Field("国家地区", "multi_select", _subject("c_or_r")),
+        Field("简介", "rich_text", _subject("related_intro")),
+        Field("片长", "number", _int("movie_duration")),
+        Field("IMDb", "url", _imdb),
+    ])
+
+# 音乐还没有同步流程，只用于建库；表演者等字段的取值方式确定后补上 value 即可同步
+MUSIC_SCHEMA = Schema(
+    media_type=MediaType.MUSIC.value,
+    title="豆瓣音乐库",
+    icon="🎵",
+    fields=_common_fields("音乐", {"done": "听过", "doing": "在听", "mark": "想听"}, 15) + [
+        Field("表演者", "rich_text"),
+        Field("出版者", "select"),
+        Field("发行时间", "select"),
+        Field("ISRC", "url"),
+        Field("类型", "multi_select", lambda item: item["tags"]),
+    ])
+
+SCHEMAS = {schema.media_type: schema for schema in (BOOK_SCHEMA, MOVIE_SCHEMA, MUSIC_SCHEMA)}
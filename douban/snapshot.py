@@ -0,0 +1,222 @@
+import os
+import gzip
+import json
+import time
+import zlib
+import logging
+from douban.checkpoint import interest_fingerprint
+from douban.lazy_import import lazy_import
+
+# pyarrow 导入较慢（还会导入 numpy），只在读写 Parquet 快照时加载
+pyarrow = lazy_import("pyarrow", "pyarrow.parquet", optional=True)
+
+
+def make_record(interest, interest_type):
+    """
+    快照中的一条记录：interests 接口返回的条目（subject 已合并详情页解析结果），加上类型和指纹
+    """
+    record = dict(interest)
+    record["interest_type"] = interest_type
+    record["fingerprint"] = interest_fingerprint(interest)
+    return record
+
+
+class JSONLSnapshot(object):
+    """
+    gzip 压缩的 JSONL 快照，每行一条记录
+
+    重新运行时以新的 gzip 成员追加到文件末尾，普通的 gzip 工具可以直接读取整个文件。
+    每处理完一批条目调用 flush()，关闭文件结束当前的 gzip 成员，下一批写入新的成员，
+    进程中断时最多丢失最后一批；重新运行时先截掉末尾不完整的成员（或不完整的行）再追加。
+
+    :param path: 文件路径，以 .gz 结尾时压缩
+    """
+    format = "jsonl"
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._truncated = False
+
+    def _open(self, mode):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def __iter__(self):
+        if not os.path.exists(self.path):
+            return
+        with self._open("r") as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            except (EOFError, zlib.error, gzip.BadGzipFile, json.JSONDecodeError):
+                # 上次写入中断，末尾不完整，丢弃
+                logging.warning(f"快照 {self.path} 末尾不完整，已忽略")
+
+    def fingerprints(self):
+        """
+        :return: {链接: 最后写入的指纹}
+        """
+        return {record["subject"]["url"]: record["fingerprint"] for record in self}
+
+    def _complete_length(self):
+        """
+        :return: 文件中完整的部分的长度：最后一个完整的 gzip 成员或最后一个换行符的结尾
+        """
+        with open(self.path, "rb") as f:
+            if not self.path.endswith(".gz"):
+                data = f.read()
+                return data.rfind(b"\n") + 1
+            end = offset = 0
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            while True:
+                chunk = f.read(1 << 16)
+                if not chunk:
+                    return end
+                while chunk:
+                    try:
+                        decompressor.decompress(chunk)
+                    except zlib.error:
+                        return end
+                    if not decompressor.eof:
+                        offset += len(chunk)
+                        break
+                    # 一个成员结束，剩下的数据属于下一个成员
+                    offset += len(chunk) - len(decompressor.unused_data)
+                    end = offset
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def _truncate_incomplete(self):
+        if not os.path.exists(self.path):
+            return
+        length = self._complete_length()
+        if length < os.path.getsize(self.path):
+            logging.warning(f"快照 {self.path} 末尾不完整，已截断")
+            with open(self.path, "r+b") as f:
+                f.truncate(length)
+
+    def write(self, record):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if not self._truncated:
+                self._truncate_incomplete()
+                self._truncated = True
+            self._file = self._open("a")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        """
+        关闭文件，写完的条目成为一个完整的 gzip 成员，下次写入时重新打开
+        """
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSnapshot(object):
+    """
+    Parquet 快照，path 为目录，每 row_group_size 条写成一个完整的 part 文件
+
+    列为 url、interest_type、status、create_time、fingerprint，完整记录以 JSON 保存在 data 列。
+    需要安装 pyarrow。part 文件先写到临时文件再改名，写完一个就可以读取，
+    进程中断时只丢失还没有凑满一个行组的条目，重新运行时它们会被重新导出。
+
+    :param path: 目录路径
+    :param row_group_size: 每个 part 文件（一个行组）的条目数
+    """
+    format = "parquet"
+    COLUMNS = ["url", "interest_type", "status", "create_time", "fingerprint", "data"]
+
+    def __init__(self, path, row_group_size=500):
+        if pyarrow is None:
+            raise ValueError("Parquet 快照需要先安装 pyarrow")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in self.COLUMNS])
+        self._rows = []
+
+    def _parts(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".parquet"))
+
+    def __iter__(self):
+        for part in self._parts():
+            try:
+                table = pyarrow.parquet.read_table(part, columns=["data"])
+            except pyarrow.ArrowInvalid:
+                logging.warning(f"快照 {part} 不完整，已忽略")
+                continue
+            for data in table.column("data").to_pylist():
+                yield json.loads(data)
+
+    def fingerprints(self):
+        """
+        :return: {链接: 最后写入的指纹}，只读取 url 和 fingerprint 两列
+        """
+        fingerprints = {}
+        for part in self._parts():
+            try:
+                table = pyarrow.parquet.read_table(part, columns=["url", "fingerprint"])
+            except pyarrow.ArrowInvalid:
+                continue
+            fingerprints.update(zip(table.column("url").to_pylist(), table.column("fingerprint").to_pylist()))
+        return fingerprints
+
+    def write(self, record):
+        self._rows.append({
+            "url": record["subject"]["url"],
+            "interest_type": record["interest_type"],
+            "status": record["status"],
+            "create_time": record["create_time"],
+            "fingerprint": record["fingerprint"],
+            "data": json.dumps(record, ensure_ascii=False),
+        })
+
+    def flush(self):
+        """
+        缓冲的条目够一个行组时写成一个 part 文件，避免产生大量很小的文件
+        """
+        if len(self._rows) >= self.row_group_size:
+            self._write_part()
+
+    def _write_part(self):
+        if not self._rows:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # 文件名按写入时间排序，读取时后写入的记录覆盖先写入的
+        part = os.path.join(self.path, f"part-{time.time_ns():020d}.parquet")
+        table = pyarrow.Table.from_pylist(self._rows, schema=self.schema)
+        pyarrow.parquet.write_table(table, part + ".tmp", compression="zstd")
+        os.replace(part + ".tmp", part)
+        self._rows = []
+
+    def close(self):
+        self._write_part()
+
+
+def open_snapshot(path):
+    """
+    根据路径选择快照格式：以 .parquet 结尾为 Parquet 目录，否则为 JSONL（.gz 结尾时压缩）
+    """
+    if path.rstrip("/").endswith(".parquet"):
+        return ParquetSnapshot(path)
+    return JSONLSnapshot(path)
+
+
+def load_latest(snapshot):
+    """
+    读取快照，同一链接有多条记录时保留最后写入的一条
+
+    :return: {链接: 记录}
+    """
+    latest = {}
+    for record in snapshot:
+        latest[record["subject"]["url"]] = record
+    return latest
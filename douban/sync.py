@@ -1,11 +1,24 @@
 import os
 import asyncio
-import time
 import logging
+import contextlib
 from datetime import datetime, timedelta, timezone
-import numpy as np
-from douban.douban_query import DoubanAPI
-from douban.notion_database import NotionBookDatabase, NotionMovieDatabase
+from douban.douban_query import DoubanAPI, feed_subject, interest_time
+from douban.cache import DetailCache
+from douban.checkpoint import CheckpointStore, content_fingerprint, content_key, interest_fingerprint
+from douban.metrics import Metrics
+from douban.notion_writer import NotionWriter, classify_notion_error
+from douban.parse_pool import DetailParserPool
+from douban.rate_limit import TokenBucket
+from douban.retry import Retrier
+from douban.notion_database import NotionBookDatabase, NotionMovieDatabase, make_content_blocks
+
+# 内容类型 -> 需要分别同步的范围，评论按影视和书籍分别分页
+CONTENT_SCOPES = {
+    "annotations": ["book"],
+    "reviews": ["movie", "book"],
+    "timeline": ["all"],
+}
 
 
 class DoubanNotionSync(object):
@@ -16,125 +29,528 @@ class DoubanNotionSync(object):
                  uid: str, 
                  token: str, 
                  movie_database_id: str, 
-                 book_database_id: str) -> None:
+                 book_database_id: str,
+                 state_dir: str = None,
+                 douban_concurrency: int = 2,
+                 notion_concurrency: int = 3,
+                 douban_rate_limiter=None,
+                 notion_rate_limiter=None,
+                 cache_ttl: float = 30 * 24 * 3600,
+                 cache_size: int = 20000,
+                 replay: bool = False,
+                 prefetch_pages: int = 4,
+                 unchanged_streak: int = 20,
+                 parser: str = "auto",
+                 parse_executor: str = "auto",
+                 parse_workers: int = None,
+                 douban_base_url: str = None,
+                 notion_base_url: str = None,
+                 metrics: Metrics = None,
+                 contents=(),
+                 change_feed: bool = False,
+                 reconcile_interval: float = 7 * 24 * 3600,
+                 feed_max_pages: int = 5,
+                 douban_session=None,
+                 notion_client=None,
+                 parse_pool: DetailParserPool = None) -> None:
+        if douban_rate_limiter is None:
+            douban_rate_limiter = TokenBucket(rate=0.5, capacity=2)
+        if notion_rate_limiter is None:
+            # Notion 对每个集成的平均限制约为 3 次/秒
+            notion_rate_limiter = TokenBucket(rate=3, capacity=3)
+        self.state_dir = state_dir
+        self.metrics = metrics or Metrics()
+        self.notion_rate_limiter = notion_rate_limiter
+        self.cache = DetailCache(path=self._state_path("douban_cache.sqlite3"),
+                                 ttl=cache_ttl,
+                                 max_entries=cache_size)
+        # 多账号同步时由 douban.accounts.MultiAccountSync 传入共用的会话和解析池，它们不在 close() 中关闭
+        self.owns_parse_pool = parse_pool is None
+        self.parse_pool = parse_pool or DetailParserPool(executor=parse_executor,
+                                                         workers=parse_workers,
+                                                         backend=parser)
         self.api = DoubanAPI(user_agent=str(user_agent),
                              cookie=str(cookie),
-                             ck=str(ck))
+                             ck=str(ck),
+                             rate_limiter=douban_rate_limiter,
+                             cache=self.cache,
+                             replay=replay,
+                             parser=parser,
+                             parse_pool=self.parse_pool,
+                             rexxar_base=douban_base_url,
+                             concurrency=douban_concurrency,
+                             metrics=self.metrics,
+                             session=douban_session)
         self.uid = uid
+        # 写入队列和数据库查询共用同一个 Notion 重试层，收到 Retry-After 时一起退避
+        notion_retrier = Retrier(classify_notion_error, rate_limiter=notion_rate_limiter,
+                                 metrics=self.metrics, upstream="notion")
+        self.writer = NotionWriter(workers=notion_concurrency, retrier=notion_retrier)
         self.movie_db = NotionMovieDatabase(
             notion_token=token,
-            notion_database_id=movie_database_id)
+            notion_database_id=movie_database_id,
+            index_path=self._state_path(f"notion_index_{movie_database_id}.jsonl"),
+            rate_limiter=notion_rate_limiter,
+            writer=self.writer,
+            base_url=notion_base_url,
+            retrier=notion_retrier,
+            metrics=self.metrics,
+            http_client=notion_client)
         self.book_db = NotionBookDatabase(
             notion_token=token,
-            notion_database_id=book_database_id)
+            notion_database_id=book_database_id,
+            index_path=self._state_path(f"notion_index_{book_database_id}.jsonl"),
+            rate_limiter=notion_rate_limiter,
+            writer=self.writer,
+            base_url=notion_base_url,
+            retrier=notion_retrier,
+            metrics=self.metrics,
+            http_client=notion_client)
+        self.checkpoint = CheckpointStore(path=self._state_path("checkpoint.sqlite3"))
         self.last_sync_time = self._load_last_sync_time()
         self.PAGE_SIZE = 20
-        self.total = 0
+        self.prefetch_pages = prefetch_pages
+        self.unchanged_streak = max(unchanged_streak, 1)
+        for kind in contents:
+            if kind not in CONTENT_SCOPES:
+                raise ValueError(f"不支持的内容类型: {kind}，可选 {', '.join(CONTENT_SCOPES)}")
+        self.contents = list(contents)
+        self.change_feed = change_feed
+        self.reconcile_interval = reconcile_interval
+        self.feed_max_pages = feed_max_pages
+        self.failed_items = []
     
+    def _state_path(self, filename):
+        if self.state_dir is None:
+            return None
+        return os.path.join(self.state_dir, filename)
+
     def _load_last_sync_time(self):
-        # if os.path.exists("last_sync_time.txt"):
-        #     with open("last_sync_time.txt", "r") as f:
-        #         return datetime.fromisoformat(f.read())
-        # else:
-        #     return datetime.fromisoformat("2006-01-01T00:00:00")
+        """
+        没有任何同步记录时的初始水位：环境变量 LAST_SYNC_TIME，默认为一天前
+        """
         last_sync_time = os.getenv("LAST_SYNC_TIME")
         if last_sync_time is not None:
-            return datetime.fromisoformat(last_sync_time)
+            last_sync_time = datetime.fromisoformat(last_sync_time)
+            if last_sync_time.tzinfo is None:
+                last_sync_time = last_sync_time.replace(tzinfo=timezone(timedelta(hours=8)))
+            return last_sync_time
         else:
             # return datetime.fromisoformat("2006-01-01T00:00:00")
             return datetime.now().replace(tzinfo=timezone(timedelta(hours=8))) - timedelta(days=1)
 
-    def _save_last_sync_time(self):
-        # with open("last_sync_time.txt", "w") as f:
-        #     f.write(datetime.now().isoformat())
-        os.environ["LAST_SYNC_TIME"] = datetime.now().isoformat()
+    async def close(self):
+        await self.writer.close()
+        await self.api.close()
+        if self.owns_parse_pool:
+            await self.parse_pool.close()
+        await self.movie_db.close()
+        await self.book_db.close()
+        self.cache.close()
+        self.checkpoint.close()
 
-    def _random_sleep(self):
-        sleep_time = np.random.uniform(0.5, 5.5)
-        time.sleep(sleep_time)
-    
-    def fetch_total(self):
-        loop = asyncio.get_event_loop()
-        resp_code, interests = loop.run_until_complete(
-            self.api.fetch_interests_total(uid=self.uid))
+    async def fetch_total(self):
+        resp_code, interests = await self.api.fetch_interests_total(uid=self.uid)
         return int(interests['total'])
 
     def sync(self):
-        self.total = self.fetch_total()
-        loop = asyncio.get_event_loop()
-        for interest_type in ["movie", "book"]:
-            for status in ["doing", "done", "mark"]:
-                page_count = 1
-                i = 0
-                while i < page_count:
-                    start = i * self.PAGE_SIZE
-                    resp_code, interests = loop.run_until_complete(
-                        self.api.fetch_interests(uid=self.uid,
-                                                 interest_type=interest_type,
-                                                 status=status,
-                                                 start=start, 
-                                                 count=self.PAGE_SIZE))
-                    if resp_code != 200:
-                        if resp_code == 500:
-                            # try to fetch this page sliced
-                            for j in range(self.PAGE_SIZE):
-                                start_sliced = start + j
-                                resp_code, interests = loop.run_until_complete(
-                                    self.api.fetch_interests(uid=self.uid,
-                                                             interest_type=interest_type,
-                                                             status=status,
-                                                             start=start_sliced,
-                                                             count=1))
-                                if resp_code != 200:
-                                    continue
-                                    
-                                sync_flag = self.sync_interests(interests, interest_type)
-                                self._random_sleep()
-                                if interests['total'] == start_sliced:
-                                    continue
-                                
-                    page_count = np.ceil(self.total / self.PAGE_SIZE)
-                    sync_flag = self.sync_interests(interests['interests'], interest_type)
-                    self._random_sleep()
-                    
-                    if sync_flag == 'Already synced':
-                        logging.info(f"{interest_type}/{status} 已是最新，跳过")
+        """
+        同步入口，阻塞直到 async_sync 完成并关闭所有连接
+
+        :return: 是否全部同步成功
+        """
+        async def _run():
+            try:
+                return await self.async_sync()
+            finally:
+                await self.close()
+        return asyncio.run(_run())
+
+    async def async_sync(self):
+        """
+        并发同步所有 (类型, 状态) 组合，豆瓣的并发数由信号量限制，Notion 写入经过写入队列
+
+        开启 change_feed 时优先从广播中找出发生变化的条目只同步它们，见 sync_feed；
+        距离上次完整扫描超过 reconcile_interval 秒，或者广播无法确定变化范围时，仍然完整扫描六个列表。
+
+        :return: 是否全部同步成功；失败的条目会汇总到日志，检查点不会越过它们，下次运行重新同步
+        """
+        self.failed_items = []
+        self.api.skipped_items = []
+        results = None
+        if self.change_feed and not self._reconcile_due():
+            feed_result = await self.sync_feed()
+            if feed_result is not None:
+                results = [feed_result]
+        if results is None:
+            results = await self.sync_all()
+        # 读书笔记等内容追加到条目页面中，需要在条目同步之后进行
+        results += await asyncio.gather(*[
+            self.sync_contents(kind, scope)
+            for kind in self.contents
+            for scope in CONTENT_SCOPES[kind]
+        ])
+
+        logging.info(f"详情缓存命中 {self.cache.hits} 次，未命中 {self.cache.misses} 次")
+        self.collect_metrics()
+
+        self.movie_db.index.save()
+        self.book_db.index.save()
+
+        if self.failed_items:
+            logging.error(f"{len(self.failed_items)} 个条目同步失败，下次运行时重试: {', '.join(self.failed_items)}")
+        if self.api.skipped_items:
+            logging.error(f"{len(self.api.skipped_items)} 个条目在豆瓣列表中一直返回 500，已跳过: "
+                          f"{', '.join(self.api.skipped_items)}")
+        return all(results)
+
+    def _reconcile_due(self):
+        last_full_scan = self.checkpoint.get_cursor("last_full_scan")
+        if last_full_scan is None:
+            return True
+        elapsed = datetime.now(timezone.utc) - datetime.fromisoformat(last_full_scan)
+        return elapsed.total_seconds() >= self.reconcile_interval
+
+    async def sync_all(self):
+        """
+        完整扫描六个列表；开启 change_feed 时先记下当前最新的广播，扫描成功后作为广播游标
+        """
+        head = await self._feed_head() if self.change_feed else None
+        results = await asyncio.gather(*[
+            self.sync_status(interest_type, status)
+            for interest_type in ["movie", "book"]
+            for status in ["doing", "done", "mark"]
+        ])
+        if all(results):
+            self.checkpoint.set_cursor("last_full_scan", datetime.now(timezone.utc).isoformat())
+            if head is not None:
+                self.checkpoint.set_cursor("timeline_feed", head)
+        return list(results)
+
+    @staticmethod
+    def _feed_cursor(page):
+        """
+        以一页广播中最新的原始广播为游标，与书影条目无关的广播也推进游标；
+        id 只在最新的广播与书影条目有关时记录，否则只按时间判断
+        """
+        first = page.items[0] if page.items else None
+        return {"id": first["id"] if first is not None and interest_time(first) == page.newest else None,
+                "time": page.newest.isoformat()}
+
+    async def _feed_head(self):
+        """
+        当前最新的广播位置，最多读取 feed_max_pages 页；没有广播或获取失败时返回 None
+        """
+        pages_read = 0
+        pages = self.api.iter_content_pages(self.uid, "timeline")
+        async with contextlib.aclosing(pages):
+            async for page in pages:
+                if not page.complete:
+                    return None
+                if page.newest is not None:
+                    return self._feed_cursor(page)
+                pages_read += 1
+                if pages_read >= self.feed_max_pages:
+                    return None
+        return None
+
+    async def sync_feed(self):
+        """
+        广播驱动的增量同步：从最新的广播读到上次记录的广播为止，只同步其中涉及的条目
+
+        通常只需要一次广播请求和一次列表请求。不推进各列表的检查点，不发广播的标记和旧条目的修改
+        由定期的完整扫描补上。
+
+        :return: 是否全部同步成功；没有广播游标或者超过 feed_max_pages 页仍未读到游标时返回 None，
+                 由调用方改为完整扫描
+        """
+        cursor = self.checkpoint.get_cursor("timeline_feed")
+        if cursor is None:
+            logging.info("还没有广播游标，进行完整扫描")
+            return None
+        cursor_time = datetime.fromisoformat(cursor["time"])
+        changed = {}
+        head = None
+        reached = False
+        pages_read = 0
+        pages = self.api.iter_content_pages(self.uid, "timeline")
+        async with contextlib.aclosing(pages):
+            async for page in pages:
+                if not page.complete:
+                    return False
+                pages_read += 1
+                if head is None and page.newest is not None:
+                    head = self._feed_cursor(page)
+                for content in page.items:
+                    if content["id"] == cursor["id"] or interest_time(content) < cursor_time:
+                        reached = True
                         break
+                    subject = feed_subject(content)
+                    if subject is not None:
+                        changed.setdefault(content["subject_url"], subject + (interest_time(content),))
+                # 与书影条目无关的广播不在 page.items 中，按原始条目的时间判断是否已经越过游标
+                if reached or page.oldest is not None and page.oldest < cursor_time:
+                    break
+                if pages_read >= self.feed_max_pages:
+                    logging.info(f"读取{pages_read}页广播仍未到达上次的位置，进行完整扫描")
+                    return None
+        logging.info(f"广播中有 {len(changed)} 个条目发生变化")
+        success = await self.sync_changed(changed)
+        if success and head is not None:
+            self.checkpoint.set_cursor("timeline_feed", head)
+        return success
+
+    async def sync_changed(self, changed):
+        """
+        在对应的列表开头找到广播涉及的条目并同步；状态未知时在该类型的三个列表中查找
 
-                    # update the start page index
-                    i += 1
+        :param changed: {条目链接: (类型, 状态或 None, 广播时间)}
+        """
+        wanted = {}
+        for url, (interest_type, status, _) in changed.items():
+            for list_status in [status] if status else ["doing", "done", "mark"]:
+                wanted.setdefault((interest_type, list_status), set()).add(url)
+        pending = set(changed)
+        # 标记时间不会晚于广播时间太多，列表翻到比最早的广播还早一天时停止
+        oldest = min((t for _, _, t in changed.values()), default=None)
+
+        async def scan(interest_type, status, urls):
+            found = []
+            pages = self.api.iter_interest_pages(self.uid, interest_type, status, page_size=self.PAGE_SIZE)
+            async with contextlib.aclosing(pages):
+                async for page in pages:
+                    for interest in page.items:
+                        if interest['subject']['url'] in pending:
+                            pending.discard(interest['subject']['url'])
+                            found.append(interest)
+                    if not page.complete:
+                        return found, False
+                    if (not pending & urls or page.start // self.PAGE_SIZE + 1 >= self.feed_max_pages
+                            or page.items and interest_time(page.items[-1]) < oldest - timedelta(days=1)):
+                        break
+            return found, True
 
-        # save the last sync time
-        self._save_last_sync_time()
+        scans = await asyncio.gather(*[scan(interest_type, status, urls)
+                                       for (interest_type, status), urls in wanted.items()])
+        success = all(complete for _, complete in scans)
+        for url in pending:
+            logging.warning(f"列表中没有找到广播涉及的 {url}，等待下次完整扫描")
 
-    def sync_interests(self, interests, interest_type):
-        loop = asyncio.get_event_loop()
+        synced = [(interest, interest_type)
+                  for ((interest_type, _), _), (found, _) in zip(wanted.items(), scans)
+                  for interest in found]
+        results = await asyncio.gather(*[self.sync_interest(interest, interest_type)
+                                         for interest, interest_type in synced])
+        self.checkpoint.set_fingerprints({
+            interest['subject']['url']: interest_fingerprint(interest)
+            for (interest, _), result in zip(synced, results) if result
+        })
+        return success and all(results)
+
+    def collect_metrics(self):
+        """
+        把缓存命中率和限流等待时间记录到 self.metrics
+        """
+        self.metrics.record_cache(self.cache)
+        self.metrics.record_rate_limiter("douban", self.api.rate_limiter)
+        self.metrics.record_rate_limiter("notion", self.notion_rate_limiter)
+
+    async def sync_status(self, interest_type, status):
+        """
+        同步一个 (类型, 状态) 列表，每完成一页都写入检查点
+
+        分页由 DoubanAPI.iter_interest_pages 提供：处理当前页时后台预取后面 prefetch_pages 页，
+        但仍按顺序交给处理阶段，保证条目按标记时间从新到旧处理。
+        上一轮中断时从记录的位置继续；为了防止列表在两次运行之间前移而漏掉条目，
+        会多回退一页，已同步的条目只会命中本地索引，不会产生额外请求。
+        到达 watermark 之后继续比较条目指纹，连续 unchanged_streak 个旧条目没有修改时停止翻页。
+        """
+        state = self.checkpoint.get(interest_type, status)
+        watermark = state["watermark"] or self.last_sync_time
+        newest = state["scan_newest"]
+        success = True
+        streak = 0
+        start = 0
+        if state["offset"] is not None:
+            start = state["offset"] // self.PAGE_SIZE * self.PAGE_SIZE
+            logging.info(f"{interest_type}/{status} 从第{start // self.PAGE_SIZE + 1}页继续同步")
+
+        pages = self.api.iter_interest_pages(self.uid, interest_type, status,
+                                             start=start,
+                                             page_size=self.PAGE_SIZE,
+                                             since=watermark,
+                                             prefetch=self.prefetch_pages)
+        async with contextlib.aclosing(pages):
+            async for page in pages:
+                sync_flag, page_newest, page_success, streak = await self.sync_interests(
+                    page.items, interest_type, watermark, streak)
+                newest = max(filter(None, [newest, page_newest]), default=None)
+                success = success and page.complete and page_success
+                # 有失败的分页时不再推进进度，中断后从失败之前的位置重新开始
+                if success:
+                    self.checkpoint.save_progress(interest_type, status, page.start, newest)
+
+                if sync_flag == 'Already synced':
+                    logging.info(f"{interest_type}/{status} 已是最新，跳过")
+                    break
+        self.checkpoint.complete(interest_type, status, success=success)
+        return success
+
+    async def sync_interests(self, interests, interest_type, watermark=None, streak=0):
+        """
+        并发同步一页条目
+
+        晚于 watermark 的条目全部同步；不晚于 watermark 的条目只在指纹与上次同步时不同时同步，
+        连续 unchanged_streak 个旧条目没有修改时停止。没有指纹记录的旧条目（例如升级前同步的条目）
+        视为没有修改，但会记下当前的指纹，之后的修改可以被发现；其中不在 Notion 中的
+        （例如之前在列表中一直返回 500 而被跳过的条目）会被同步。
+
+        :param streak: 之前的分页末尾连续没有修改的旧条目数
+        :return: (同步标记, 本页最新的标记时间, 是否全部成功, 本页末尾连续没有修改的旧条目数)
+        """
+        if watermark is None:
+            watermark = self.last_sync_time
+        stored = self.checkpoint.get_fingerprints(interest['subject']['url'] for interest in interests)
+        db = self.movie_db if interest_type == "movie" else self.book_db
+        if any(interest['subject']['url'] not in stored and interest_time(interest) <= watermark
+               for interest in interests):
+            # 只有没有指纹记录的旧条目需要对照 Notion 中已有的页面
+            await db.ensure_index()
+        synced = []
+        recorded = {}
+        newest = None
+        sync_flag = 'Continue syncing'
         for interest in interests:
-            # 豆瓣记录的时间是 UTC+8
-            timestamp = datetime.fromisoformat(interest['create_time']).replace(tzinfo=timezone(timedelta(hours=8)))
-            if timestamp <= self.last_sync_time:
-                return 'Already synced'
+            url = interest['subject']['url']
+            fingerprint = interest_fingerprint(interest)
+            timestamp = interest_time(interest)
+            if timestamp > watermark:
+                newest = max(filter(None, [newest, timestamp]))
+            elif url not in stored and url not in db.index:
+                logging.info(f"{interest['subject']['title']} 还没有同步到 Notion")
+            elif stored.get(url, fingerprint) == fingerprint:
+                if url not in stored:
+                    recorded[url] = fingerprint
+                streak += 1
+                self.metrics.inc("unchanged_items_total", interest_type=interest_type)
+                if streak >= self.unchanged_streak:
+                    sync_flag = 'Already synced'
+                    break
+                continue
+            else:
+                logging.info(f"{interest['subject']['title']} 的标记有修改")
+            streak = 0
+            synced.append((interest, fingerprint))
+        results = await asyncio.gather(*[self.sync_interest(interest, interest_type) for interest, _ in synced])
+        recorded.update({
+            interest['subject']['url']: fingerprint
+            for (interest, fingerprint), success in zip(synced, results) if success
+        })
+        self.checkpoint.set_fingerprints(recorded)
+        return sync_flag, newest, all(results), streak
 
-            detail_url = interest['subject']['url']
-            try:
-                if interest_type == "movie":
-                    is_exist, page_id = self.movie_db.check_exist(interest)
-                    if not is_exist:
-                        details = loop.run_until_complete(self.api.fetch_movie_detail(detail_url))
-                        interest['subject'].update(details['subject'])
-                        self._random_sleep()
-                    else:
-                        logging.info(f"{interest['subject']['title']} 已有记录")
-                    self.movie_db.sync(interest)
-                elif interest_type == "book":
-                    is_exist, page_id = self.book_db.check_exist(interest)
-                    if not is_exist:
-                        details = loop.run_until_complete(self.api.fetch_book_detail(detail_url))
-                        interest['subject'].update(details['subject'])
-                        self._random_sleep()
-                    else:
-                        logging.info(f"{interest['subject']['title']} 已有记录")
-                    self.book_db.sync(interest)
-            except Exception as err:
-                logging.error(f"处理 {interest} 遇到错误: {err}")
-        return 'Continue syncing'
+    async def sync_interest(self, interest, interest_type):
+        """
+        合并详情页后同步单个条目
+
+        已有的条目也要合并详情页（通常命中详情缓存）：属性的比较、同步指纹和页面被删除后的重建
+        都基于完整的条目，只用列表数据会把详情页中的属性当作已删除而清空。
+        """
+        if interest_type == "movie":
+            db, fetch_detail = self.movie_db, self.api.fetch_movie_detail
+        else:
+            db, fetch_detail = self.book_db, self.api.fetch_book_detail
+        detail_url = interest['subject']['url']
+        try:
+            with self.metrics.timer("stage_seconds", stage="detail"):
+                details = await fetch_detail(detail_url)
+            if details is None:
+                raise ValueError(f"没有获取到 {detail_url} 的详情")
+            interest['subject'].update(details['subject'])
+            with self.metrics.timer("stage_seconds", stage="notion"):
+                success = await db.sync(interest)
+        except Exception as err:
+            logging.error(f"处理 {interest} 遇到错误: {err}")
+            success = False
+        self.metrics.inc("items_total", interest_type=interest_type, result="synced" if success else "failed")
+        if not success:
+            self.failed_items.append(detail_url)
+        return success
+
+    async def sync_contents(self, kind, scope):
+        """
+        同步一种内容（读书笔记、评论或广播）的一个范围，每种内容有自己的检查点
+
+        按时间从新到旧翻页，本页最早的原始条目不晚于 watermark 时停止，夜间运行只获取新增的内容；
+        没有关联到书影条目的广播虽然被丢弃，也参与判断，不会因为整页被丢弃而一直翻到最后。
+        内容追加到对应书影条目页面的末尾；条目不在 Notion 中的内容会跳过。
+
+        :param kind: annotations、reviews 或 timeline
+        :param scope: reviews 为 movie / book，其他类型见 CONTENT_SCOPES
+        """
+        state = self.checkpoint.get(kind, scope)
+        watermark = state["watermark"] or self.last_sync_time
+        newest = state["scan_newest"]
+        success = True
+        start = 0
+        if state["offset"] is not None and kind != "timeline":
+            start = state["offset"] // self.PAGE_SIZE * self.PAGE_SIZE
+            logging.info(f"{kind}/{scope} 从第{start}条继续同步")
+        await asyncio.gather(self.movie_db.ensure_index(), self.book_db.ensure_index())
+
+        pages = self.api.iter_content_pages(self.uid, kind, interest_type=scope, start=start,
+                                            page_size=self.PAGE_SIZE)
+        async with contextlib.aclosing(pages):
+            async for page in pages:
+                fresh = [content for content in page.items if interest_time(content) > watermark]
+                # 与书影条目无关的广播也推进检查点，下次运行不再重复翻阅
+                newest = max(filter(None, [newest, page.newest]), default=None)
+                page_success = await self.sync_content_page(fresh)
+                success = success and page.complete and page_success
+                if success:
+                    self.checkpoint.save_progress(kind, scope, page.start, newest)
+                if page.oldest is not None and page.oldest <= watermark:
+                    break
+        self.checkpoint.complete(kind, scope, success=success)
+        return success
+
+    def _find_page(self, subject_url):
+        for db in (self.movie_db, self.book_db):
+            entry = db.index.get(subject_url)
+            if entry is not None:
+                return db, entry["page_id"]
+        return None, None
+
+    async def sync_content_page(self, contents):
+        """
+        把一页内容追加到对应的条目页面；同一页面的内容按时间从旧到新合并为一次追加
+
+        :return: 是否全部成功
+        """
+        appended = self.checkpoint.get_fingerprints(content_key(content) for content in contents)
+        groups = {}
+        for content in contents:
+            if content_key(content) in appended:
+                continue
+            db, page_id = self._find_page(content["subject_url"])
+            if db is None:
+                logging.info(f"{content['subject_url']} 不在 Notion 中，跳过{content['kind']} {content['id']}")
+                self.metrics.inc("contents_total", kind=content["kind"], result="skipped")
+                continue
+            groups.setdefault((db, page_id), []).append(content)
+
+        async def append(db, page_id, group):
+            group = sorted(group, key=interest_time)
+            blocks = [block for content in group for block in make_content_blocks(content)]
+            success = await db.append_blocks(page_id, blocks, f"追加{len(group)}条内容到 {group[0]['subject_url']}")
+            self.metrics.inc("contents_total", len(group), kind=group[0]["kind"],
+                             result="synced" if success else "failed")
+            if success:
+                self.checkpoint.set_fingerprints({content_key(content): content_fingerprint(content)
+                                                  for content in group})
+            else:
+                self.failed_items.extend(f"{content['kind']}:{content['id']}" for content in group)
+            return success
+
+        results = await asyncio.gather(*[append(db, page_id, group) for (db, page_id), group in groups.items()])
+        return all(results)
@@ -1,18 +1,38 @@
 import os
+import json
 import logging
 import argparse
 from dotenv import load_dotenv
 from douban.sync import DoubanNotionSync
+from douban.accounts import MultiAccountSync, load_accounts
+from douban.daemon import SyncDaemon
+from douban.export import DoubanExport
+from douban.restore import NotionRestore
 from douban.notion_database import create_database
+from douban.rate_limit import make_rate_limiter
+from douban.profiling import PROFILE_MODES, profile
 
 load_dotenv()
 
+LOG_FILE = "douban.log"
+
+
+def report_metrics(metrics, args):
+    """
+    运行结束时把指标汇总写入日志，并按需写入 JSON 文件和 Prometheus textfile
+    """
+    logging.info(f"运行指标: {json.dumps(metrics.summary(), ensure_ascii=False)}")
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.prometheus_textfile:
+        metrics.write_prometheus(args.prometheus_textfile)
+
 
 def main(args):
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(filename)s %(levelname)s %(message)s',
                         datefmt='%a %d %b %Y %H:%M:%S',
-                        handlers=[logging.FileHandler("douban.log", mode='w', encoding='utf-8'),
+                        handlers=[logging.FileHandler(LOG_FILE, mode='a', encoding='utf-8'),
                                   logging.StreamHandler()])
 
     user_agent = os.getenv("USER_AGENT")
@@ -22,25 +42,166 @@ def main(args):
     token = os.getenv("NOTION_TOKEN")
     movie_database_id = os.getenv("MOVIE_DATABASE_ID")
     book_database_id = os.getenv("BOOK_DATABASE_ID")
+    state_dir = os.getenv("STATE_DIR", "state")
+    # 分析结果与日志放在同一目录
+    profile_dir = os.path.dirname(os.path.abspath(LOG_FILE))
     if args.init:
         page_id = os.getenv("BASE_PAGE_ID")
         create_database(token=token, page_id=page_id, media_type="movie")
         create_database(token=token, page_id=page_id, media_type="book")
-    elif args.sync:
-        sync = DoubanNotionSync(user_agent=user_agent,
-                                cookie=cookie,
-                                ck=ck,
-                                uid=uid,
-                                token=token,
+    elif args.sync or args.daemon:
+        if args.accounts:
+            sync = MultiAccountSync(load_accounts(args.accounts),
+                                    state_dir=state_dir,
+                                    douban_rate_limiter=make_rate_limiter(args.douban_rate, args.douban_burst),
+                                    notion_rate_limiter=make_rate_limiter(args.notion_rate, args.notion_burst),
+                                    user_agent=user_agent,
+                                    parser=args.parser,
+                                    parse_executor=args.parse_executor,
+                                    parse_workers=args.parse_workers,
+                                    douban_concurrency=args.douban_concurrency,
+                                    notion_concurrency=args.notion_concurrency,
+                                    cache_ttl=args.cache_ttl * 24 * 3600,
+                                    cache_size=args.cache_size,
+                                    replay=args.replay,
+                                    unchanged_streak=args.stop_after,
+                                    contents=args.contents,
+                                    change_feed=args.change_feed,
+                                    reconcile_interval=args.reconcile_days * 24 * 3600)
+        else:
+            sync = DoubanNotionSync(user_agent=user_agent,
+                                    cookie=cookie,
+                                    ck=ck,
+                                    uid=uid,
+                                    token=token,
+                                    movie_database_id=movie_database_id,
+                                    book_database_id=book_database_id,
+                                    state_dir=state_dir,
+                                    douban_concurrency=args.douban_concurrency,
+                                    notion_concurrency=args.notion_concurrency,
+                                    douban_rate_limiter=make_rate_limiter(args.douban_rate, args.douban_burst),
+                                    notion_rate_limiter=make_rate_limiter(args.notion_rate, args.notion_burst),
+                                    cache_ttl=args.cache_ttl * 24 * 3600,
+                                    cache_size=args.cache_size,
+                                    replay=args.replay,
+                                    parser=args.parser,
+                                    parse_executor=args.parse_executor,
+                                    parse_workers=args.parse_workers,
+                                    unchanged_streak=args.stop_after,
+                                    contents=args.contents,
+                                    change_feed=args.change_feed,
+                                    reconcile_interval=args.reconcile_days * 24 * 3600)
+        if args.daemon:
+            daemon = SyncDaemon(sync,
+                                interval=args.interval * 60,
+                                jitter=args.jitter,
+                                port=args.health_port if args.health_port > 0 else None,
+                                after_run=lambda: report_metrics(sync.metrics, args))
+            with profile(args.profile, profile_dir, name="daemon"):
+                daemon.run()
+            return
+        with profile(args.profile, profile_dir, name="sync"):
+            success = sync.sync()
+        report_metrics(sync.metrics, args)
+        if not success:
+            if args.accounts:
+                failed = [name for name, result in sync.results.items() if not result]
+                exit(f"账号 {', '.join(failed)} 部分条目同步失败，下次运行时会重试，详见 douban.log")
+            exit("部分条目同步失败，下次运行时会重试，详见 douban.log")
+    elif args.export:
+        export = DoubanExport(user_agent=user_agent,
+                              cookie=cookie,
+                              ck=ck,
+                              uid=uid,
+                              path=args.export,
+                              state_dir=state_dir,
+                              douban_concurrency=args.douban_concurrency,
+                              douban_rate_limiter=make_rate_limiter(args.douban_rate, args.douban_burst),
+                              cache_ttl=args.cache_ttl * 24 * 3600,
+                              cache_size=args.cache_size,
+                              replay=args.replay,
+                              parser=args.parser,
+                              parse_executor=args.parse_executor,
+                              parse_workers=args.parse_workers)
+        with profile(args.profile, profile_dir, name="export"):
+            success = export.export()
+        report_metrics(export.metrics, args)
+        if not success:
+            exit("部分条目导出失败，重新运行会继续导出，详见 douban.log")
+    elif args.import_path:
+        restore = NotionRestore(token=token,
                                 movie_database_id=movie_database_id,
-                                book_database_id=book_database_id)
-        sync.sync()
+                                book_database_id=book_database_id,
+                                path=args.import_path,
+                                state_dir=state_dir,
+                                notion_concurrency=args.notion_concurrency,
+                                notion_rate_limiter=make_rate_limiter(args.notion_rate, args.notion_burst))
+        with profile(args.profile, profile_dir, name="import"):
+            success = restore.restore()
+        report_metrics(restore.metrics, args)
+        if not success:
+            exit("部分条目恢复失败，重新运行会继续恢复，详见 douban.log")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--init", action="store_true", help="初始化数据库")
     parser.add_argument("--sync", action="store_true", help="同步数据")   
+    parser.add_argument("--daemon", action="store_true",
+                        help="常驻运行，每隔 --interval 分钟增量同步一次，两次运行之间保留缓存和连接")
+    parser.add_argument("--interval", type=float, default=float(os.getenv("SYNC_INTERVAL", 60)),
+                        help="--daemon 模式下两次同步之间的间隔(分钟)")
+    parser.add_argument("--jitter", type=float, default=float(os.getenv("SYNC_JITTER", 0.1)),
+                        help="--daemon 模式下间隔的随机浮动比例，0.1 表示 ±10%%")
+    parser.add_argument("--health-port", type=int, default=int(os.getenv("HEALTH_PORT", 8765)),
+                        help="--daemon 模式下在 127.0.0.1 提供 /healthz、/status、/metrics 和 POST /sync，"
+                             "不大于0时不启动")
+    parser.add_argument("--export", metavar="PATH",
+                        help="只导出豆瓣数据到本地快照，不访问 Notion；.jsonl.gz 为压缩 JSONL，.parquet 为 Parquet 目录（需要 pyarrow）")
+    parser.add_argument("--import", dest="import_path", metavar="PATH",
+                        help="从 --export 导出的快照恢复 Notion 数据库，不访问豆瓣；已在 Notion 中的条目会跳过")
+    parser.add_argument("--accounts", default=os.getenv("ACCOUNTS_FILE"), metavar="PATH",
+                        help="与 --sync 或 --daemon 一起使用，按 JSON 配置文件在一个进程中同步多个账号，"
+                             "共用连接池和限流预算，--douban-concurrency 等参数对每个账号生效")
+    parser.add_argument("--douban-concurrency", type=int, default=2, help="豆瓣最大并发请求数")
+    parser.add_argument("--notion-concurrency", type=int, default=3, help="Notion最大并发请求数")
+    parser.add_argument("--douban-rate", type=float, default=float(os.getenv("DOUBAN_RATE", 0.5)),
+                        help="豆瓣平均请求速率(次/秒)，不大于0表示不限流")
+    parser.add_argument("--douban-burst", type=int, default=int(os.getenv("DOUBAN_BURST", 2)),
+                        help="豆瓣允许的突发请求数")
+    parser.add_argument("--notion-rate", type=float, default=float(os.getenv("NOTION_RATE", 3)),
+                        help="Notion平均请求速率(次/秒)，不大于0表示不限流")
+    parser.add_argument("--notion-burst", type=int, default=int(os.getenv("NOTION_BURST", 3)),
+                        help="Notion允许的突发请求数")
+    parser.add_argument("--cache-ttl", type=float, default=float(os.getenv("CACHE_TTL_DAYS", 30)),
+                        help="豆瓣详情缓存的有效期(天)")
+    parser.add_argument("--cache-size", type=int, default=int(os.getenv("CACHE_SIZE", 20000)),
+                        help="豆瓣详情缓存的最大条目数")
+    parser.add_argument("--replay", action="store_true", help="回放模式，只使用本地缓存的豆瓣数据，不访问豆瓣")
+    parser.add_argument("--parser", default=os.getenv("HTML_PARSER", "auto"),
+                        choices=["auto", "soup", "fragment", "lxml"],
+                        help="详情页解析后端，auto 在安装了 lxml 时使用 lxml")
+    parser.add_argument("--parse-executor", default=os.getenv("PARSE_EXECUTOR", "auto"),
+                        choices=["auto", "process", "thread", "inline"],
+                        help="详情页解析的执行方式，auto 对 lxml 使用线程池，否则使用进程池")
+    parser.add_argument("--parse-workers", type=int, default=None, help="解析进程/线程数，默认为CPU核数")
+    parser.add_argument("--stop-after", type=int, default=int(os.getenv("STOP_AFTER", 20)),
+                        help="早于上次同步时间的条目连续多少个没有修改时停止翻页")
+    parser.add_argument("--contents", type=lambda value: [kind for kind in value.split(",") if kind],
+                        default=os.getenv("SYNC_CONTENTS", ""), metavar="KINDS",
+                        help="同时同步的内容，逗号分隔：annotations（读书笔记）、reviews（评论）、timeline（广播），"
+                             "追加到对应条目的页面中")
+    parser.add_argument("--change-feed", action="store_true", default=os.getenv("CHANGE_FEED", "") not in ("", "0"),
+                        help="根据广播只同步发生变化的条目，定期完整扫描所有列表")
+    parser.add_argument("--reconcile-days", type=float, default=float(os.getenv("RECONCILE_DAYS", 7)),
+                        help="开启 --change-feed 时，每隔多少天完整扫描一次所有列表")
+    parser.add_argument("--metrics-json", default=os.getenv("METRICS_JSON"), metavar="PATH",
+                        help="运行结束时把请求数、耗时直方图、等待时间和缓存命中率写入 JSON 文件")
+    parser.add_argument("--prometheus-textfile", default=os.getenv("PROMETHEUS_TEXTFILE"), metavar="PATH",
+                        help="运行结束时写入 Prometheus 文本格式，供 node_exporter 的 textfile collector 采集")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILE_MODES,
+                        help="分析本次运行，结果写到日志所在目录；默认 cprofile，pyinstrument 需要先安装，"
+                             "tracemalloc 报告分配内存最多的位置")
 
     args = parser.parse_args()
     main(args)
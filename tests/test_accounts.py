@@ -0,0 +1,153 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from benchmarks.fake_servers import FakeDouban, FakeNotion, start_server
+from douban.accounts import MultiAccountSync, load_accounts
+from douban.rate_limit import FairShare, TokenBucket, UnlimitedRateLimiter
+
+
+def account(name, **fields):
+    entry = {
+        "name": name,
+        "uid": f"uid-{name}",
+        "cookie": f"dbcl2={name}",
+        "ck": "test",
+        "notion_token": f"token-{name}",
+        "movie_database_id": f"movie-{name}",
+        "book_database_id": f"book-{name}",
+    }
+    entry.update(fields)
+    return entry
+
+
+class TestLoadAccounts(unittest.TestCase):
+    def load(self, config):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "accounts.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(config, f)
+            return load_accounts(path)
+
+    @mock.patch.dict(os.environ, {"ALICE_COOKIE": "dbcl2=secret"})
+    def test_defaults_and_env(self):
+        accounts = self.load({
+            "defaults": {"user_agent": "ua", "contents": "reviews,timeline"},
+            "accounts": [account("alice", cookie="${ALICE_COOKIE}"), account("bob", contents=[])],
+        })
+        self.assertEqual([a.name for a in accounts], ["alice", "bob"])
+        self.assertEqual(accounts[0].cookie, "dbcl2=secret")
+        self.assertEqual(accounts[0].user_agent, "ua")
+        self.assertEqual(accounts[0].contents, ["reviews", "timeline"])
+        self.assertEqual(accounts[1].contents, [])
+        self.assertEqual(self.load([account("carol")])[0].contents, None)
+
+    def test_invalid(self):
+        broken = account("alice")
+        del broken["notion_token"]
+        for config in [
+            {"accounts": []},
+            {"accounts": [broken]},
+            {"accounts": [account("alice", password="x")]},
+            {"accounts": [account("../alice")]},
+            {"accounts": [account("alice"), account("alice")]},
+        ]:
+            with self.assertRaises(ValueError):
+                self.load(config)
+
+
+class TestFairShare(unittest.TestCase):
+    def test_round_robin_between_tenants(self):
+        share = FairShare(TokenBucket(rate=200, capacity=1))
+        granted = []
+
+        async def request(tenant):
+            await tenant.acquire()
+            granted.append(tenant.name)
+
+        async def run():
+            big, small = share.tenant("big"), share.tenant("small")
+            tasks = [asyncio.ensure_future(request(big)) for _ in range(10)]
+            await asyncio.sleep(0)
+            tasks += [asyncio.ensure_future(request(small)) for _ in range(2)]
+            await asyncio.gather(*tasks)
+        asyncio.run(run())
+        # 后到的账号不需要等前一个账号的10个请求全部放行
+        self.assertEqual(granted.count("small"), 2)
+        self.assertLessEqual(max(i for i, name in enumerate(granted) if name == "small"), 5)
+
+    def test_pause(self):
+        shared = FairShare(UnlimitedRateLimiter())
+        shared.tenant("a").pause(10)
+        self.assertGreater(shared.limiter._paused_until, 0)
+
+        separate = FairShare(UnlimitedRateLimiter(), shared_pause=False)
+        tenant = separate.tenant("a")
+        tenant.pause(10)
+        self.assertEqual(separate.limiter._paused_until, 0)
+        self.assertGreater(tenant._paused_until, 0)
+
+    def test_cancelled_waiter_is_skipped(self):
+        share = FairShare(TokenBucket(rate=20, capacity=1))
+
+        async def run():
+            tenant = share.tenant("a")
+            await tenant.acquire()
+            waiter = asyncio.ensure_future(tenant.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.wait_for(share.tenant("b").acquire(), 1)
+        asyncio.run(run())
+
+
+class TestMultiAccountSync(unittest.TestCase):
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_sync_accounts(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+        douban = FakeDouban(items=30)
+        notion = FakeNotion(rate_limited=0.05, retry_after=0)
+        for service in (douban, notion):
+            runner, _ = loop.run_until_complete(start_server(service))
+            self.addCleanup(loop.run_until_complete, runner.cleanup())
+        accounts = load_accounts_from([account("alice"), account("bob")])
+
+        with tempfile.TemporaryDirectory() as state_dir:
+            sync = MultiAccountSync(accounts, state_dir=state_dir,
+                                    douban_rate_limiter=UnlimitedRateLimiter(),
+                                    notion_rate_limiter=UnlimitedRateLimiter(),
+                                    user_agent="test",
+                                    parse_executor="inline",
+                                    douban_base_url=douban.base_url,
+                                    notion_base_url=notion.base_url)
+            try:
+                self.assertTrue(loop.run_until_complete(sync.async_sync()))
+                self.assertEqual(sync.syncs["alice"].api.session, sync.syncs["bob"].api.session)
+            finally:
+                loop.run_until_complete(sync.close())
+
+            for name in ("alice", "bob"):
+                self.assertEqual(len(notion.databases[f"movie-{name}"]), 15)
+                self.assertEqual(len(notion.databases[f"book-{name}"]), 15)
+                self.assertTrue(os.path.exists(os.path.join(state_dir, name, "checkpoint.sqlite3")))
+                # 每个账号的 Cookie 和令牌只随自己的请求发送
+                self.assertGreater(douban.credentials[f"dbcl2={name}"], 30)
+                self.assertGreater(notion.credentials[f"Bearer token-{name}"], 30)
+            self.assertEqual(set(douban.credentials), {"dbcl2=alice", "dbcl2=bob"})
+            self.assertEqual(set(notion.credentials), {"Bearer token-alice", "Bearer token-bob"})
+
+            summary = sync.metrics.summary()
+            self.assertEqual(summary["items"], 60)
+            self.assertEqual(summary["counters"]["items_total{account=alice,interest_type=movie,result=synced}"], 15)
+            self.assertIn("rate_limit_wait_seconds{account=bob,upstream=douban}", summary["gauges"])
+
+
+def load_accounts_from(entries):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "accounts.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"accounts": entries}, f)
+        return load_accounts(path)
@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+from douban.cache import DetailCache
+from douban.douban_query import DoubanAPI
+
+
+class TestDetailCache(unittest.TestCase):
+    def test_roundtrip_and_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite3")
+            cache = DetailCache(path)
+            cache.set("https://book.douban.com/subject/1/", {"subject": {"isbn": "9787"}})
+            cache.close()
+
+            cache = DetailCache(path)
+            self.assertEqual(cache.get("https://book.douban.com/subject/1/"), {"subject": {"isbn": "9787"}})
+            self.assertIsNone(cache.get("https://book.douban.com/subject/2/"))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            cache.close()
+
+    def test_ttl(self):
+        cache = DetailCache(ttl=0.01)
+        cache.set("a", {"subject": {}})
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = DetailCache(max_entries=2)
+        cache.set("a", {})
+        time.sleep(0.001)
+        cache.set("b", {})
+        time.sleep(0.001)
+        cache.get("a")
+        time.sleep(0.001)
+        cache.set("c", {})
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_listings_have_their_own_budget(self):
+        cache = DetailCache(max_entries=2, listing_max_entries=1)
+        cache.set("a", {})
+        cache.set("b", {})
+        for start in range(0, 60, 20):
+            cache.set(f"rexxar:interests:uid:book:done:{start}:20", {"start": start}, listing=True)
+        self.assertIn("a", cache)
+        self.assertIn("b", cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("rexxar:interests:uid:book:done:0:20", listing=True))
+        self.assertEqual(cache.get("rexxar:interests:uid:book:done:40:20", listing=True), {"start": 40})
+        # 列表键不会从详情页中取到
+        self.assertIsNone(cache.get("rexxar:interests:uid:book:done:40:20"))
+
+    def test_access_times_are_batched(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite3")
+            cache = DetailCache(path, max_entries=3)
+            for url in "abc":
+                cache.set(url, {})
+                time.sleep(0.001)
+            statements = []
+            cache._conn.set_trace_callback(statements.append)
+            for _ in range(3):
+                cache.get("a")
+            self.assertFalse([s for s in statements if s.startswith("UPDATE") or s == "COMMIT"])
+            # 淘汰时使用内存中的访问时间，重复写入已有条目也不计入条目数
+            cache.set("c", {"updated": True})
+            cache.set("d", {})
+            self.assertEqual(len(cache), 3)
+            self.assertIn("a", cache)
+            self.assertNotIn("b", cache)
+            self.assertFalse([s for s in statements if "COUNT" in s])
+            cache.close()
+
+            cache = DetailCache(path, max_entries=3)
+            self.assertEqual(len(cache), 3)
+            self.assertEqual(cache.get("c"), {"updated": True})
+            cache.close()
+
+    def test_old_listing_entries_are_migrated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite3")
+            cache = DetailCache(path)
+            cache.set("rexxar:interests_total:uid", {"total": 1})
+            cache.set("https://book.douban.com/subject/1/", {})
+            cache.close()
+
+            cache = DetailCache(path)
+            self.assertEqual(len(cache), 1)
+            self.assertEqual(cache.get("rexxar:interests_total:uid", listing=True), {"total": 1})
+            cache.close()
+
+    def test_replay_reads_only_from_cache(self):
+        cache = DetailCache()
+        cache.set("https://book.douban.com/subject/1/", {"subject": {"isbn": "1"}})
+        cache.set("rexxar:interests_total:uid", {"total": 1}, listing=True)
+        api = DoubanAPI(user_agent="", cookie="", ck="", cache=cache, replay=True)
+        book = asyncio.run(api.fetch_book_detail("https://book.douban.com/subject/1/"))
+        self.assertEqual(book["subject"]["isbn"], "1")
+        self.assertIsNone(asyncio.run(api.fetch_book_detail("https://book.douban.com/subject/2/")))
+        resp_code, interests = asyncio.run(api.fetch_interests("uid", "book", "done", 0, 20))
+        self.assertEqual(resp_code, 404)
+        self.assertEqual(asyncio.run(api.fetch_interests_total("uid")), (200, {"total": 1}))
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+from douban.checkpoint import CheckpointStore, interest_fingerprint
+
+CST = timezone(timedelta(hours=8))
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def test_progress_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoint.sqlite3")
+            newest = datetime(2022, 11, 23, 10, 22, 58, tzinfo=CST)
+            store = CheckpointStore(path)
+            store.save_progress("book", "done", 40, newest)
+            store.close()
+
+            store = CheckpointStore(path)
+            state = store.get("book", "done")
+            self.assertEqual(state["offset"], 40)
+            self.assertEqual(state["scan_newest"], newest)
+            self.assertIsNone(state["watermark"])
+            self.assertEqual(store.get("movie", "done")["offset"], None)
+            store.close()
+
+    def test_complete_advances_watermark(self):
+        store = CheckpointStore()
+        newest = datetime(2022, 11, 23, tzinfo=CST)
+        store.save_progress("movie", "mark", 0, newest)
+        store.complete("movie", "mark")
+        self.assertEqual(store.get("movie", "mark"), {"watermark": newest, "scan_newest": None, "offset": None})
+
+    def test_failed_scan_keeps_watermark(self):
+        store = CheckpointStore()
+        old = datetime(2022, 1, 1, tzinfo=CST)
+        store.save_progress("movie", "mark", 0, old)
+        store.complete("movie", "mark")
+        store.save_progress("movie", "mark", 0, datetime(2022, 11, 23, tzinfo=CST))
+        store.complete("movie", "mark", success=False)
+        self.assertEqual(store.get("movie", "mark")["watermark"], old)
+
+    def test_fingerprints(self):
+        interest = {"status": "done", "rating": {"star_count": 4}, "tags": ["科幻", "小说"], "comment": "",
+                    "create_time": "2022-11-23 10:22:58", "subject": {"url": "https://book.douban.com/subject/2567698/"}}
+        fingerprint = interest_fingerprint(interest)
+        self.assertEqual(fingerprint, interest_fingerprint(dict(interest, tags=["小说", "科幻"])))
+        self.assertNotEqual(fingerprint, interest_fingerprint(dict(interest, rating={"star_count": 5})))
+        self.assertNotEqual(fingerprint, interest_fingerprint(dict(interest, status="mark")))
+        self.assertNotEqual(fingerprint, interest_fingerprint(dict(interest, comment="好看")))
+
+        store = CheckpointStore()
+        url = interest["subject"]["url"]
+        store.set_fingerprints({url: fingerprint})
+        self.assertEqual(store.get_fingerprints([url, "https://book.douban.com/subject/1/"]), {url: fingerprint})
+        store.close()
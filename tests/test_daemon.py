@@ -0,0 +1,140 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+import aiohttp
+from benchmarks.fake_servers import FakeDouban, FakeNotion, start_server
+from douban.daemon import SyncDaemon
+from douban.metrics import Metrics
+from douban.rate_limit import UnlimitedRateLimiter
+from douban.sync import DoubanNotionSync
+
+
+class FakeSync(object):
+    """
+    按顺序返回给定结果的同步对象，结果为异常时抛出
+    """
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+        self.closed = False
+        self.metrics = Metrics()
+
+    async def async_sync(self):
+        result = self.results[min(self.calls, len(self.results) - 1)]
+        self.calls += 1
+        self.metrics.inc("items_total", result="synced")
+        await asyncio.sleep(0.01)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def close(self):
+        self.closed = True
+
+
+class TestSyncDaemon(unittest.TestCase):
+    def run_daemon(self, daemon, scenario):
+        async def run():
+            task = asyncio.ensure_future(daemon.async_run())
+            try:
+                await scenario()
+            finally:
+                daemon.stop()
+                await asyncio.wait_for(task, 5)
+        asyncio.run(run())
+
+    async def wait_runs(self, daemon, runs):
+        while daemon.runs < runs:
+            await asyncio.sleep(0.01)
+
+    def test_runs_until_stopped_and_survives_errors(self):
+        sync = FakeSync([True, RuntimeError("boom"), False, True])
+        daemon = SyncDaemon(sync, interval=0.02, jitter=0.5, max_failures=2)
+        self.run_daemon(daemon, lambda: self.wait_runs(daemon, 4))
+        self.assertGreaterEqual(daemon.runs, 4)
+        self.assertEqual(daemon.failures, 2)
+        self.assertEqual(daemon.last_run["success"], True)
+        # 守护进程只在 run() 中关闭同步对象
+        self.assertFalse(sync.closed)
+
+    def test_jitter(self):
+        daemon = SyncDaemon(FakeSync([True]), interval=100, jitter=0.2)
+        delays = [daemon.next_delay() for _ in range(200)]
+        self.assertTrue(all(80 <= delay <= 120 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_http_endpoints(self):
+        sync = FakeSync([True, False])
+        daemon = SyncDaemon(sync, interval=3600, port=0, max_failures=1)
+
+        async def scenario():
+            await self.wait_runs(daemon, 1)
+            base_url = f"http://127.0.0.1:{daemon.port}"
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{base_url}/healthz") as resp:
+                    self.assertEqual(resp.status, 200)
+                async with session.get(f"{base_url}/status") as resp:
+                    status = await resp.json()
+                self.assertEqual(status["runs"], 1)
+                self.assertIsNotNone(status["next_run_at"])
+                self.assertEqual(status["metrics"]["items"], 1)
+                async with session.get(f"{base_url}/metrics") as resp:
+                    self.assertIn("douban_sync_items_total", await resp.text())
+
+                # 不需要等待一小时，手动触发下一次同步
+                async with session.post(f"{base_url}/sync") as resp:
+                    self.assertEqual(resp.status, 202)
+                await self.wait_runs(daemon, 2)
+                async with session.get(f"{base_url}/healthz") as resp:
+                    self.assertEqual(resp.status, 503)
+        self.run_daemon(daemon, scenario)
+        self.assertEqual(sync.calls, 2)
+
+    def test_run_closes_sync(self):
+        sync = FakeSync([True])
+        daemon = SyncDaemon(sync, interval=3600, after_run=lambda: daemon.stop())
+        daemon.run()
+        self.assertEqual(daemon.runs, 1)
+        self.assertTrue(sync.closed)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_resident_sync(self):
+        douban = FakeDouban(items=20)
+        notion = FakeNotion()
+
+        async def run(state_dir):
+            runners = [await start_server(douban), await start_server(notion)]
+            sync = DoubanNotionSync(user_agent="test", cookie="", ck="test", uid="test", token="test",
+                                    movie_database_id="movie-database",
+                                    book_database_id="book-database",
+                                    state_dir=state_dir,
+                                    douban_rate_limiter=UnlimitedRateLimiter(),
+                                    notion_rate_limiter=UnlimitedRateLimiter(),
+                                    parse_executor="thread",
+                                    douban_base_url=douban.base_url,
+                                    notion_base_url=notion.base_url)
+            daemon = SyncDaemon(sync, interval=0.01)
+            task = asyncio.ensure_future(daemon.async_run())
+            try:
+                await self.wait_runs(daemon, 1)
+                session = sync.api.session
+                douban.stats.clear()
+                notion.stats.clear()
+                await self.wait_runs(daemon, 3)
+                self.assertIs(sync.api.session, session)
+            finally:
+                daemon.stop()
+                await asyncio.wait_for(task, 5)
+                await sync.close()
+                for runner, _ in runners:
+                    await runner.cleanup()
+            # 之后的运行复用会话、索引和检查点，不再请求详情页，也不访问 Notion
+            self.assertEqual(daemon.failures, 0)
+            self.assertEqual(douban.stats["GET /{interest_type}/subject/{subject_id}/"], 0)
+            self.assertEqual(sum(notion.stats.values()), 0)
+            self.assertEqual(len(notion.databases["movie-database"]) + len(notion.databases["book-database"]), 20)
+
+        with tempfile.TemporaryDirectory() as state_dir:
+            asyncio.run(run(state_dir))
@@ -1,10 +1,12 @@
 import os
 import unittest
 import asyncio
+import contextlib
 from pprint import pprint
 from dotenv import load_dotenv
-from douban.douban_query import DoubanAPI
-from douban.notion_database import NotionBookDatabase, NotionMovieDatabase
+from benchmarks.fake_servers import FakeDouban, start_server
+from douban.douban_query import DoubanAPI, interest_time, normalize_content
+from douban.notion_database import NotionBookDatabase, NotionMovieDatabase, make_content_blocks
 
 
 class TestDoubanQuery(unittest.TestCase):
@@ -65,13 +67,87 @@ class TestDoubanQuery(unittest.TestCase):
                         details = loop.run_until_complete(api.fetch_movie_detail(detail_url))
                         interest['subject'].update(details['subject'])
                         body = movie_db.construct_data(interest)
-                        is_exist, page_id = movie_db.check_exist(interest)
+                        is_exist, page_id = loop.run_until_complete(movie_db.check_exist(interest))
                         print(interest['subject']['title'], is_exist)
                         # pprint(body)
                     elif interest_type == "book":
                         details = loop.run_until_complete(api.fetch_book_detail(detail_url))
                         interest['subject'].update(details['subject'])
                         body = book_db.construct_data(interest)
-                        is_exist, page_id = book_db.check_exist(interest)
+                        is_exist, page_id = loop.run_until_complete(book_db.check_exist(interest))
                         print(interest['subject']['title'], is_exist)
                         # pprint(body)
+
+
+class TestIterInterests(unittest.TestCase):
+    """
+    使用本地模拟的豆瓣服务，不需要网络
+    """
+    def run_with_api(self, douban, func):
+        async def run():
+            runner, base_url = await start_server(douban)
+            api = DoubanAPI(user_agent="test", cookie="", ck="test", rexxar_base=base_url, concurrency=2)
+            try:
+                return await func(api)
+            finally:
+                await api.close()
+                await runner.cleanup()
+        return asyncio.run(run())
+
+    def test_iterates_all_pages_in_order(self):
+        douban = FakeDouban(items=300, broken={6})
+
+        async def collect(api):
+            return [interest async for interest in api.iter_interests("test", "movie", "doing", prefetch=2)]
+        interests = self.run_with_api(douban, collect)
+        # movie/doing 为第 0, 6, 12, ... 条，第6条异常被跳过
+        self.assertEqual([interest["id"] for interest in interests], list(range(0, 300, 6))[:1] + list(range(12, 300, 6)))
+
+    def test_since_stops_iteration_and_prefetch(self):
+        douban = FakeDouban(items=1200)
+
+        async def collect(api):
+            first = [interest async for interest in api.iter_interests("test", "book", "done")]
+            since = interest_time(first[29])
+            return [interest async for interest in api.iter_interests("test", "book", "done", since=since, prefetch=1)]
+        interests = self.run_with_api(douban, collect)
+        self.assertEqual(len(interests), 29)
+        # 完整遍历 10 页；之后第 2 页出现不晚于 since 的条目，不再预取第 3 页
+        self.assertEqual(douban.stats["GET /rexxar/api/v2/user/{uid}/interests"], 10 + 2)
+
+    def test_early_exit_cancels_prefetch(self):
+        douban = FakeDouban(items=1200)
+
+        async def first_page(api):
+            pages = api.iter_interest_pages("test", "movie", "mark", prefetch=3)
+            async with contextlib.aclosing(pages):
+                async for page in pages:
+                    return page
+        page = self.run_with_api(douban, first_page)
+        self.assertEqual((page.start, page.total, page.complete, len(page.items)), (0, 200, True, 20))
+
+
+class TestContents(unittest.TestCase):
+    def test_normalize_content(self):
+        annotation = normalize_content("annotations", {
+            "id": 1, "title": "笔记", "abstract": "内容", "create_time": "2022-12-01 12:00:00", "page": 12,
+            "sharing_url": "https://book.douban.com/annotation/1/",
+            "book": {"url": "https://book.douban.com/subject/2567698", "title": "三体"}})
+        self.assertEqual(annotation["subject_url"], "https://book.douban.com/subject/2567698/")
+        self.assertEqual(annotation["note"], "第12页")
+        status = normalize_content("timeline", {"status": {
+            "id": 2, "text": "看过", "create_time": "2022-12-01 12:00:00",
+            "card": {"url": "https://movie.douban.com/subject/1292052/", "title": "肖申克的救赎"}}})
+        self.assertEqual((status["id"], status["title"]), ("2", "肖申克的救赎"))
+        # 没有关联书影条目的广播
+        self.assertIsNone(normalize_content("timeline", {"status": {
+            "id": 3, "text": "今天天气不错", "create_time": "2022-12-01 12:00:00"}}))
+
+    def test_long_text_is_split(self):
+        content = normalize_content("reviews", {
+            "id": 1, "title": "评论", "abstract": "字" * 4500, "create_time": "2022-12-01 12:00:00",
+            "rating": {"value": 4}, "subject": {"url": "https://movie.douban.com/subject/1292052/"}})
+        blocks = make_content_blocks(content)
+        self.assertEqual([block["type"] for block in blocks],
+                         ["heading_3", "paragraph", "paragraph", "paragraph", "paragraph", "divider"])
+        self.assertEqual(blocks[1]["paragraph"]["rich_text"][0]["text"]["content"], "2022-12-01 12:00:00 · ⭐⭐⭐⭐")
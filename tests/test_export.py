@@ -0,0 +1,117 @@
+import gzip
+import os
+import asyncio
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeDouban, start_server
+from douban.export import DoubanExport
+from douban.rate_limit import UnlimitedRateLimiter
+from douban.snapshot import JSONLSnapshot, ParquetSnapshot, load_latest, open_snapshot, pyarrow
+
+
+class TestDoubanExport(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+
+    def run_export(self, douban, path):
+        async def run():
+            export = DoubanExport(user_agent="test", cookie="", ck="test", uid="test", path=path,
+                                  douban_rate_limiter=UnlimitedRateLimiter(),
+                                  parse_executor="inline",
+                                  douban_base_url=douban.base_url)
+            try:
+                return await export.async_export(), export.written
+            finally:
+                await export.close()
+        return self.loop.run_until_complete(run())
+
+    def check_export(self, path):
+        douban = FakeDouban(items=60)
+        runner, _ = self.loop.run_until_complete(start_server(douban))
+        self.addCleanup(self.loop.run_until_complete, runner.cleanup())
+        self.assertEqual(self.run_export(douban, path), (True, 60))
+        latest = load_latest(open_snapshot(path))
+        self.assertEqual(len(latest), 60)
+        movie = next(record for record in latest.values() if record["interest_type"] == "movie")
+        self.assertEqual(movie["subject"]["imdb"], "tt0111161")
+
+        # 重新运行只追加修改过的条目
+        self.assertEqual(self.run_export(douban, path), (True, 0))
+        douban.edit(7, comment="重看")
+        self.assertEqual(self.run_export(douban, path), (True, 1))
+        latest = load_latest(open_snapshot(path))
+        self.assertEqual(len(latest), 60)
+        self.assertEqual(latest[f"{douban.base_url}/movie/subject/1000007/"]["comment"], "重看")
+
+    def test_export_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_export(os.path.join(tmp, "douban.jsonl.gz"))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_export_parquet(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_export(os.path.join(tmp, "douban.parquet"))
+
+    def write_batches(self, path, *batches):
+        snapshot = JSONLSnapshot(path)
+        for batch in batches:
+            for i in batch:
+                snapshot.write({"subject": {"url": f"u{i}"}, "fingerprint": str(i)})
+            snapshot.flush()
+        snapshot.close()
+
+    def test_truncated_jsonl_is_tolerated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "douban.jsonl.gz")
+            self.write_batches(path, range(3))
+            complete = os.path.getsize(path)
+            self.write_batches(path, range(3, 6))
+            # 模拟进程在写入第二批的过程中被杀死：第二个 gzip 成员只写了一半
+            with open(path, "r+b") as f:
+                f.truncate((complete + os.path.getsize(path)) // 2)
+            self.assertEqual(JSONLSnapshot(path).fingerprints(), {"u0": "0", "u1": "1", "u2": "2"})
+
+            # 重新运行时截掉不完整的成员再追加，之后写入的条目都能读到
+            self.write_batches(path, range(3, 6))
+            self.assertEqual(os.path.getsize(path), complete + complete)
+            self.assertEqual(JSONLSnapshot(path).fingerprints(), {f"u{i}": str(i) for i in range(6)})
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(len(f.readlines()), 6)
+
+    def test_corrupted_jsonl_is_tolerated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "douban.jsonl.gz")
+            self.write_batches(path, range(3))
+            complete = os.path.getsize(path)
+            self.write_batches(path, range(3, 6))
+            with open(path, "r+b") as f:
+                f.seek((complete + os.path.getsize(path)) // 2)
+                f.write(b"\xff" * 4)
+            self.assertEqual(JSONLSnapshot(path).fingerprints(), {"u0": "0", "u1": "1", "u2": "2"})
+            self.write_batches(path, [6])
+            self.assertEqual(JSONLSnapshot(path).fingerprints(), {"u0": "0", "u1": "1", "u2": "2", "u6": "6"})
+
+    def test_truncated_plain_jsonl_is_tolerated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "douban.jsonl")
+            self.write_batches(path, range(3))
+            with open(path, "a") as f:
+                f.write('{"subject": {"url": "u3"}, "finger')
+            self.write_batches(path, [4])
+            self.assertEqual(JSONLSnapshot(path).fingerprints(), {"u0": "0", "u1": "1", "u2": "2", "u4": "4"})
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_interrupted_parquet_keeps_written_parts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "douban.parquet")
+            snapshot = ParquetSnapshot(path, row_group_size=2)
+            for i in range(3):
+                snapshot.write({"subject": {"url": f"u{i}"}, "interest_type": "book", "status": "done",
+                                "create_time": "2022-11-23 10:22:58", "fingerprint": str(i)})
+                snapshot.flush()
+            # 模拟进程在 close() 之前被杀死：已经写满的行组可以读取
+            self.assertEqual(ParquetSnapshot(path).fingerprints(), {"u0": "0", "u1": "1"})
+            snapshot.close()
+            self.assertEqual(ParquetSnapshot(path).fingerprints(), {"u0": "0", "u1": "1", "u2": "2"})
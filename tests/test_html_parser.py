@@ -0,0 +1,34 @@
+import os
+import unittest
+from douban.html_parser import available_backends, parse_book_detail, parse_movie_detail
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TestHtmlParser(unittest.TestCase):
+    def test_movie(self):
+        data = parse_movie_detail(read_fixture("movie_1292052.html"), "soup")["subject"]
+        self.assertEqual(data["movie_director"], ["弗兰克·德拉邦特"])
+        self.assertEqual(data["screenwriter"], ["弗兰克·德拉邦特", "斯蒂芬·金"])
+        self.assertEqual(data["movie_categories"], "电影")
+        self.assertEqual(data["movie_duration"], "142")
+        self.assertEqual(data["imdb"], "tt0111161")
+        self.assertTrue(data["related_intro"].startswith("一场谋杀案"))
+
+    def test_book(self):
+        data = parse_book_detail(read_fixture("book_2567698.html"), "soup")["subject"]
+        self.assertEqual(data, {"isbn": "9787536692930", "book_price": 23.0})
+
+    def test_backends_match_soup(self):
+        for name in sorted(os.listdir(FIXTURE_DIR)):
+            html = read_fixture(name)
+            parse = parse_book_detail if name.startswith("book") else parse_movie_detail
+            expected = parse(html, "soup")
+            for backend in available_backends():
+                with self.subTest(page=name, backend=backend):
+                    self.assertEqual(parse(html, backend), expected)
@@ -0,0 +1,32 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+from douban.lazy_import import LazyModule, lazy_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["bs4", "lxml", "pyarrow", "numpy", "aiohttp.web", "pyinstrument"]
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_optional_missing_module(self):
+        self.assertIsNone(lazy_import("douban_no_such_module", optional=True))
+
+    def test_loads_on_first_attribute_access(self):
+        module = lazy_import("json", optional=True)
+        self.assertIsInstance(module, LazyModule)
+        self.assertIn("not loaded", repr(module))
+        self.assertEqual(module.dumps([1]), "[1]")
+        self.assertIn("(loaded)", repr(module))
+
+    def test_submodules(self):
+        module = lazy_import("email", "email.utils")
+        self.assertTrue(callable(module.utils.parsedate_to_datetime))
+
+    def test_cli_startup_does_not_import_heavy_modules(self):
+        # 在新的解释器中检查，避免受到其他测试已经导入的模块影响
+        code = ("import sys, json, sync_douban; "
+                f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(output.stdout.strip().splitlines()[-1]), [])
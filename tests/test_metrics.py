@@ -0,0 +1,71 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from douban.metrics import Histogram, Metrics
+from douban.rate_limit import TokenBucket
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+        for value in [0.5] * 50 + [1.5] * 45 + [3.0] * 5:
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.sum, 25 + 67.5 + 15)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.0)
+        self.assertAlmostEqual(histogram.quantile(0.95), 2.0)
+        self.assertLessEqual(histogram.quantile(0.99), 3.0)
+
+    def test_overflow_bucket_is_capped_by_max(self):
+        histogram = Histogram(buckets=(1.0,))
+        histogram.observe(7.0)
+        self.assertEqual(histogram.quantile(1.0), 7.0)
+        self.assertLessEqual(histogram.quantile(0.5), 7.0)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+
+class TestMetrics(unittest.TestCase):
+    def make_metrics(self):
+        metrics = Metrics()
+        metrics.inc("requests_total", upstream="douban", endpoint="subject", status=200)
+        metrics.inc("requests_total", upstream="douban", endpoint="subject", status=200)
+        metrics.inc("items_total", interest_type="movie", result="synced")
+        metrics.observe("request_seconds", 0.2, upstream="douban", endpoint="subject")
+        metrics.set("cache_hit_ratio", 0.5)
+        return metrics
+
+    def test_summary(self):
+        summary = self.make_metrics().summary()
+        self.assertEqual(summary["items"], 1)
+        self.assertEqual(summary["counters"]["requests_total{endpoint=subject,status=200,upstream=douban}"], 2)
+        self.assertEqual(summary["histograms"]["request_seconds{endpoint=subject,upstream=douban}"]["count"], 1)
+        self.assertEqual(summary["gauges"]["cache_hit_ratio"], 0.5)
+        json.dumps(summary)
+
+    def test_prometheus_textfile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "douban.prom")
+            self.make_metrics().write_prometheus(path)
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        self.assertIn("# TYPE douban_sync_requests_total counter\n", text)
+        self.assertIn('douban_sync_requests_total{endpoint="subject",status="200",upstream="douban"} 2\n', text)
+        self.assertIn("# TYPE douban_sync_request_seconds histogram\n", text)
+        self.assertIn('douban_sync_request_seconds_bucket{endpoint="subject",upstream="douban",le="0.25"} 1\n', text)
+        self.assertIn('douban_sync_request_seconds_bucket{endpoint="subject",upstream="douban",le="+Inf"} 1\n', text)
+        self.assertIn('douban_sync_request_seconds_count{endpoint="subject",upstream="douban"} 1\n', text)
+        self.assertIn("douban_sync_elapsed_seconds ", text)
+
+    def test_rate_limiter_wait_is_recorded(self):
+        limiter = TokenBucket(rate=20, capacity=1)
+
+        async def run():
+            for _ in range(3):
+                await limiter.acquire()
+        asyncio.run(run())
+        self.assertGreaterEqual(limiter.waited, 0.09)
+        metrics = Metrics()
+        metrics.record_rate_limiter("douban", limiter)
+        self.assertGreaterEqual(metrics.summary()["gauges"]["rate_limit_wait_seconds{upstream=douban}"], 0.09)
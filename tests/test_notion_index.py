@@ -0,0 +1,110 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from douban.notion_index import NotionURLIndex, normalize_properties
+
+
+class FakeDatabases(object):
+    def __init__(self, pages, page_size):
+        self.pages = pages
+        self.page_size = page_size
+        self.calls = 0
+
+    async def query(self, database_id, page_size=100, start_cursor=None):
+        self.calls += 1
+        start = int(start_cursor or 0)
+        end = start + self.page_size
+        return {
+            "results": self.pages[start:end],
+            "has_more": end < len(self.pages),
+            "next_cursor": str(end) if end < len(self.pages) else None,
+        }
+
+
+class FakeNotion(object):
+    def __init__(self, pages, page_size=2):
+        self.databases = FakeDatabases(pages, page_size)
+
+
+def make_page(i):
+    return {
+        "id": f"page-{i}",
+        "properties": {
+            "书名": {"type": "title", "title": [{"plain_text": f"book {i}", "text": {"content": f"book {i}"}}]},
+            "豆瓣链接": {"type": "url", "url": f"https://book.douban.com/subject/{i}/"},
+            "短评": {"type": "rich_text", "rich_text": []},
+        }
+    }
+
+
+class TestNotionURLIndex(unittest.TestCase):
+    def test_build_paginates(self):
+        notion = FakeNotion([make_page(i) for i in range(5)])
+        index = NotionURLIndex()
+        asyncio.run(index.ensure(notion.databases.query, "db"))
+        self.assertEqual(notion.databases.calls, 3)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.get("https://book.douban.com/subject/3/")["page_id"], "page-3")
+        asyncio.run(index.ensure(notion.databases.query, "db"))
+        self.assertEqual(notion.databases.calls, 3)
+
+    def test_request_and_response_normalize_alike(self):
+        request_properties = {
+            "书名": {"title": [{"type": "text", "text": {"content": "book 1"}}]},
+            "豆瓣链接": {"url": "https://book.douban.com/subject/1/"},
+        }
+        self.assertEqual(normalize_properties(request_properties), normalize_properties(make_page(1)["properties"]))
+
+    def test_journal_survives_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.jsonl")
+            index = NotionURLIndex(path)
+            asyncio.run(index.ensure(FakeNotion([make_page(1)]).databases.query, "db"))
+            index.set("https://book.douban.com/subject/2/", "page-2", make_page(2)["properties"])
+            index.remove("https://book.douban.com/subject/1/")
+
+            reloaded = NotionURLIndex(path)
+            self.assertTrue(reloaded.load())
+            self.assertNotIn("https://book.douban.com/subject/1/", reloaded)
+            self.assertEqual(reloaded.get("https://book.douban.com/subject/2/")["page_id"], "page-2")
+
+    def test_fingerprint_is_kept_out_of_snapshot(self):
+        page = make_page(1)
+        page["properties"]["同步指纹"] = {"type": "rich_text",
+                                       "rich_text": [{"plain_text": "abc", "text": {"content": "abc"}}]}
+        index = NotionURLIndex()
+        asyncio.run(index.ensure(FakeNotion([page]).databases.query, "db"))
+        entry = index.get("https://book.douban.com/subject/1/")
+        self.assertEqual(entry["fingerprint"], "abc")
+        self.assertNotIn("同步指纹", entry["properties"])
+
+        # 部分更新时旧的指纹失效，由调用者给出新的指纹
+        index.merge("https://book.douban.com/subject/1/", "page-1", {"短评": {"rich_text": []}})
+        self.assertIsNone(index.get("https://book.douban.com/subject/1/")["fingerprint"])
+        index.merge("https://book.douban.com/subject/1/", "page-1", {}, "def")
+        self.assertEqual(index.get("https://book.douban.com/subject/1/")["fingerprint"], "def")
+
+    def test_fingerprint_survives_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.jsonl")
+            index = NotionURLIndex(path)
+            asyncio.run(index.ensure(FakeNotion([]).databases.query, "db"))
+            index.set("https://book.douban.com/subject/2/", "page-2", make_page(2)["properties"], "abc")
+            reloaded = NotionURLIndex(path)
+            self.assertTrue(reloaded.load())
+            self.assertEqual(reloaded.get("https://book.douban.com/subject/2/")["fingerprint"], "abc")
+
+    def test_loads_entries_written_with_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('{"url": "https://book.douban.com/subject/1/", "page_id": "page-1", "hash": "x", '
+                        '"properties": {"短评": "好书"}}\n')
+            index = NotionURLIndex(path)
+            self.assertTrue(index.load())
+            self.assertEqual(index.get("https://book.douban.com/subject/1/"),
+                             {"page_id": "page-1", "properties": {"短评": "好书"}, "fingerprint": None})
+            index.save()
+            with open(path, "r", encoding="utf-8") as f:
+                self.assertNotIn('"hash"', f.read())
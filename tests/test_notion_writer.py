@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+from unittest import mock
+import httpx
+from notion_client import APIResponseError, APIErrorCode
+from douban.notion_writer import NotionWriter
+from douban.notion_database import NotionBookDatabase
+
+
+def make_api_error(status):
+    response = httpx.Response(status, request=httpx.Request("POST", "https://api.notion.com/v1/pages"))
+    return APIResponseError(response, "error", APIErrorCode.RateLimited)
+
+
+def make_interest(rating=4, tags=("小说",)):
+    return {
+        "status": "done",
+        "create_time": "2022-11-23 10:22:58",
+        "rating": {"star_count": rating} if rating else None,
+        "comment": "",
+        "tags": list(tags),
+        "subject": {
+            "title": "三体",
+            "url": "https://book.douban.com/subject/2567698/",
+            "cover_url": "https://img2.doubanio.com/view/subject/s/public/s2768378.jpg",
+            "author": ["刘慈欣"],
+            "pubdate": ["2008-1"],
+            "press": ["重庆出版社"],
+            "pages": ["302"],
+            "rating": {"value": 8.9, "count": 100},
+        },
+    }
+
+
+class FakePages(object):
+    def __init__(self):
+        self.created = []
+        self.updated = []
+
+    async def create(self, **body):
+        self.created.append(body)
+        return {"id": "page-1"}
+
+    async def update(self, page_id, **body):
+        self.updated.append(body)
+        return {"id": page_id}
+
+
+class FakeDatabases(object):
+    async def query(self, **kwargs):
+        return {"results": [], "has_more": False}
+
+
+class FingerprintDatabases(object):
+    """
+    有同步指纹属性的数据库，查询时返回已创建的页面
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.retrieved = 0
+
+    async def retrieve(self, database_id):
+        self.retrieved += 1
+        return {"id": database_id, "properties": {"同步指纹": {"type": "rich_text", "rich_text": {}}}}
+
+    async def query(self, **kwargs):
+        results = [{"id": f"page-{i}", "properties": body["properties"]} for i, body in enumerate(self.pages.created)]
+        return {"results": results, "has_more": False}
+
+
+class FakeNotion(object):
+    def __init__(self, fingerprint=False):
+        self.pages = FakePages()
+        self.databases = FingerprintDatabases(self.pages) if fingerprint else FakeDatabases()
+
+
+class TestNotionWriter(unittest.TestCase):
+    def test_retries_throttled_requests(self):
+        calls = []
+
+        async def request():
+            calls.append(1)
+            if len(calls) < 3:
+                raise make_api_error(429)
+            return "ok"
+
+        async def run():
+            writer = NotionWriter(workers=1, retry_backoff=0.001)
+            try:
+                return await writer.submit(request, "test")
+            finally:
+                await writer.close()
+        self.assertEqual(asyncio.run(run()), "ok")
+        self.assertEqual(len(calls), 3)
+
+    def test_does_not_retry_validation_errors(self):
+        async def request():
+            raise make_api_error(400)
+
+        async def run():
+            writer = NotionWriter(workers=1, retry_backoff=0.001)
+            try:
+                await writer.submit(request, "test")
+            finally:
+                await writer.close()
+        with self.assertRaises(APIResponseError):
+            asyncio.run(run())
+
+    def test_only_changed_properties_are_written(self):
+        async def run():
+            db = NotionBookDatabase(notion_token="token", notion_database_id="db", writer=NotionWriter(workers=2))
+            await db.notion.aclose()
+            db.notion = FakeNotion()
+            self.assertTrue(await db.sync(make_interest()))
+            self.assertTrue(await db.sync(make_interest()))
+            self.assertTrue(await db.sync(make_interest(rating=5)))
+            await db.writer.close()
+            return db.notion.pages
+        pages = asyncio.run(run())
+        self.assertEqual(len(pages.created), 1)
+        self.assertEqual(len(pages.updated), 1)
+        self.assertEqual(list(pages.updated[0]["properties"]), ["个人评分"])
+
+    def test_unchanged_fingerprint_skips_diff(self):
+        async def make_db(notion):
+            db = NotionBookDatabase(notion_token="token", notion_database_id="db")
+            await db.notion.aclose()
+            db.notion = notion
+            return db
+
+        async def run():
+            notion = FakeNotion(fingerprint=True)
+            db = await make_db(notion)
+            self.assertTrue(await db.sync(make_interest()))
+            created = notion.pages.created[0]["properties"]
+            self.assertEqual(db.index.get(make_interest()["subject"]["url"])["fingerprint"],
+                             created["同步指纹"]["rich_text"][0]["text"]["content"])
+            with mock.patch.object(db.schema, "diff") as diff:
+                self.assertTrue(await db.sync(make_interest()))
+                diff.assert_not_called()
+            # 有个人评分时修改标签也会更新，并写入新的指纹
+            self.assertTrue(await db.sync(make_interest(tags=("小说", "科幻"))))
+            self.assertEqual(set(notion.pages.updated[0]["properties"]), {"类型", "同步指纹"})
+
+            # 从 Notion 重建索引后，指纹从页面中读出
+            notion.pages.created[0]["properties"].update(notion.pages.updated[0]["properties"])
+            rebuilt = await make_db(notion)
+            with mock.patch.object(rebuilt.schema, "diff") as diff:
+                self.assertTrue(await rebuilt.sync(make_interest(tags=("小说", "科幻"))))
+                diff.assert_not_called()
+            return notion
+        notion = asyncio.run(run())
+        self.assertEqual(len(notion.pages.created), 1)
+        self.assertEqual(len(notion.pages.updated), 1)
+        self.assertEqual(notion.databases.retrieved, 1)
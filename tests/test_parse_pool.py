@@ -0,0 +1,35 @@
+import os
+import asyncio
+import unittest
+from douban.html_parser import parse_movie_detail
+from douban.parse_pool import DetailParserPool
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "movie_1292052.html")
+
+
+class TestDetailParserPool(unittest.TestCase):
+    def test_executors_match_inline(self):
+        with open(FIXTURE, "r", encoding="utf-8") as f:
+            html = f.read()
+        expected = parse_movie_detail(html, "fragment")
+
+        async def run(executor):
+            pool = DetailParserPool(executor=executor, workers=2, backend="fragment")
+            try:
+                return await asyncio.gather(*[pool.parse(parse_movie_detail, html) for _ in range(5)])
+            finally:
+                await pool.close()
+
+        for executor in ["inline", "thread", "process"]:
+            with self.subTest(executor=executor):
+                self.assertEqual(asyncio.run(run(executor)), [expected] * 5)
+
+    def test_errors_are_propagated(self):
+        async def run():
+            pool = DetailParserPool(executor="thread", workers=1, backend="fragment")
+            try:
+                await pool.parse(parse_movie_detail, "<html></html>")
+            finally:
+                await pool.close()
+        with self.assertRaises(IndexError):
+            asyncio.run(run())
@@ -0,0 +1,48 @@
+import os
+import glob
+import pstats
+import tempfile
+import tracemalloc
+import unittest
+from douban.profiling import profile, pyinstrument
+
+
+def allocate():
+    return [{"properties": {"名字": str(i)}} for i in range(20000)]
+
+
+class TestProfile(unittest.TestCase):
+    def test_cprofile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with profile("cprofile", tmp):
+                allocate()
+            [path] = glob.glob(os.path.join(tmp, "sync-profile-*.prof"))
+            self.assertTrue(any(func[2] == "allocate" for func in pstats.Stats(path).stats))
+            with open(path[:-len(".prof")] + ".txt", encoding="utf-8") as f:
+                self.assertIn("allocate", f.read())
+
+    def test_tracemalloc(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with profile("tracemalloc", tmp, name="export"):
+                data = allocate()
+            self.assertFalse(tracemalloc.is_tracing())
+            [path] = glob.glob(os.path.join(tmp, "export-profile-*.tracemalloc"))
+            snapshot = tracemalloc.Snapshot.load(path)
+            self.assertGreater(len(snapshot.traces), 0)
+            with open(path[:-len(".tracemalloc")] + ".txt", encoding="utf-8") as f:
+                report = f.read()
+            self.assertIn("test_profiling.py", report.split("按调用栈:")[0])
+            del data
+
+    @unittest.skipIf(pyinstrument is None, "pyinstrument is not installed")
+    def test_pyinstrument(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with profile("pyinstrument", tmp):
+                allocate()
+            self.assertEqual(len(glob.glob(os.path.join(tmp, "sync-profile-*.html"))), 1)
+
+    def test_disabled_and_unknown_modes(self):
+        with profile(None):
+            pass
+        with self.assertRaises(ValueError):
+            profile("perf")
@@ -0,0 +1,28 @@
+import time
+import asyncio
+import unittest
+from douban.rate_limit import TokenBucket, UnlimitedRateLimiter, make_rate_limiter
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_is_free(self):
+        async def run():
+            bucket = TokenBucket(rate=1, capacity=3)
+            begin = time.monotonic()
+            for _ in range(3):
+                await bucket.acquire()
+            return time.monotonic() - begin
+        self.assertLess(asyncio.run(run()), 0.05)
+
+    def test_rate_is_enforced(self):
+        async def run():
+            bucket = TokenBucket(rate=20, capacity=1)
+            begin = time.monotonic()
+            await asyncio.gather(*[bucket.acquire() for _ in range(5)])
+            return time.monotonic() - begin
+        # 第一个令牌立即可用，其余 4 个每个 50ms
+        self.assertGreaterEqual(asyncio.run(run()), 0.19)
+
+    def test_make_rate_limiter(self):
+        self.assertIsInstance(make_rate_limiter(0), UnlimitedRateLimiter)
+        self.assertIsInstance(make_rate_limiter(3, 3), TokenBucket)
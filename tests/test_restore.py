@@ -0,0 +1,89 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeDouban, FakeNotion, start_server
+from douban.checkpoint import CheckpointStore
+from douban.export import DoubanExport
+from douban.rate_limit import UnlimitedRateLimiter
+from douban.restore import NotionRestore
+from douban.snapshot import JSONLSnapshot
+
+
+class TestNotionRestore(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+
+    def start(self, service):
+        runner, _ = self.loop.run_until_complete(start_server(service))
+        self.addCleanup(self.loop.run_until_complete, runner.cleanup())
+
+    def export(self, path):
+        douban = FakeDouban(items=60)
+        self.start(douban)
+
+        async def run():
+            export = DoubanExport(user_agent="test", cookie="", ck="test", uid="test", path=path,
+                                  douban_rate_limiter=UnlimitedRateLimiter(),
+                                  parse_executor="inline",
+                                  douban_base_url=douban.base_url)
+            try:
+                self.assertTrue(await export.async_export())
+            finally:
+                await export.close()
+        self.loop.run_until_complete(run())
+
+    def run_restore(self, notion, path, state_dir):
+        async def run():
+            restore = NotionRestore(token="test",
+                                    movie_database_id="movie-database",
+                                    book_database_id="book-database",
+                                    path=path,
+                                    state_dir=state_dir,
+                                    notion_rate_limiter=UnlimitedRateLimiter(),
+                                    notion_base_url=notion.base_url)
+            try:
+                return await restore.async_restore(), restore.created
+            finally:
+                await restore.close()
+        return self.loop.run_until_complete(run())
+
+    def test_restore_and_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "douban.jsonl.gz")
+            state_dir = os.path.join(tmp, "state")
+            self.export(path)
+            notion = FakeNotion(rate_limited=0.05, retry_after=0)
+            self.start(notion)
+
+            # 模拟中断：先只恢复快照中的前20条
+            records = list(JSONLSnapshot(path))
+            partial = JSONLSnapshot(os.path.join(tmp, "partial.jsonl.gz"))
+            for record in records[:20]:
+                partial.write(record)
+            partial.close()
+            self.assertEqual(self.run_restore(notion, partial.path, state_dir), (True, 20))
+
+            # 重新运行只创建剩下的条目，不会产生重复页面
+            self.assertEqual(self.run_restore(notion, path, state_dir), (True, 40))
+            self.assertEqual(len(notion.databases["movie-database"]), 30)
+            self.assertEqual(len(notion.databases["book-database"]), 30)
+            self.assertGreater(notion.stats["429"], 0)
+
+            notion.stats.clear()
+            self.assertEqual(self.run_restore(notion, path, state_dir), (True, 0))
+            self.assertEqual(sum(notion.stats.values()), 0)
+
+            # 恢复的条目写入检查点指纹，之后的同步可以发现修改
+            checkpoint = CheckpointStore(os.path.join(state_dir, "checkpoint.sqlite3"))
+            self.addCleanup(checkpoint.close)
+            self.assertEqual(len(checkpoint.get_fingerprints(record["subject"]["url"] for record in records)), 60)
+
+    def test_missing_snapshot(self):
+        notion = FakeNotion()
+        self.start(notion)
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(self.run_restore(notion, os.path.join(tmp, "missing.jsonl.gz"), tmp), (False, 0))
+            self.assertEqual(sum(notion.stats.values()), 0)
@@ -0,0 +1,121 @@
+import time
+import asyncio
+import unittest
+import httpx
+from notion_client import APIResponseError, APIErrorCode
+from douban.retry import (RETRY, FAILURE, CircuitBreaker, CircuitOpenError, Retrier, RetryPolicy,
+                          parse_retry_after)
+from douban.notion_writer import classify_notion_error
+from douban.rate_limit import UnlimitedRateLimiter
+
+
+def make_api_error(status, headers=None):
+    response = httpx.Response(status, headers=headers,
+                              request=httpx.Request("POST", "https://api.notion.com/v1/pages"))
+    return APIResponseError(response, "error", APIErrorCode.RateLimited)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_exponential_backoff_with_jitter(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0, jitter=0.5)
+        for attempt, upper in [(0, 1.0), (1, 2.0), (2, 4.0), (5, 5.0)]:
+            delay = policy.delay(attempt)
+            self.assertLessEqual(delay, upper)
+            self.assertGreaterEqual(delay, upper * 0.5)
+
+    def test_retry_after_takes_precedence(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=60.0, jitter=0.5)
+        delay = policy.delay(0, retry_after=10)
+        self.assertGreaterEqual(delay, 10)
+        self.assertLessEqual(delay, 10.5)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures_and_probes(self):
+        breaker = CircuitBreaker("pages.create", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.check()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half-open")
+        breaker.check()
+        # 半开状态只放行一个探测请求
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("pages.create", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.check()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+
+class TestRetrier(unittest.TestCase):
+    def test_classify_notion_error(self):
+        self.assertEqual(classify_notion_error(make_api_error(429, {"Retry-After": "2"})), (RETRY, 2.0))
+        self.assertEqual(classify_notion_error(make_api_error(502)), (FAILURE, None))
+        self.assertEqual(classify_notion_error(make_api_error(400)), (None, None))
+        self.assertEqual(classify_notion_error(httpx.ConnectError("boom")), (FAILURE, None))
+
+    def test_retry_after_pauses_rate_limiter(self):
+        limiter = UnlimitedRateLimiter()
+        retrier = Retrier(classify_notion_error, RetryPolicy(base_delay=0.001), rate_limiter=limiter)
+        calls = []
+
+        async def request():
+            await limiter.acquire()
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise make_api_error(429, {"Retry-After": "0.1"})
+            return "ok"
+
+        self.assertEqual(asyncio.run(retrier.call("pages.create", request)), "ok")
+        self.assertGreaterEqual(calls[1] - calls[0], 0.1)
+
+    def test_throttling_does_not_open_circuit(self):
+        retrier = Retrier(classify_notion_error, RetryPolicy(max_retries=5, base_delay=0.001), failure_threshold=2)
+        calls = []
+
+        async def request():
+            calls.append(1)
+            if len(calls) <= 4:
+                raise make_api_error(429)
+            return "ok"
+
+        self.assertEqual(asyncio.run(retrier.call("pages.create", request)), "ok")
+        self.assertEqual(retrier.breaker("pages.create").state, "closed")
+
+    def test_circuit_fails_fast(self):
+        retrier = Retrier(classify_notion_error, RetryPolicy(max_retries=1, base_delay=0.001),
+                          failure_threshold=2, reset_timeout=60)
+        calls = []
+
+        async def request():
+            calls.append(1)
+            raise make_api_error(503)
+
+        async def run():
+            with self.assertRaises(APIResponseError):
+                await retrier.call("pages.create", request)
+            # 熔断后不再发出请求
+            with self.assertRaises(CircuitOpenError):
+                await retrier.call("pages.create", request)
+            # 其他接口不受影响
+            with self.assertRaises(APIResponseError):
+                await retrier.call("databases.query", request)
+        asyncio.run(run())
+        self.assertEqual(len(calls), 4)
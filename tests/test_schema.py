@@ -0,0 +1,128 @@
+import unittest
+from douban.constants import MediaType
+from douban.notion_index import normalize_properties
+from douban.schema import BOOK_SCHEMA, MOVIE_SCHEMA, SCHEMAS, Field, Schema
+
+
+def make_book(**changes):
+    item = {
+        "status": "done",
+        "create_time": "2022-11-23 10:22:58",
+        "comment": "好书",
+        "tags": ["科幻"],
+        "rating": {"star_count": 4},
+        "subject": {
+            "title": "三体",
+            "url": "https://book.douban.com/subject/2567698/",
+            "cover_url": "https://img.example.com/view/subject/s/public/s2768378.jpg",
+            "rating": {"value": 8.8, "count": 1000},
+            "author": ["刘慈欣"],
+            "press": ["重庆出版社"],
+            "pubdate": ["2008-1"],
+            "pages": ["302"],
+            "isbn": "9787536692930",
+            "book_price": 23.0,
+        },
+    }
+    item.update(changes)
+    return item
+
+
+class TestSchema(unittest.TestCase):
+    def test_book_properties(self):
+        body = BOOK_SCHEMA.page_body("book-database", make_book())
+        self.assertEqual(body["parent"], {"type": "database_id", "database_id": "book-database"})
+        self.assertEqual(normalize_properties(body["properties"]), {
+            "书名": "三体",
+            "封面": ["https://img.example.com/view/subject/s/public/s2768378.jpg"],
+            "标记状态": "读过",
+            "个人评分": "⭐⭐⭐⭐",
+            "评分": 8.8,
+            "评分人数": 1000.0,
+            "短评": "好书",
+            "标记时间": "2022-11-23T10:22:58+08:00",
+            "豆瓣链接": "https://book.douban.com/subject/2567698/",
+            "作者": ["刘慈欣"],
+            "类型": ["科幻"],
+            "出版社": ["重庆出版社"],
+            "出版年份": "2008",
+            "ISBN": 9787536692930.0,
+            "价格": 23.0,
+            "页数": 302.0,
+        })
+        self.assertEqual(body["properties"]["封面"]["files"][0]["name"], "/s2768378.jpg")
+
+    def test_empty_values_are_omitted(self):
+        item = make_book(comment="", tags=[], rating=None)
+        item["subject"].update(rating=None, pubdate=[], isbn="")
+        properties = BOOK_SCHEMA.properties(item)
+        for name in ["短评", "类型", "个人评分", "评分", "评分人数", "ISBN"]:
+            self.assertNotIn(name, properties)
+        self.assertEqual(properties["出版年份"], {"select": {"name": "未知"}})
+
+    def test_diff_clears_removed_values(self):
+        snapshot = normalize_properties(BOOK_SCHEMA.properties(make_book()))
+        self.assertEqual(BOOK_SCHEMA.diff(BOOK_SCHEMA.properties(make_book()), snapshot), {})
+
+        changed = BOOK_SCHEMA.diff(BOOK_SCHEMA.properties(make_book(comment="", rating=None, status="doing")), snapshot)
+        self.assertEqual(changed, {
+            "短评": {"rich_text": []},
+            "个人评分": {"select": None},
+            "标记状态": {"select": {"name": "在读"}},
+        })
+
+    def test_compare_checks_every_field(self):
+        page = BOOK_SCHEMA.page_body("db", make_book())
+        self.assertTrue(BOOK_SCHEMA.compare(page, BOOK_SCHEMA.page_body("db", make_book())))
+        # 有个人评分时标签的修改也要被发现
+        self.assertFalse(BOOK_SCHEMA.compare(page, BOOK_SCHEMA.page_body("db", make_book(tags=["科幻", "经典"]))))
+        self.assertFalse(BOOK_SCHEMA.compare(page, BOOK_SCHEMA.page_body("db", make_book(comment="重读"))))
+
+        # Notion 返回的页面带有 type 字段，时间精确到毫秒
+        notion_page = {"properties": {name: {"id": "x", "type": next(iter(prop)), **prop}
+                                      for name, prop in page["properties"].items()}}
+        notion_page["properties"]["标记时间"]["date"]["start"] = "2022-11-23T10:22:58.000+08:00"
+        self.assertTrue(BOOK_SCHEMA.compare(page, notion_page))
+
+    def test_movie_tags_replace_genres(self):
+        item = make_book(tags=[])
+        item["subject"].update(genres=["剧情"], directors=[{"name": "A,B"}, {"name": ""}], movie_type=["剧情"],
+                               movie_categories="电影", imdb="tt0111161", movie_duration="142")
+        properties = normalize_properties(MOVIE_SCHEMA.properties(item))
+        self.assertEqual(properties["类型"], ["剧情"])
+        self.assertEqual(properties["导演"], ["AB"])
+        self.assertEqual(properties["分类"], "电影")
+        self.assertEqual(properties["IMDb"], "https://www.imdb.com/title/tt0111161")
+        self.assertEqual(properties["片长"], 142.0)
+        item["tags"] = ["经典"]
+        self.assertEqual(normalize_properties(MOVIE_SCHEMA.properties(item))["类型"], ["经典"])
+
+    def test_fingerprint(self):
+        values = BOOK_SCHEMA.values(make_book())
+        self.assertEqual(BOOK_SCHEMA.build(values), BOOK_SCHEMA.properties(make_book()))
+        fingerprint = BOOK_SCHEMA.fingerprint(values)
+        self.assertEqual(fingerprint, BOOK_SCHEMA.fingerprint(BOOK_SCHEMA.values(make_book())))
+        # 任意一个同步的字段变化都会改变指纹
+        for changes in [dict(tags=["科幻", "经典"]), dict(comment="重读"), dict(create_time="2022-11-24 10:22:58"),
+                        dict(rating=None)]:
+            self.assertNotEqual(fingerprint, BOOK_SCHEMA.fingerprint(BOOK_SCHEMA.values(make_book(**changes))))
+        # 原始值相同的不同类型条目指纹不同
+        self.assertNotEqual(fingerprint, MOVIE_SCHEMA.fingerprint(values))
+        self.assertEqual(BOOK_SCHEMA.fingerprint_property(fingerprint),
+                         {"同步指纹": {"rich_text": [{"type": "text", "text": {"content": fingerprint}}]}})
+
+    def test_database_body(self):
+        body = SCHEMAS[MediaType.MUSIC.value].database_body("page")
+        self.assertEqual(body["parent"], {"type": "page_id", "page_id": "page"})
+        self.assertEqual(body["properties"]["ISRC"], {"url": {}})
+        self.assertEqual(len(body["properties"]["个人评分"]["select"]["options"]), 5)
+        self.assertEqual(body["properties"]["同步指纹"], {"rich_text": {}})
+        # 只用于建库的字段不参与同步
+        self.assertNotIn("ISRC", SCHEMAS[MediaType.MUSIC.value].properties(make_book()))
+
+    def test_new_media_type(self):
+        schema = Schema("drama", "豆瓣舞台剧库", "🎭", [
+            Field("剧名", "title", lambda item: item["subject"]["title"]),
+            Field("豆瓣链接", "url", lambda item: item["subject"]["url"]),
+        ])
+        self.assertEqual(set(schema.properties(make_book())), {"剧名", "豆瓣链接"})
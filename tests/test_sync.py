@@ -34,8 +34,8 @@ class TestDoubanSync(unittest.TestCase):
                     if interest_type == "movie":
                         details = loop.run_until_complete(api.fetch_movie_detail(detail_url))
                         interest['subject'].update(details['subject'])
-                        movie_db.sync(interest)
+                        loop.run_until_complete(movie_db.sync(interest))
                     elif interest_type == "book":
                         details = loop.run_until_complete(api.fetch_book_detail(detail_url))
                         interest['subject'].update(details['subject'])
-                        book_db.sync(interest)
+                        loop.run_until_complete(book_db.sync(interest))
@@ -0,0 +1,353 @@
+import os
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from benchmarks.fake_servers import FakeDouban, FakeNotion, start_server
+from douban.metrics import Metrics
+from douban.rate_limit import UnlimitedRateLimiter
+from douban.sync import DoubanNotionSync
+
+
+class TestOfflineSync(unittest.TestCase):
+    """
+    使用本地模拟服务运行完整的同步流程
+    """
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(self.loop.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_dir = tmp.name
+
+    def start(self, *services):
+        for service in services:
+            runner, _ = self.loop.run_until_complete(start_server(service))
+            self.addCleanup(self.loop.run_until_complete, runner.cleanup())
+
+    def run_sync(self, douban, notion, metrics=None, **options):
+        sync = DoubanNotionSync(user_agent="test", cookie="", ck="test", uid="test", token="test",
+                                movie_database_id="movie-database",
+                                book_database_id="book-database",
+                                state_dir=self.state_dir,
+                                douban_rate_limiter=UnlimitedRateLimiter(),
+                                notion_rate_limiter=UnlimitedRateLimiter(),
+                                parse_executor="inline",
+                                douban_base_url=douban.base_url,
+                                notion_base_url=notion.base_url,
+                                metrics=metrics,
+                                **options)
+        try:
+            return self.loop.run_until_complete(sync.async_sync())
+        finally:
+            self.loop.run_until_complete(sync.close())
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_sync_end_to_end(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion(rate_limited=0.05, retry_after=0)
+        self.start(douban, notion)
+        metrics = Metrics()
+        self.run_sync(douban, notion, metrics)
+        self.assertEqual(len(notion.databases["movie-database"]), 30)
+        self.assertEqual(len(notion.databases["book-database"]), 30)
+        self.assertEqual(douban.stats["GET /{interest_type}/subject/{subject_id}/"], 60)
+        # 429 会被写入队列重试，不会产生重复页面
+        self.assertGreater(notion.stats["429"], 0)
+
+        summary = metrics.summary()
+        self.assertEqual(summary["items"], 60)
+        self.assertEqual(summary["counters"]["requests_total{endpoint=subject,status=200,upstream=douban}"], 60)
+        self.assertEqual(summary["histograms"]["request_seconds{endpoint=subject,upstream=douban}"]["count"], 60)
+        self.assertEqual(summary["counters"]["requests_total{endpoint=pages.create,status=200,upstream=notion}"], 60)
+        self.assertEqual(summary["counters"]["requests_total{endpoint=pages.create,status=429,upstream=notion}"],
+                         summary["counters"]["retries_total{endpoint=pages.create,upstream=notion}"])
+        self.assertEqual(summary["gauges"]["cache_hits"], 0)
+
+        # 第二次运行命中检查点和本地索引，不再访问详情页，也不写入 Notion
+        douban.stats.clear()
+        notion.stats.clear()
+        self.run_sync(douban, notion)
+        self.assertEqual(douban.stats["GET /{interest_type}/subject/{subject_id}/"], 0)
+        self.assertEqual(sum(notion.stats.values()), 0)
+        self.assertEqual(len(notion.databases["movie-database"]), 30)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_broken_item_is_isolated_and_skipped(self):
+        # 第7条属于 movie/done，是该列表的第2条，包含它的分页会一直返回 500
+        douban = FakeDouban(items=600, broken={7})
+        notion = FakeNotion()
+        self.start(douban, notion)
+        interests = "GET /rexxar/api/v2/user/{uid}/interests"
+        metrics = Metrics()
+        # 异常条目被跳过，分页仍视为完整，运行成功
+        self.assertTrue(self.run_sync(douban, notion, metrics))
+        self.assertEqual(len(notion.databases["movie-database"]) + len(notion.databases["book-database"]), 599)
+        # 二分拆分：6 个列表各 5 页，加上 [0,10) [10,20) [0,5) [5,10) [0,2) [2,5) [0,1) [1,2) 共 8 次
+        self.assertEqual(douban.stats[interests], 6 * 5 + 8)
+        self.assertEqual(metrics.summary()["counters"][
+            "skipped_items_total{interest_type=movie,status=done,upstream=douban}"], 1)
+
+        # 检查点越过了异常条目：第二次运行连续20个旧条目没有修改即停止，
+        # movie/done 第一页只有19个条目，多看一页
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(douban.stats[interests], 6 + 8 + 1)
+
+        # 异常条目恢复后，不在 Notion 中的旧条目会被补上
+        douban.broken.clear()
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(len(notion.databases["movie-database"]), 300)
+        self.assertEqual(douban.stats["GET /{interest_type}/subject/{subject_id}/"], 1)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_edits_to_old_items_are_detected(self):
+        douban = FakeDouban(items=600)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        interests = "GET /rexxar/api/v2/user/{uid}/interests"
+        self.assertTrue(self.run_sync(douban, notion))
+        # 第40条属于 book/done，是该列表的第7条，标记时间早于上次同步
+        douban.edit(40, rating={"star_count": 1, "value": 1, "max": 5})
+        douban.stats.clear()
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 1)
+        updated = [p for p in notion.databases["book-database"].values()
+                   if p["豆瓣链接"]["url"].endswith("/1000040/")]
+        self.assertEqual(updated[0]["个人评分"]["select"]["name"], "⭐")
+        # 连续20个旧条目没有修改即停止翻页：含修改条目的列表多看一页，其余列表只看一页
+        self.assertEqual(douban.stats[interests], 7)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_old_items_without_fingerprint(self):
+        douban = FakeDouban(items=600)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        self.assertTrue(self.run_sync(douban, notion))
+        # 模拟升级前的检查点：已同步的条目没有指纹
+        with sqlite3.connect(os.path.join(self.state_dir, "checkpoint.sqlite3")) as conn:
+            conn.execute("DELETE FROM fingerprints")
+
+        # 没有指纹的旧条目不同步，只记下指纹
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(sum(notion.stats.values()), 0)
+
+        # 第40条属于 book/done，之后的修改可以被发现
+        douban.edit(40, rating={"star_count": 1, "value": 1, "max": 5})
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 1)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_detail_properties_survive_edits(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion()
+        self.start(douban, notion)
+
+        def page(database, i):
+            return next(properties for properties in notion.databases[database].values()
+                        if properties["豆瓣链接"]["url"].endswith(f"/{1000000 + i}/"))
+
+        def detail_properties(database, i, names):
+            return {name: page(database, i).get(name) for name in names}
+
+        # 第40条属于 book/done，第43条属于 movie/done，只修改个人评分
+        book_names = ["ISBN", "价格", "页数"]
+        movie_names = ["分类", "编剧", "国家地区", "简介", "片长", "IMDb"]
+        self.assertTrue(self.run_sync(douban, notion))
+        book = detail_properties("book-database", 40, book_names)
+        movie = detail_properties("movie-database", 43, movie_names)
+        self.assertTrue(all(book.values()) and all(movie.values()))
+
+        for i in (40, 43):
+            douban.edit(i, rating={"star_count": 1, "value": 1, "max": 5})
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 2)
+        self.assertEqual(page("book-database", 40)["个人评分"]["select"]["name"], "⭐")
+        self.assertEqual(page("movie-database", 43)["个人评分"]["select"]["name"], "⭐")
+        self.assertEqual(detail_properties("book-database", 40, book_names), book)
+        self.assertEqual(detail_properties("movie-database", 43, movie_names), movie)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_unchanged_existing_items_skip_notion(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        self.assertTrue(self.run_sync(douban, notion))
+
+        # 删除检查点后所有条目都重新经过同步流程，指纹与创建时相同，不访问 Notion 也不请求详情页
+        os.remove(os.path.join(self.state_dir, "checkpoint.sqlite3"))
+        douban.stats.clear()
+        notion.stats.clear()
+        metrics = Metrics()
+        self.assertTrue(self.run_sync(douban, notion, metrics))
+        self.assertEqual(metrics.summary()["items"], 60)
+        self.assertEqual(sum(notion.stats.values()), 0)
+        self.assertEqual(douban.stats["GET /{interest_type}/subject/{subject_id}/"], 0)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_deleted_page_is_recreated_with_details(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        self.assertTrue(self.run_sync(douban, notion))
+
+        # 在 Notion 中删除第40条（book/done）的页面，然后修改评分
+        pages = notion.databases["book-database"]
+        page_id = next(page_id for page_id, properties in pages.items()
+                       if properties["豆瓣链接"]["url"].endswith("/1000040/"))
+        deleted = pages.pop(page_id)
+        del notion.page_database[page_id]
+        douban.edit(40, rating={"star_count": 1, "value": 1, "max": 5})
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion))
+        self.assertEqual(notion.stats["POST /v1/pages"], 1)
+
+        recreated = next(properties for properties in pages.values()
+                         if properties["豆瓣链接"]["url"].endswith("/1000040/"))
+        self.assertEqual(recreated["个人评分"]["select"]["name"], "⭐")
+        for name in ["ISBN", "价格", "页数"]:
+            self.assertEqual(recreated[name], deleted[name])
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_contents_are_appended_incrementally(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        contents = ("annotations", "reviews", "timeline")
+        timeline = "GET /rexxar/api/v2/status/user_timeline/{uid}"
+        reviews = "GET /rexxar/api/v2/user/{uid}/reviews"
+
+        def blocks():
+            return sum(len(children) for children in notion.blocks.values())
+
+        # 第3、4、5条是书籍
+        for i in (3, 4, 5):
+            douban.post("annotations", i)
+        for i in range(25):
+            douban.post("reviews", i)
+        for i in range(30):
+            douban.post("timeline", i)
+        self.assertTrue(self.run_sync(douban, notion, contents=contents))
+        # 每条内容为标题、时间、正文和分隔线四个块
+        self.assertEqual(blocks(), 4 * (3 + 25 + 30))
+        # 广播没有总数，取到空页才知道已经结束
+        self.assertEqual(douban.stats[timeline], 3)
+        book_page = next(page_id for page_id, properties in notion.databases["book-database"].items()
+                         if properties["豆瓣链接"]["url"].endswith("/1000003/"))
+        headings = [block["heading_3"]["rich_text"][0]["text"]["content"]
+                    for block in notion.blocks[book_page] if block["type"] == "heading_3"]
+        # 同一页面的内容按时间从旧到新追加
+        self.assertEqual(headings, ["读书笔记：笔记 1", "评论：评论 7", "广播：book-1000003"])
+
+        # 没有新内容时每个列表只请求第一页，不追加任何块
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, contents=contents))
+        self.assertEqual(blocks(), 4 * 58)
+        self.assertEqual(douban.stats[timeline], 1)
+        self.assertEqual(douban.stats[reviews], 2)
+
+        # 只追加新发表的内容
+        douban.post("reviews", 10, text="新评论")
+        douban.post("timeline", 11)
+        self.assertTrue(self.run_sync(douban, notion, contents=contents))
+        self.assertEqual(blocks(), 4 * 60)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_unrelated_statuses_do_not_page_the_timeline(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        timeline = "GET /rexxar/api/v2/status/user_timeline/{uid}"
+        douban.post("timeline", 3)
+        for _ in range(50):
+            douban.post_status()
+        self.assertTrue(self.run_sync(douban, notion, contents=("timeline",)))
+
+        # 与书影条目无关的广播也推进检查点：没有新广播时只请求第一页
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, contents=("timeline",)))
+        self.assertEqual(douban.stats[timeline], 1)
+
+        # 50条新的无关广播：前两页全部是新的，第三页中出现上次的位置后停止
+        for _ in range(50):
+            douban.post_status()
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, contents=("timeline",)))
+        self.assertEqual(douban.stats[timeline], 3)
+        self.assertEqual(sum(len(children) for children in notion.blocks.values()), 4)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_change_feed_with_unrelated_statuses(self):
+        douban = FakeDouban(items=60)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        interests = "GET /rexxar/api/v2/user/{uid}/interests"
+        timeline = "GET /rexxar/api/v2/status/user_timeline/{uid}"
+        for _ in range(150):
+            douban.post_status()
+        # 完整扫描前只读取第一页广播作为游标
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertEqual(douban.stats[timeline], 1)
+
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertEqual(douban.stats[timeline], 1)
+        self.assertEqual(douban.stats[interests], 0)
+
+        # 新的无关广播之后的标记广播仍然会被读到
+        douban.edit(40, rating={"star_count": 1, "value": 1, "max": 5})
+        douban.post("timeline", 40)
+        for _ in range(30):
+            douban.post_status()
+        douban.stats.clear()
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertEqual(douban.stats[timeline], 2)
+        self.assertEqual(douban.stats[interests], 1)
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 1)
+
+    @mock.patch.dict(os.environ, {"LAST_SYNC_TIME": "2000-01-01T00:00:00"})
+    def test_change_feed(self):
+        douban = FakeDouban(items=600)
+        notion = FakeNotion()
+        self.start(douban, notion)
+        interests = "GET /rexxar/api/v2/user/{uid}/interests"
+        timeline = "GET /rexxar/api/v2/status/user_timeline/{uid}"
+        douban.post("timeline", 0)
+        # 没有广播游标时完整扫描，并记下最新的广播
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertGreater(douban.stats[interests], 6)
+        self.assertEqual(douban.stats[timeline], 1)
+
+        # 没有新广播时只请求一次广播
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertEqual(douban.stats[timeline], 1)
+        self.assertEqual(douban.stats[interests], 0)
+
+        # 第40条属于 book/done，修改评分并发了广播：一次广播请求加一次列表请求
+        douban.edit(40, rating={"star_count": 1, "value": 1, "max": 5})
+        douban.post("timeline", 40)
+        douban.stats.clear()
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertEqual(douban.stats[timeline], 1)
+        self.assertEqual(douban.stats[interests], 1)
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 1)
+
+        # 没有发广播的修改由定期的完整扫描补上
+        douban.edit(46, rating={"star_count": 1, "value": 1, "max": 5})
+        notion.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True))
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 0)
+        douban.stats.clear()
+        self.assertTrue(self.run_sync(douban, notion, change_feed=True, reconcile_interval=0))
+        self.assertGreaterEqual(douban.stats[interests], 6)
+        self.assertEqual(notion.stats["PATCH /v1/pages/{page_id}"], 1)